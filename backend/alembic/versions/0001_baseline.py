@@ -0,0 +1,161 @@
+"""基线版本
+
+创建引入迁移之前已有的业务表：users、projects、canvases、agent_configs、tools、
+knowledge_bases、knowledge_sources、workflow_runs。
+已存在的表跳过（此前由 create_all 建表的数据库可直接执行 alembic upgrade head）。
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+"""
+
+from alembic import context, op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+TABLES = [
+    "users", "projects", "canvases", "agent_configs", "tools",
+    "knowledge_bases", "knowledge_sources", "workflow_runs",
+]
+
+def _timestamps(updated: bool = True) -> list:
+    columns = [sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now())]
+    if updated:
+        columns.append(sa.Column("updated_at", sa.DateTime(timezone=True)))
+    return columns
+
+def _existing() -> set:
+    if context.is_offline_mode():
+        return set()
+    return set(sa.inspect(op.get_bind()).get_table_names())
+
+def upgrade():
+    existing = _existing()
+    
+    if "users" not in existing:
+        op.create_table(
+            "users",
+            sa.Column("id", sa.String(), primary_key=True),
+            sa.Column("username", sa.String(50), nullable=False),
+            sa.Column("email", sa.String(100), nullable=False),
+            sa.Column("hashed_password", sa.String(255), nullable=False),
+            sa.Column("full_name", sa.String(100)),
+            sa.Column("is_active", sa.Boolean()),
+            sa.Column("is_superuser", sa.Boolean()),
+            *_timestamps(),
+        )
+        op.create_index("ix_users_username", "users", ["username"], unique=True)
+        op.create_index("ix_users_email", "users", ["email"], unique=True)
+    
+    if "projects" not in existing:
+        op.create_table(
+            "projects",
+            sa.Column("id", sa.String(), primary_key=True),
+            sa.Column("name", sa.String(100), nullable=False),
+            sa.Column("description", sa.Text()),
+            sa.Column("owner_id", sa.String(), sa.ForeignKey("users.id"), nullable=False),
+            sa.Column("settings", sa.JSON()),
+            sa.Column("is_active", sa.Boolean()),
+            *_timestamps(),
+        )
+    
+    if "canvases" not in existing:
+        op.create_table(
+            "canvases",
+            sa.Column("id", sa.String(), primary_key=True),
+            sa.Column("project_id", sa.String(), sa.ForeignKey("projects.id"), nullable=False),
+            sa.Column("name", sa.String(100), nullable=False),
+            sa.Column("description", sa.Text()),
+            sa.Column("canvas_data", sa.JSON()),
+            sa.Column("version", sa.Integer()),
+            sa.Column("is_active", sa.Boolean()),
+            *_timestamps(),
+        )
+    
+    if "agent_configs" not in existing:
+        op.create_table(
+            "agent_configs",
+            sa.Column("id", sa.String(), primary_key=True),
+            sa.Column("name", sa.String(100), nullable=False),
+            sa.Column("agent_type", sa.String(50), nullable=False),
+            sa.Column("role", sa.String(100)),
+            sa.Column("backstory", sa.Text()),
+            sa.Column("goal", sa.Text()),
+            sa.Column("tools", sa.JSON()),
+            sa.Column("llm_config", sa.JSON()),
+            sa.Column("memory_config", sa.JSON()),
+            sa.Column("max_execution_time", sa.Integer()),
+            sa.Column("max_iterations", sa.Integer()),
+            sa.Column("is_active", sa.Boolean()),
+            *_timestamps(),
+        )
+    
+    if "tools" not in existing:
+        op.create_table(
+            "tools",
+            sa.Column("id", sa.String(), primary_key=True),
+            sa.Column("name", sa.String(100), nullable=False, unique=True),
+            sa.Column("description", sa.Text()),
+            sa.Column("tool_type", sa.String(50), nullable=False),
+            sa.Column("config", sa.JSON()),
+            sa.Column("schema", sa.JSON()),
+            sa.Column("is_active", sa.Boolean()),
+            *_timestamps(updated=False),
+        )
+    
+    if "knowledge_bases" not in existing:
+        op.create_table(
+            "knowledge_bases",
+            sa.Column("id", sa.String(), primary_key=True),
+            sa.Column("name", sa.String(100), nullable=False),
+            sa.Column("description", sa.Text()),
+            sa.Column("owner_id", sa.String(), sa.ForeignKey("users.id"), nullable=False),
+            sa.Column("collection_name", sa.String(100)),
+            sa.Column("embedding_model", sa.String(100)),
+            sa.Column("chunk_size", sa.Integer()),
+            sa.Column("chunk_overlap", sa.Integer()),
+            sa.Column("is_active", sa.Boolean()),
+            *_timestamps(),
+        )
+    
+    if "knowledge_sources" not in existing:
+        op.create_table(
+            "knowledge_sources",
+            sa.Column("id", sa.String(), primary_key=True),
+            sa.Column("knowledge_base_id", sa.String(), sa.ForeignKey("knowledge_bases.id"), nullable=False),
+            sa.Column("name", sa.String(255), nullable=False),
+            sa.Column("source_type", sa.String(50), nullable=False),
+            sa.Column("file_path", sa.String(500)),
+            sa.Column("url", sa.String(500)),
+            sa.Column("content", sa.Text()),
+            sa.Column("metadata", sa.JSON()),
+            sa.Column("processing_status", sa.String(50)),
+            sa.Column("chunk_count", sa.Integer()),
+            sa.Column("file_size", sa.Integer()),
+            *_timestamps(),
+        )
+    
+    if "workflow_runs" not in existing:
+        op.create_table(
+            "workflow_runs",
+            sa.Column("id", sa.String(), primary_key=True),
+            sa.Column("project_id", sa.String(), sa.ForeignKey("projects.id"), nullable=False),
+            sa.Column("canvas_id", sa.String(), sa.ForeignKey("canvases.id"), nullable=False),
+            sa.Column("status", sa.String(50)),
+            sa.Column("input_data", sa.JSON()),
+            sa.Column("output_data", sa.JSON()),
+            sa.Column("execution_log", sa.JSON()),
+            sa.Column("error_message", sa.Text()),
+            sa.Column("started_at", sa.DateTime(timezone=True)),
+            sa.Column("completed_at", sa.DateTime(timezone=True)),
+            sa.Column("execution_time", sa.Float()),
+            *_timestamps(updated=False),
+        )
+
+def downgrade():
+    for table in reversed(TABLES):
+        op.drop_table(table)
@@ -0,0 +1,57 @@
+"""热点过滤条件的索引
+
+列表查询按所有者或父对象过滤、排除软删除行，并按 (created_at, id) 倒序分页：
+- 带 is_active 条件的列表使用部分索引，只索引未删除的行；
+- knowledge_sources 按知识库加载，workflow_runs 按画布倒序查询。
+PostgreSQL 上使用 CREATE INDEX CONCURRENTLY，不阻塞线上写入。
+已存在的索引跳过（由 create_all 按模型建表的数据库已包含这些索引）。
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+"""
+
+from alembic import context, op
+import sqlalchemy as sa
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+NEWEST_FIRST = (sa.text("created_at DESC"), sa.text("id DESC"))
+ACTIVE = sa.text("is_active = true")
+SQLITE_ACTIVE = sa.text("is_active = 1")
+
+# (索引名, 表名, 列, 是否只包含未删除行)
+INDEXES = [
+    ("ix_projects_owner_active", "projects", ("owner_id", *NEWEST_FIRST), True),
+    ("ix_canvases_project_active", "canvases", ("project_id", *NEWEST_FIRST), True),
+    ("ix_agent_configs_active", "agent_configs", NEWEST_FIRST, True),
+    ("ix_tools_active", "tools", NEWEST_FIRST, True),
+    ("ix_knowledge_bases_owner_active", "knowledge_bases", ("owner_id", *NEWEST_FIRST), True),
+    ("ix_knowledge_sources_kb_created", "knowledge_sources", ("knowledge_base_id", "created_at"), False),
+    ("ix_workflow_runs_canvas_created", "workflow_runs", ("canvas_id", *NEWEST_FIRST), False),
+]
+
+def _existing(table: str) -> set:
+    if context.is_offline_mode():
+        return set()
+    return {index["name"] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns, active_only in INDEXES:
+            if name in _existing(table):
+                continue
+            options = {"postgresql_concurrently": True}
+            if active_only:
+                # SQLite 只在查询条件与索引条件字面一致时使用部分索引，与 ORM 生成的 is_active = 1 保持一致
+                options.update(postgresql_where=ACTIVE, sqlite_where=SQLITE_ACTIVE)
+            op.create_index(name, table, list(columns), **options)
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(INDEXES):
+            if name in _existing(table):
+                op.drop_index(name, table_name=table, postgresql_concurrently=True)
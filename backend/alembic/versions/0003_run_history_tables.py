@@ -0,0 +1,102 @@
+"""版本历史、对话记忆与执行记录表
+
+新增 canvas_versions、agent_memory_turns、agent_memory_sessions、
+workflow_run_events、workflow_checkpoints。已存在的表跳过。
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+"""
+
+from alembic import context, op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+TABLES = [
+    "canvas_versions", "agent_memory_turns", "agent_memory_sessions",
+    "workflow_run_events", "workflow_checkpoints",
+]
+
+def _existing() -> set:
+    if context.is_offline_mode():
+        return set()
+    return set(sa.inspect(op.get_bind()).get_table_names())
+
+def upgrade():
+    existing = _existing()
+    
+    if "canvas_versions" not in existing:
+        op.create_table(
+            "canvas_versions",
+            sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column("canvas_id", sa.String(), sa.ForeignKey("canvases.id"), nullable=False),
+            sa.Column("version", sa.Integer(), nullable=False),
+            sa.Column("kind", sa.String(20), nullable=False),
+            sa.Column("data", sa.JSON()),
+            sa.Column("size", sa.Integer()),
+            sa.Column("created_by", sa.String(), sa.ForeignKey("users.id")),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.UniqueConstraint("canvas_id", "version", name="uq_canvas_version"),
+        )
+    
+    if "agent_memory_turns" not in existing:
+        op.create_table(
+            "agent_memory_turns",
+            sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column("agent_id", sa.String(100), nullable=False),
+            sa.Column("session_id", sa.String(100), nullable=False),
+            sa.Column("role", sa.String(20), nullable=False),
+            sa.Column("content", sa.Text(), nullable=False),
+            sa.Column("token_count", sa.Integer()),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+        op.create_index(
+            "ix_agent_memory_turns_agent_session", "agent_memory_turns", ["agent_id", "session_id", "id"]
+        )
+    
+    if "agent_memory_sessions" not in existing:
+        op.create_table(
+            "agent_memory_sessions",
+            sa.Column("id", sa.String(), primary_key=True),
+            sa.Column("agent_id", sa.String(100), nullable=False),
+            sa.Column("session_id", sa.String(100), nullable=False),
+            sa.Column("summary", sa.Text()),
+            sa.Column("summarized_until", sa.Integer()),
+            sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.UniqueConstraint("agent_id", "session_id", name="uq_agent_memory_session"),
+        )
+    
+    if "workflow_run_events" not in existing:
+        op.create_table(
+            "workflow_run_events",
+            sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column("run_id", sa.String(), sa.ForeignKey("workflow_runs.id"), nullable=False),
+            sa.Column("event_type", sa.String(50), nullable=False),
+            sa.Column("node_id", sa.String()),
+            sa.Column("payload", sa.JSON()),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+        op.create_index("ix_workflow_run_events_run_id", "workflow_run_events", ["run_id"])
+    
+    if "workflow_checkpoints" not in existing:
+        op.create_table(
+            "workflow_checkpoints",
+            sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column("run_id", sa.String(), sa.ForeignKey("workflow_runs.id"), nullable=False),
+            sa.Column("node_id", sa.String(), nullable=False),
+            sa.Column("status", sa.String(50), nullable=False),
+            sa.Column("output", sa.JSON()),
+            sa.Column("error_message", sa.Text()),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column("updated_at", sa.DateTime(timezone=True)),
+            sa.UniqueConstraint("run_id", "node_id", name="uq_workflow_checkpoint_run_node"),
+        )
+        op.create_index("ix_workflow_checkpoints_run_id", "workflow_checkpoints", ["run_id"])
+
+def downgrade():
+    for table in reversed(TABLES):
+        op.drop_table(table)
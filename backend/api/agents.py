@@ -2,21 +2,26 @@
 Agent 管理 API 路由
 """
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 
-from database import get_db
-from models import AgentConfig, Tool, User
+from database import get_async_db
+from models import AgentConfig, Tool
+from services.auth_cache import UserPrincipal
 from .auth import get_current_user
+from .schemas import AgentCreated, AgentDetail, AgentSummary, MessageResponse, ToolCreated, ToolSummary
+from .pagination import keyset_page, list_response
+from services.tool_registry import tool_registry
 
 router = APIRouter()
 
-@router.post("/configs")
+@router.post("/configs", response_model=AgentCreated)
 async def create_agent_config(
     agent_data: dict,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """创建 Agent 配置"""
     new_agent = AgentConfig(
@@ -33,8 +38,8 @@ async def create_agent_config(
     )
     
     db.add(new_agent)
-    db.commit()
-    db.refresh(new_agent)
+    await db.commit()
+    await db.refresh(new_agent)
     
     return {
         "id": new_agent.id,
@@ -43,39 +48,44 @@ async def create_agent_config(
         "created_at": new_agent.created_at
     }
 
-@router.get("/configs")
+@router.get("/configs", response_model=List[AgentSummary])
 async def get_agent_configs(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    after: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    if_none_match: Optional[str] = Header(None),
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """获取 Agent 配置列表"""
-    agents = db.query(AgentConfig).filter(
-        AgentConfig.is_active == True
-    ).all()
+    """获取 Agent 配置列表（只查询列表所需的列）"""
+    query, limit = await keyset_page(
+        db, select(
+            AgentConfig.id, AgentConfig.name, AgentConfig.agent_type,
+            AgentConfig.role, AgentConfig.goal, AgentConfig.created_at
+        ).where(AgentConfig.is_active == True),
+        AgentConfig, after, limit
+    )
+    rows = (await db.execute(query)).all()
     
-    return [
-        {
-            "id": agent.id,
-            "name": agent.name,
-            "agent_type": agent.agent_type,
-            "role": agent.role,
-            "goal": agent.goal,
-            "created_at": agent.created_at
-        }
-        for agent in agents
-    ]
+    return list_response(rows, limit, lambda agent: {
+        "id": agent.id,
+        "name": agent.name,
+        "agent_type": agent.agent_type,
+        "role": agent.role,
+        "goal": agent.goal,
+        "created_at": agent.created_at
+    }, if_none_match)
 
-@router.get("/configs/{agent_id}")
+@router.get("/configs/{agent_id}", response_model=AgentDetail)
 async def get_agent_config(
     agent_id: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取 Agent 配置详情"""
-    agent = db.query(AgentConfig).filter(
+    agent = await db.scalar(select(AgentConfig).where(
         AgentConfig.id == agent_id,
         AgentConfig.is_active == True
-    ).first()
+    ))
     
     if not agent:
         raise HTTPException(status_code=404, detail="Agent 配置不存在")
@@ -96,18 +106,18 @@ async def get_agent_config(
         "updated_at": agent.updated_at
     }
 
-@router.put("/configs/{agent_id}")
+@router.put("/configs/{agent_id}", response_model=MessageResponse)
 async def update_agent_config(
     agent_id: str,
     agent_data: dict,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """更新 Agent 配置"""
-    agent = db.query(AgentConfig).filter(
+    agent = await db.scalar(select(AgentConfig).where(
         AgentConfig.id == agent_id,
         AgentConfig.is_active == True
-    ).first()
+    ))
     
     if not agent:
         raise HTTPException(status_code=404, detail="Agent 配置不存在")
@@ -118,37 +128,53 @@ async def update_agent_config(
         if field in agent_data:
             setattr(agent, field, agent_data[field])
     
-    db.commit()
-    db.refresh(agent)
+    await db.commit()
+    await db.refresh(agent)
     
     return {"message": "Agent 配置更新成功"}
 
-@router.get("/tools")
+@router.get("/tools", response_model=List[ToolSummary])
 async def get_tools(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    after: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    if_none_match: Optional[str] = Header(None),
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """获取可用工具列表"""
-    tools = db.query(Tool).filter(Tool.is_active == True).all()
+    """获取可用工具列表（不读取工具配置）"""
+    query, limit = await keyset_page(
+        db, select(Tool.id, Tool.name, Tool.description, Tool.tool_type, Tool.schema).where(Tool.is_active == True),
+        Tool, after, limit
+    )
+    rows = (await db.execute(query)).all()
     
-    return [
-        {
-            "id": tool.id,
-            "name": tool.name,
-            "description": tool.description,
-            "tool_type": tool.tool_type,
-            "schema": tool.schema
-        }
-        for tool in tools
-    ]
+    return list_response(rows, limit, lambda tool: {
+        "id": tool.id,
+        "name": tool.name,
+        "description": tool.description,
+        "tool_type": tool.tool_type,
+        "schema": tool.schema
+    }, if_none_match)
+
+@router.get("/tools/metrics")
+async def get_tool_metrics(current_user: UserPrincipal = Depends(get_current_user)):
+    """获取各工具的调用延迟、错误率和排队时间"""
+    return tool_registry.metrics()
 
-@router.post("/tools")
+@router.post("/tools", response_model=ToolCreated)
 async def create_tool(
     tool_data: dict,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """创建工具"""
+    """创建工具（仅管理员）；注册后的工具对所有用户可用"""
+    if not current_user.is_superuser:
+        raise HTTPException(status_code=403, detail="权限不足")
+    
+    pool_size = (tool_data.get("config") or {}).get("pool_size", 1)
+    if not isinstance(pool_size, int) or isinstance(pool_size, bool) or pool_size < 1:
+        raise HTTPException(status_code=400, detail="pool_size 必须是不小于 1 的整数")
+    
     new_tool = Tool(
         name=tool_data["name"],
         description=tool_data.get("description", ""),
@@ -158,8 +184,11 @@ async def create_tool(
     )
     
     db.add(new_tool)
-    db.commit()
-    db.refresh(new_tool)
+    await db.commit()
+    await db.refresh(new_tool)
+    
+    # 注册到工具注册表，无需重启即可使用
+    tool_registry.register(new_tool)
     
     return {
         "id": new_tool.id,
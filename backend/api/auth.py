@@ -6,30 +6,43 @@
 from datetime import timedelta
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from passlib.context import CryptContext
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from jose import JWTError, jwt
 from datetime import datetime
 
-from database import get_db
+from database import get_async_db
 from models import User
 from config import settings
+from services.auth_cache import UserPrincipal, principal_cache
+from services.password_hasher import PasswordHasherBusy, password_hasher
+from .schemas import RegisterResponse, TokenResponse, UserProfile, UserStatusResponse
 
 router = APIRouter()
 
-# 密码加密
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-def verify_password(plain_password, hashed_password):
-    """验证密码"""
-    return pwd_context.verify(plain_password, hashed_password)
+def _hasher_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="服务繁忙，请稍后重试",
+        headers={"Retry-After": "1"},
+    )
 
-def get_password_hash(password):
+async def verify_password(plain_password, hashed_password):
+    """验证密码，返回 (是否匹配, 需要更新时的新哈希)"""
+    try:
+        return await password_hasher.verify(plain_password, hashed_password)
+    except PasswordHasherBusy:
+        raise _hasher_busy()
+
+async def get_password_hash(password):
     """生成密码哈希"""
-    return pwd_context.hash(password)
+    try:
+        return await password_hasher.hash(password)
+    except PasswordHasherBusy:
+        raise _hasher_busy()
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     """创建访问令牌"""
@@ -42,14 +55,14 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
-@router.post("/register")
-async def register(user_data: dict, db: Session = Depends(get_db)):
+@router.post("/register", response_model=RegisterResponse)
+async def register(user_data: dict, db: AsyncSession = Depends(get_async_db)):
     """用户注册"""
     # 检查用户名是否已存在
-    existing_user = db.query(User).filter(
+    existing_user = await db.scalar(select(User).where(
         (User.username == user_data["username"]) | 
         (User.email == user_data["email"])
-    ).first()
+    ))
     
     if existing_user:
         raise HTTPException(
@@ -58,7 +71,7 @@ async def register(user_data: dict, db: Session = Depends(get_db)):
         )
     
     # 创建新用户
-    hashed_password = get_password_hash(user_data["password"])
+    hashed_password = await get_password_hash(user_data["password"])
     new_user = User(
         username=user_data["username"],
         email=user_data["email"],
@@ -67,8 +80,8 @@ async def register(user_data: dict, db: Session = Depends(get_db)):
     )
     
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     
     return {
         "message": "用户注册成功",
@@ -76,12 +89,13 @@ async def register(user_data: dict, db: Session = Depends(get_db)):
         "username": new_user.username
     }
 
-@router.post("/token")
-async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+@router.post("/token", response_model=TokenResponse)
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
     """用户登录"""
-    user = db.query(User).filter(User.username == form_data.username).first()
+    user = await db.scalar(select(User).where(User.username == form_data.username))
     
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    verified, new_hash = await verify_password(form_data.password, user.hashed_password) if user else (False, None)
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="用户名或密码错误",
@@ -94,9 +108,16 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session =
             detail="用户账户已被禁用"
         )
     
+    # 哈希参数变化后，用本次登录的明文重新哈希
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
+    
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    # 声明中带上用户 ID 和状态，认证时可直接命中身份缓存
     access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data={"sub": user.username, "uid": user.id, "active": user.is_active},
+        expires_delta=access_token_expires
     )
     
     return {
@@ -110,13 +131,22 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session =
         }
     }
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    """获取当前用户"""
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
+    """获取当前用户
+
+    先按 (用户 ID, 令牌) 查身份缓存，未命中时才查询数据库并写入缓存。
+    返回 UserPrincipal 快照而不是 ORM 对象。
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="无法验证凭据",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    inactive_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="用户账户已被禁用",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
     
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
@@ -126,14 +156,31 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     except JWTError:
         raise credentials_exception
     
-    user = db.query(User).filter(User.username == username).first()
-    if user is None:
+    if payload.get("active") is False:
+        raise inactive_exception
+    
+    user_id = payload.get("uid")
+    if user_id:
+        principal = await principal_cache.get(user_id, token)
+        if principal is not None:
+            return principal
+        user = await db.get(User, user_id)
+    else:
+        # 旧格式令牌没有 uid，按用户名查询且不缓存
+        user = await db.scalar(select(User).where(User.username == username))
+    
+    if user is None or user.username != username:
         raise credentials_exception
+    if not user.is_active:
+        raise inactive_exception
     
-    return user
+    principal = UserPrincipal.from_user(user)
+    if user_id:
+        await principal_cache.set(token, principal, payload.get("exp"))
+    return principal
 
-@router.get("/me")
-async def get_user_info(current_user: User = Depends(get_current_user)):
+@router.get("/me", response_model=UserProfile)
+async def get_user_info(current_user: UserPrincipal = Depends(get_current_user)):
     """获取当前用户信息"""
     return {
         "id": current_user.id,
@@ -143,3 +190,24 @@ async def get_user_info(current_user: User = Depends(get_current_user)):
         "is_active": current_user.is_active,
         "created_at": current_user.created_at
     }
+
+@router.put("/users/{user_id}/status", response_model=UserStatusResponse)
+async def set_user_status(
+    user_id: str,
+    status_data: dict,
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """启用或停用用户（仅管理员），并清除该用户的身份缓存"""
+    if not current_user.is_superuser:
+        raise HTTPException(status_code=403, detail="权限不足")
+    
+    user = await db.get(User, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="用户不存在")
+    
+    user.is_active = bool(status_data["is_active"])
+    await db.commit()
+    await principal_cache.invalidate(user_id)
+    
+    return {"message": "用户状态已更新", "user_id": user_id, "is_active": user.is_active}
@@ -2,27 +2,115 @@
 画布管理 API 路由
 """
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+import asyncio
 
-from database import get_db
-from models import Canvas, Project, User
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, WebSocket, WebSocketDisconnect
+from typing import Any, Dict, List, Optional
+from sqlalchemy import inspect, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import undefer
+
+from config import settings
+from database import AsyncSessionLocal, get_async_db
+from models import Canvas, Project
+from services.auth_cache import UserPrincipal
 from .auth import get_current_user
+from .schemas import (
+    CanvasCreated, CanvasDetail, CanvasDiff, CanvasSaved, CanvasSummary, CanvasUpdated,
+    CanvasVersionData, CanvasVersionList, MessageResponse
+)
+from .responses import StreamingJSONResponse
+from .pagination import etag_headers, keyset_page, list_response, not_modified, version_etag
+from services.workflow_cache import workflow_cache
+from services.canvas_patch import PatchError, apply_patch, diff_documents
+from services.canvas_history import (
+    VersionCompactedError, list_versions, load_version, record_version, write_canvas_data
+)
+from services.canvas_collab import collab_manager
+from services.websocket_manager import connection_manager, execution_channel
 
 router = APIRouter()
 
-@router.post("/")
+def _version_conflict(current_version: int = None) -> HTTPException:
+    if current_version is None:
+        return HTTPException(status_code=409, detail="画布已被修改，请重新加载")
+    return HTTPException(status_code=409, detail=f"画布已被修改（当前版本 {current_version}），请重新加载")
+
+async def _write_canvas_data(
+    db: AsyncSession,
+    canvas: Canvas,
+    new_data: Any,
+    user_id: str,
+    patch: List[Dict] = None,
+    fields: Dict[str, Any] = None
+):
+    """以 canvas.version 为基准条件更新画布数据（及 fields 中的其他列），记录新版本并提交
+    
+    读取之后若有其他请求先提交，版本不再匹配，返回 409 而不是覆盖对方的修改。
+    """
+    saved = await write_canvas_data(
+        db, canvas.id, canvas.version, new_data,
+        previous=canvas.canvas_data, patch=patch, user_id=user_id, fields=fields
+    )
+    if saved is None:
+        await db.rollback()
+        raise _version_conflict()
+    await db.commit()
+    
+    # 画布已变更，丢弃旧版本的编译缓存，并通知正在协同编辑的参与者
+    workflow_cache.invalidate(canvas.id)
+    await collab_manager.external_update(canvas.id, saved.version, new_data)
+    return saved
+
+async def _get_owned_canvas(db: AsyncSession, canvas_id: str, user_id: str, with_data: bool = False) -> Canvas:
+    """读取当前用户的画布；canvas_data 延迟加载，需要时传 with_data=True"""
+    query = select(Canvas).join(Project).where(
+        Canvas.id == canvas_id,
+        Project.owner_id == user_id
+    )
+    if with_data:
+        query = query.options(undefer(Canvas.canvas_data))
+    canvas = await db.scalar(query)
+    if not canvas:
+        raise HTTPException(status_code=404, detail="画布不存在或无权限")
+    return canvas
+
+async def _load_version_data(db: AsyncSession, canvas: Canvas, version: int) -> Any:
+    """读取指定版本的数据；当前版本直接读取 canvas_data（未加载时只查这一列），历史版本从快照和补丁重建"""
+    if version == canvas.version:
+        if "canvas_data" not in inspect(canvas).unloaded:
+            return canvas.canvas_data
+        current = (await db.execute(
+            select(Canvas.canvas_data).where(Canvas.id == canvas.id, Canvas.version == version)
+        )).first()
+        if current is not None:
+            return current.canvas_data
+        # 读取之后画布已被修改，该版本已进入历史记录
+    if version < 1 or version > canvas.version:
+        raise HTTPException(status_code=404, detail="版本不存在")
+    try:
+        data = await load_version(db, canvas.id, version)
+    except VersionCompactedError:
+        raise HTTPException(
+            status_code=410,
+            detail=f"版本 {version} 已按保留策略压缩：超过 {settings.CANVAS_HISTORY_RETENTION_DAYS} 天的历史只保留快照版本"
+        )
+    if data is None:
+        raise HTTPException(status_code=404, detail="版本不存在")
+    return data
+
+@router.post("/", response_model=CanvasCreated)
 async def create_canvas(
     canvas_data: dict,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """创建画布"""
     # 验证项目权限
-    project = db.query(Project).filter(
+    project = await db.scalar(select(Project).where(
         Project.id == canvas_data["project_id"],
         Project.owner_id == current_user.id
-    ).first()
+    ))
     
     if not project:
         raise HTTPException(status_code=404, detail="项目不存在或无权限")
@@ -35,8 +123,10 @@ async def create_canvas(
     )
     
     db.add(new_canvas)
-    db.commit()
-    db.refresh(new_canvas)
+    await db.flush()
+    await record_version(db, new_canvas.id, 1, new_canvas.canvas_data, user_id=current_user.id)
+    await db.commit()
+    await db.refresh(new_canvas)
     
     return {
         "id": new_canvas.id,
@@ -45,55 +135,69 @@ async def create_canvas(
         "created_at": new_canvas.created_at
     }
 
-@router.get("/project/{project_id}")
+@router.get("/project/{project_id}", response_model=List[CanvasSummary])
 async def get_project_canvases(
     project_id: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    after: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    if_none_match: Optional[str] = Header(None),
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """获取项目下的画布列表"""
+    """获取项目下的画布列表（只查询列表所需的列，不读取 canvas_data）"""
     # 验证项目权限
-    project = db.query(Project).filter(
+    project_id = await db.scalar(select(Project.id).where(
         Project.id == project_id,
         Project.owner_id == current_user.id
-    ).first()
+    ))
     
-    if not project:
+    if not project_id:
         raise HTTPException(status_code=404, detail="项目不存在或无权限")
     
-    canvases = db.query(Canvas).filter(
-        Canvas.project_id == project_id,
-        Canvas.is_active == True
-    ).all()
-    
-    return [
-        {
-            "id": canvas.id,
-            "name": canvas.name,
-            "description": canvas.description,
-            "version": canvas.version,
-            "created_at": canvas.created_at,
-            "updated_at": canvas.updated_at
-        }
-        for canvas in canvases
-    ]
+    query, limit = await keyset_page(
+        db, select(
+            Canvas.id, Canvas.name, Canvas.description, Canvas.version,
+            Canvas.created_at, Canvas.updated_at
+        ).where(
+            Canvas.project_id == project_id,
+            Canvas.is_active == True
+        ),
+        Canvas, after, limit
+    )
+    rows = (await db.execute(query)).all()
+    
+    return list_response(rows, limit, lambda canvas: {
+        "id": canvas.id,
+        "name": canvas.name,
+        "description": canvas.description,
+        "version": canvas.version,
+        "created_at": canvas.created_at,
+        "updated_at": canvas.updated_at
+    }, if_none_match)
 
-@router.get("/{canvas_id}")
+@router.get("/{canvas_id}", response_model=CanvasDetail)
 async def get_canvas(
     canvas_id: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    response: Response,
+    stream: bool = False,
+    if_none_match: Optional[str] = Header(None),
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """获取画布详情"""
-    canvas = db.query(Canvas).join(Project).filter(
-        Canvas.id == canvas_id,
-        Project.owner_id == current_user.id
-    ).first()
+    """获取画布详情；stream=true 时分块返回，适合很大的画布
     
-    if not canvas:
-        raise HTTPException(status_code=404, detail="画布不存在或无权限")
+    ETag 由版本号和更新时间生成，客户端已持有最新版本时返回 304，不读取 canvas_data。
+    """
+    canvas = await _get_owned_canvas(db, canvas_id, current_user.id)
+    etag = version_etag(canvas.id, canvas.version, canvas.updated_at)
+    cached = not_modified(if_none_match, etag)
+    if cached:
+        return cached
     
-    return {
+    # 其他字段与 canvas_data 一并重新读取，保证内容一致；期间若有新的保存，
+    # 内容会比 ETag 新，客户端下次请求时 ETag 不匹配会重新获取
+    await db.refresh(canvas, ["canvas_data", "name", "description", "version", "updated_at"])
+    content = {
         "id": canvas.id,
         "project_id": canvas.project_id,
         "name": canvas.name,
@@ -103,84 +207,249 @@ async def get_canvas(
         "created_at": canvas.created_at,
         "updated_at": canvas.updated_at
     }
+    if stream:
+        return StreamingJSONResponse(content, headers=etag_headers(etag))
+    response.headers.update(etag_headers(etag))
+    return content
 
-@router.put("/{canvas_id}")
+@router.put("/{canvas_id}", response_model=CanvasUpdated)
 async def update_canvas(
     canvas_id: str,
     canvas_data: dict,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """更新画布"""
-    canvas = db.query(Canvas).join(Project).filter(
-        Canvas.id == canvas_id,
-        Project.owner_id == current_user.id
-    ).first()
+    canvas = await _get_owned_canvas(db, canvas_id, current_user.id, with_data="canvas_data" in canvas_data)
     
-    if not canvas:
-        raise HTTPException(status_code=404, detail="画布不存在或无权限")
+    # 携带 version 时做乐观并发检查，避免覆盖其他页面的修改
+    if "version" in canvas_data and canvas_data["version"] != canvas.version:
+        raise _version_conflict(canvas.version)
+    
+    # 名称和描述与画布数据在同一条以版本为条件的 UPDATE 中写入
+    fields = {key: canvas_data[key] for key in ("name", "description") if key in canvas_data}
     
-    # 更新画布数据
-    if "name" in canvas_data:
-        canvas.name = canvas_data["name"]
-    if "description" in canvas_data:
-        canvas.description = canvas_data["description"]
     if "canvas_data" in canvas_data:
-        canvas.canvas_data = canvas_data["canvas_data"]
-        canvas.version += 1  # 增加版本号
+        saved = await _write_canvas_data(db, canvas, canvas_data["canvas_data"], current_user.id, fields=fields)
+        return {
+            "message": "画布更新成功",
+            "version": saved.version
+        }
     
-    db.commit()
-    db.refresh(canvas)
+    if fields:
+        # 只改名称、描述时不产生新版本；携带 version 时同样以版本为条件
+        query = update(Canvas).where(Canvas.id == canvas.id)
+        if "version" in canvas_data:
+            query = query.where(Canvas.version == canvas_data["version"])
+        result = await db.execute(query.values(**fields).execution_options(synchronize_session=False))
+        if result.rowcount == 0:
+            await db.rollback()
+            raise _version_conflict()
+        await db.commit()
     
     return {
         "message": "画布更新成功",
         "version": canvas.version
     }
 
-@router.post("/{canvas_id}/save")
+@router.post("/{canvas_id}/save", response_model=CanvasSaved)
 async def save_canvas_data(
     canvas_id: str,
     canvas_data: dict,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """保存画布数据"""
-    canvas = db.query(Canvas).join(Project).filter(
-        Canvas.id == canvas_id,
-        Project.owner_id == current_user.id
-    ).first()
-    
-    if not canvas:
-        raise HTTPException(status_code=404, detail="画布不存在或无权限")
+    canvas = await _get_owned_canvas(db, canvas_id, current_user.id, with_data=True)
     
     # 保存画布数据
-    canvas.canvas_data = canvas_data
-    canvas.version += 1
+    saved = await _write_canvas_data(db, canvas, canvas_data, current_user.id)
     
-    db.commit()
+    return {
+        "message": "画布保存成功",
+        "version": saved.version,
+        "saved_at": saved.updated_at
+    }
+
+@router.patch("/{canvas_id}", response_model=CanvasSaved)
+async def patch_canvas_data(
+    canvas_id: str,
+    patch_data: dict,
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """增量保存画布数据
+    
+    请求体为 {"base_version": 编辑所基于的版本, "patch": [操作, ...]}，
+    操作格式见 services.canvas_patch。版本已变化时返回 409。
+    """
+    if "base_version" not in patch_data or "patch" not in patch_data:
+        raise HTTPException(status_code=400, detail="缺少 base_version 或 patch")
+    base_version = patch_data["base_version"]
+    
+    canvas = await _get_owned_canvas(db, canvas_id, current_user.id, with_data=True)
+    
+    if canvas.version != base_version:
+        raise _version_conflict(canvas.version)
+    
+    if not patch_data["patch"]:
+        return {"message": "画布无变更", "version": canvas.version, "saved_at": canvas.updated_at}
+    
+    try:
+        new_data = apply_patch(canvas.canvas_data or {"nodes": [], "edges": []}, patch_data["patch"])
+    except PatchError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    saved = await _write_canvas_data(db, canvas, new_data, current_user.id, patch=patch_data["patch"])
     
     return {
         "message": "画布保存成功",
-        "version": canvas.version,
-        "saved_at": canvas.updated_at
+        "version": saved.version,
+        "saved_at": saved.updated_at
+    }
+
+@router.get("/{canvas_id}/versions", response_model=CanvasVersionList)
+async def get_canvas_versions(
+    canvas_id: str,
+    before: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """获取画布版本列表（按版本号倒序，before 为游标）；只列出仍可读取的版本，已压缩的增量不在列表中"""
+    canvas = await _get_owned_canvas(db, canvas_id, current_user.id)
+    return {"current_version": canvas.version, **await list_versions(db, canvas_id, before, limit)}
+
+@router.get("/{canvas_id}/versions/{version}", response_model=CanvasVersionData)
+async def get_canvas_version(
+    canvas_id: str,
+    version: int,
+    stream: bool = False,
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """获取指定版本的画布数据；stream=true 时分块返回"""
+    canvas = await _get_owned_canvas(db, canvas_id, current_user.id)
+    content = {"version": version, "canvas_data": await _load_version_data(db, canvas, version)}
+    if stream:
+        return StreamingJSONResponse(content)
+    return content
+
+@router.get("/{canvas_id}/diff", response_model=CanvasDiff)
+async def diff_canvas_versions(
+    canvas_id: str,
+    from_version: int,
+    to_version: Optional[int] = None,
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """比较两个版本，返回从 from_version 到 to_version（默认当前版本）的补丁"""
+    canvas = await _get_owned_canvas(db, canvas_id, current_user.id)
+    to_version = canvas.version if to_version is None else to_version
+    
+    before = await _load_version_data(db, canvas, from_version)
+    after = await _load_version_data(db, canvas, to_version)
+    
+    return {
+        "from_version": from_version,
+        "to_version": to_version,
+        "patch": diff_documents(before, after)
     }
 
-@router.delete("/{canvas_id}")
+@router.post("/{canvas_id}/versions/{version}/restore", response_model=CanvasSaved)
+async def restore_canvas_version(
+    canvas_id: str,
+    version: int,
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """恢复到指定版本（以新版本的形式写入，历史不会丢失）"""
+    canvas = await _get_owned_canvas(db, canvas_id, current_user.id, with_data=True)
+    data = await _load_version_data(db, canvas, version)
+    
+    saved = await _write_canvas_data(db, canvas, data, current_user.id)
+    
+    return {
+        "message": f"已恢复到版本 {version}",
+        "version": saved.version,
+        "saved_at": saved.updated_at
+    }
+
+@router.delete("/{canvas_id}", response_model=MessageResponse)
 async def delete_canvas(
     canvas_id: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """删除画布（软删除）"""
-    canvas = db.query(Canvas).join(Project).filter(
-        Canvas.id == canvas_id,
-        Project.owner_id == current_user.id
-    ).first()
-    
-    if not canvas:
-        raise HTTPException(status_code=404, detail="画布不存在或无权限")
+    canvas = await _get_owned_canvas(db, canvas_id, current_user.id)
     
     canvas.is_active = False
-    db.commit()
+    await db.commit()
+    
+    workflow_cache.invalidate(canvas_id)
     
     return {"message": "画布删除成功"}
+
+async def _authenticate_socket(websocket: WebSocket, canvas_id: str) -> Optional[UserPrincipal]:
+    """接受连接并完成首条消息认证，只允许画布所属项目的所有者；失败时关闭连接并返回 None
+
+    浏览器 WebSocket 无法设置请求头，令牌也不放在 URL 中（会写入访问日志）：
+    连接后客户端先发送 {"type": "auth", "token": ...}。
+    """
+    await websocket.accept()
+    try:
+        message = await asyncio.wait_for(websocket.receive_json(), settings.WS_AUTH_TIMEOUT)
+        token = message.get("token") if isinstance(message, dict) and message.get("type") == "auth" else None
+        if not token:
+            raise HTTPException(status_code=401, detail="缺少认证消息")
+        async with AsyncSessionLocal() as db:
+            current_user = await get_current_user(token, db)
+            await _get_owned_canvas(db, canvas_id, current_user.id)
+        return current_user
+    except HTTPException as e:
+        await websocket.close(code=4401 if e.status_code == 401 else 4404)
+    except (asyncio.TimeoutError, ValueError):
+        await websocket.close(code=4401)
+    except WebSocketDisconnect:
+        pass
+    return None
+
+@router.websocket("/{canvas_id}/collab")
+async def canvas_collab(websocket: WebSocket, canvas_id: str):
+    """画布协同编辑通道（首条消息认证）"""
+    current_user = await _authenticate_socket(websocket, canvas_id)
+    if current_user is None:
+        return
+    
+    participant = await collab_manager.join(canvas_id, websocket, current_user)
+    if participant is None:
+        await websocket.close(code=4404)
+        return
+    try:
+        while True:
+            collab_manager.handle(canvas_id, participant, await websocket.receive_json())
+    except (WebSocketDisconnect, ValueError):
+        pass
+    finally:
+        await collab_manager.leave(canvas_id, participant)
+
+@router.websocket("/{canvas_id}/execution/{workflow_id}")
+async def canvas_execution(websocket: WebSocket, canvas_id: str, workflow_id: str):
+    """执行面板通道：推送该画布上一次执行的日志、token 流和状态（首条消息认证）
+    
+    同一次执行可以被多个连接同时订阅。
+    """
+    if await _authenticate_socket(websocket, canvas_id) is None:
+        return
+    
+    channel = execution_channel(canvas_id, workflow_id)
+    connection_manager.subscribe(channel, websocket)
+    try:
+        while True:
+            # 客户端不需要发送消息，读取只用于感知断开
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        connection_manager.unsubscribe(channel, websocket)
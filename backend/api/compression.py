@@ -0,0 +1,219 @@
+"""
+响应压缩中间件
+按 Accept-Encoding 协商 brotli 或 gzip，只压缩达到大小阈值的 JSON / 文本响应；
+流式响应逐块压缩并立即刷新，不等待完整响应体。
+
+压缩后的响应 ETag 加上编码后缀（"abc" -> "abc-br"），不同编码的表示各有强 ETag；
+请求中 If-None-Match 的后缀只有与本次协商的编码一致时才在交给路由前去掉（其他编码的表示不匹配），
+304 响应原样带回客户端发送的 ETag。
+"""
+
+import zlib
+from typing import Dict, List, Optional
+
+import brotli
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# 按优先级排列的可用编码
+ENCODINGS = ("br", "gzip")
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/javascript",
+    "application/xml",
+)
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """从 Accept-Encoding 中选出可用的编码，q 值相同时优先 brotli"""
+    weights: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        weights[name.strip().lower()] = quality
+
+    candidates = [
+        (weights.get(encoding, weights.get("*", 0.0)), -position, encoding)
+        for position, encoding in enumerate(ENCODINGS)
+    ]
+    quality, _, encoding = max(candidates)
+    return encoding if quality > 0 else None
+
+def _is_compressible(content_type: str) -> bool:
+    content_type = content_type.split(";")[0].strip().lower()
+    return (
+        content_type.startswith("text/")
+        or content_type in COMPRESSIBLE_TYPES
+        or content_type.endswith("+json")
+        or content_type.endswith("+xml")
+    )
+
+def _add_suffix(etag: str, encoding: str) -> str:
+    if etag.endswith('"'):
+        return f'{etag[:-1]}-{encoding}"'
+    return etag
+
+def _strip_suffix(etag: str, encoding: Optional[str]) -> str:
+    """去掉与 encoding 一致的编码后缀；其他编码的后缀保留，使该 ETag 不会匹配"""
+    suffix = f'-{encoding}"'
+    if encoding and etag.endswith(suffix):
+        return etag[:-len(suffix)] + '"'
+    return etag
+
+class _Compressor:
+    """同一接口封装 gzip 和 brotli 的流式压缩"""
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def compress(self, data: bytes) -> bytes:
+        """压缩一块数据并刷新，使已发送的部分可以立即解压"""
+        if self.encoding == "br":
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._brotli.finish()
+        return self._zlib.flush(zlib.Z_FINISH)
+
+class CompressionMiddleware:
+    """gzip / brotli 响应压缩"""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 4
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        responder = _CompressionResponder(
+            self, send,
+            negotiate_encoding(headers.get("accept-encoding", "")),
+            headers.get("if-none-match")
+        )
+        if responder.if_none_match:
+            scope = dict(scope)
+            scope["headers"] = [
+                (name, responder.stripped_if_none_match.encode("latin-1")) if name == b"if-none-match" else (name, value)
+                for name, value in scope["headers"]
+            ]
+        await self.app(scope, receive, responder.send)
+
+class _CompressionResponder:
+    """处理单个请求的响应：决定是否压缩，并改写 ETag 和相关响应头"""
+
+    def __init__(
+        self,
+        middleware: CompressionMiddleware,
+        send: Send,
+        encoding: Optional[str],
+        if_none_match: Optional[str]
+    ):
+        self.middleware = middleware
+        self._send = send
+        self.encoding = encoding
+        self.if_none_match = if_none_match
+        # 去掉后缀后的 ETag -> 客户端发送的原始 ETag
+        self._client_etags: Dict[str, str] = {}
+        if if_none_match:
+            tags: List[str] = []
+            for tag in if_none_match.split(","):
+                tag = tag.strip()
+                stripped = _strip_suffix(tag, encoding)
+                self._client_etags.setdefault(stripped.removeprefix("W/"), tag)
+                tags.append(stripped)
+            self.stripped_if_none_match = ", ".join(tags)
+
+        self._start: Optional[Message] = None
+        self._compressor: Optional[_Compressor] = None
+        self._passthrough = False
+
+    async def send(self, message: Message):
+        if message["type"] == "http.response.start":
+            self._on_start(message)
+            if self._passthrough:
+                await self._send(message)
+            return
+
+        if message["type"] != "http.response.body" or self._passthrough:
+            await self._send(message)
+            return
+
+        body, more_body = message.get("body", b""), message.get("more_body", False)
+        if self._compressor is None:
+            # 首个响应体消息：完整响应体小于阈值时不压缩
+            if not more_body and len(body) < self.middleware.minimum_size:
+                await self._send(self._start)
+                await self._send(message)
+                return
+            self._compressor = _Compressor(
+                self.encoding, self.middleware.gzip_level, self.middleware.brotli_quality
+            )
+            headers = MutableHeaders(raw=self._start["headers"])
+            headers["Content-Encoding"] = self.encoding
+            if "etag" in headers:
+                headers["ETag"] = _add_suffix(headers["etag"], self.encoding)
+            if more_body:
+                del headers["Content-Length"]
+            else:
+                compressed = self._compressor.compress(body) + self._compressor.finish()
+                headers["Content-Length"] = str(len(compressed))
+                await self._send(self._start)
+                await self._send({"type": "http.response.body", "body": compressed})
+                return
+            await self._send(self._start)
+
+        data = self._compressor.compress(body) if body else b""
+        if not more_body:
+            data += self._compressor.finish()
+        if data or not more_body:
+            await self._send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+    def _on_start(self, message: Message):
+        headers = MutableHeaders(raw=message["headers"])
+        status = message["status"]
+
+        if status == 304:
+            # 带回客户端所持有表示的 ETag（可能带编码后缀），缓存需按 Accept-Encoding 区分
+            headers.add_vary_header("Accept-Encoding")
+            etag = headers.get("etag")
+            if etag and etag.removeprefix("W/") in self._client_etags:
+                headers["ETag"] = self._client_etags[etag.removeprefix("W/")]
+            self._passthrough = True
+            return
+
+        compressible = _is_compressible(headers.get("content-type", ""))
+        if compressible:
+            headers.add_vary_header("Accept-Encoding")
+        if (
+            not compressible
+            or self.encoding is None
+            or "content-encoding" in headers
+            or status < 200
+            or status in (204, 205)
+        ):
+            self._passthrough = True
+            return
+        self._start = message
@@ -2,25 +2,30 @@
 知识库管理 API 路由
 """
 
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, UploadFile, File
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 import os
 import shutil
-from typing import List
+from typing import List, Optional
 
-from database import get_db
-from models import KnowledgeBase, KnowledgeSource, User
+from database import get_async_db
+from models import KnowledgeBase, KnowledgeSource
+from services.auth_cache import UserPrincipal
 from .auth import get_current_user
+from .pagination import etag_headers, not_modified, version_etag
+from .schemas import KnowledgeBaseCreated, KnowledgeBaseDetail, KnowledgeBaseSummary, MessageResponse, SearchResponse, SourceUploaded
 from services.knowledge_service import KnowledgeService
 from config import settings
 
 router = APIRouter()
 
-@router.post("/bases")
+@router.post("/bases", response_model=KnowledgeBaseCreated)
 async def create_knowledge_base(
     kb_data: dict,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """创建知识库"""
     knowledge_service = KnowledgeService()
@@ -36,8 +41,8 @@ async def create_knowledge_base(
     )
     
     db.add(new_kb)
-    db.commit()
-    db.refresh(new_kb)
+    await db.commit()
+    await db.refresh(new_kb)
     
     # 在 ChromaDB 中创建集合
     await knowledge_service.create_collection(new_kb.collection_name)
@@ -49,16 +54,18 @@ async def create_knowledge_base(
         "created_at": new_kb.created_at
     }
 
-@router.get("/bases")
+@router.get("/bases", response_model=List[KnowledgeBaseSummary])
 async def get_knowledge_bases(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取用户的知识库列表"""
-    knowledge_bases = db.query(KnowledgeBase).filter(
+    knowledge_bases = (await db.scalars(select(KnowledgeBase).options(
+        selectinload(KnowledgeBase.sources)
+    ).where(
         KnowledgeBase.owner_id == current_user.id,
         KnowledgeBase.is_active == True
-    ).all()
+    ).order_by(KnowledgeBase.created_at.desc(), KnowledgeBase.id.desc()))).all()
     
     return [
         {
@@ -74,21 +81,49 @@ async def get_knowledge_bases(
         for kb in knowledge_bases
     ]
 
-@router.get("/bases/{kb_id}")
+@router.get("/bases/{kb_id}", response_model=KnowledgeBaseDetail)
 async def get_knowledge_base(
     kb_id: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """获取知识库详情"""
-    kb = db.query(KnowledgeBase).filter(
+    """获取知识库详情
+    
+    ETag 由知识库更新时间和来源的数量、最近更新时间、分块总数生成，未变化时返回 304。
+    """
+    kb_version = (await db.execute(
+        select(
+            KnowledgeBase.updated_at,
+            func.count(KnowledgeSource.id),
+            func.max(KnowledgeSource.updated_at),
+            func.sum(KnowledgeSource.chunk_count)
+        ).outerjoin(KnowledgeSource).where(
+            KnowledgeBase.id == kb_id,
+            KnowledgeBase.owner_id == current_user.id
+        ).group_by(KnowledgeBase.id)
+    )).first()
+    
+    if not kb_version:
+        raise HTTPException(status_code=404, detail="知识库不存在")
+    
+    etag = version_etag(kb_id, *kb_version)
+    cached = not_modified(if_none_match, etag)
+    if cached:
+        return cached
+    
+    kb = await db.scalar(select(KnowledgeBase).options(
+        selectinload(KnowledgeBase.sources)
+    ).where(
         KnowledgeBase.id == kb_id,
         KnowledgeBase.owner_id == current_user.id
-    ).first()
+    ))
     
     if not kb:
         raise HTTPException(status_code=404, detail="知识库不存在")
     
+    response.headers.update(etag_headers(etag))
     return {
         "id": kb.id,
         "name": kb.name,
@@ -112,19 +147,19 @@ async def get_knowledge_base(
         "updated_at": kb.updated_at
     }
 
-@router.post("/bases/{kb_id}/sources/upload")
+@router.post("/bases/{kb_id}/sources/upload", response_model=SourceUploaded)
 async def upload_file_source(
     kb_id: str,
     file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """上传文件到知识库"""
     # 验证知识库权限
-    kb = db.query(KnowledgeBase).filter(
+    kb = await db.scalar(select(KnowledgeBase).where(
         KnowledgeBase.id == kb_id,
         KnowledgeBase.owner_id == current_user.id
-    ).first()
+    ))
     
     if not kb:
         raise HTTPException(status_code=404, detail="知识库不存在")
@@ -150,8 +185,8 @@ async def upload_file_source(
     )
     
     db.add(new_source)
-    db.commit()
-    db.refresh(new_source)
+    await db.commit()
+    await db.refresh(new_source)
     
     # 异步处理文件（这里简化为同步处理）
     knowledge_service = KnowledgeService()
@@ -159,7 +194,7 @@ async def upload_file_source(
         await knowledge_service.process_file_source(new_source.id, db)
     except Exception as e:
         new_source.processing_status = "failed"
-        db.commit()
+        await db.commit()
         raise HTTPException(status_code=500, detail=f"文件处理失败: {str(e)}")
     
     return {
@@ -169,19 +204,19 @@ async def upload_file_source(
         "processing_status": new_source.processing_status
     }
 
-@router.post("/bases/{kb_id}/search")
+@router.post("/bases/{kb_id}/search", response_model=SearchResponse)
 async def search_knowledge(
     kb_id: str,
     search_data: dict,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """在知识库中搜索"""
     # 验证知识库权限
-    kb = db.query(KnowledgeBase).filter(
+    kb = await db.scalar(select(KnowledgeBase).where(
         KnowledgeBase.id == kb_id,
         KnowledgeBase.owner_id == current_user.id
-    ).first()
+    ))
     
     if not kb:
         raise HTTPException(status_code=404, detail="知识库不存在")
@@ -198,24 +233,24 @@ async def search_knowledge(
         "results": results
     }
 
-@router.delete("/bases/{kb_id}")
+@router.delete("/bases/{kb_id}", response_model=MessageResponse)
 async def delete_knowledge_base(
     kb_id: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """删除知识库"""
-    kb = db.query(KnowledgeBase).filter(
+    kb = await db.scalar(select(KnowledgeBase).where(
         KnowledgeBase.id == kb_id,
         KnowledgeBase.owner_id == current_user.id
-    ).first()
+    ))
     
     if not kb:
         raise HTTPException(status_code=404, detail="知识库不存在")
     
     # 软删除
     kb.is_active = False
-    db.commit()
+    await db.commit()
     
     # 删除 ChromaDB 集合
     knowledge_service = KnowledgeService()
@@ -0,0 +1,96 @@
+"""
+列表接口的游标分页和条件请求
+按 (created_at, id) 倒序分页，after 为上一页最后一条记录的 id，不在当前列表范围内时返回 400；
+响应带 ETag，客户端携带 If-None-Match 且列表未变化时返回 304；
+详情接口用 version_etag 由版本号、更新时间等生成 ETag，未变化时不读取也不序列化完整内容
+"""
+
+import hashlib
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Response
+from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
+
+from config import settings
+from .responses import dumps
+
+def keyset_query(query: Select, model, after: Optional[str], limit: Optional[int]) -> Tuple[Select, int]:
+    """为查询加上游标条件、排序和多取一条的 limit，返回 (查询, 实际页大小)
+
+    游标记录的 created_at 由子查询读取，避免不同数据库对时间参数格式的差异。
+    """
+    limit = min(limit or settings.LIST_PAGE_SIZE, settings.LIST_MAX_PAGE_SIZE)
+    if after is not None:
+        cursor = select(model.created_at).where(model.id == after).scalar_subquery()
+        query = query.where(or_(
+            model.created_at < cursor,
+            and_(model.created_at == cursor, model.id < after)
+        ))
+    return query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1), limit
+
+async def keyset_page(
+    db: AsyncSession,
+    query: Select,
+    model,
+    after: Optional[str],
+    limit: Optional[int]
+) -> Tuple[Select, int]:
+    """校验游标后构造分页查询（见 keyset_query）
+
+    游标必须是同一列表（相同过滤条件）中的记录，不存在或属于其他项目时返回 400，而不是静默返回空页。
+    """
+    if after is not None:
+        scope = select(model.id).where(model.id == after)
+        if query.whereclause is not None:
+            scope = scope.where(query.whereclause)
+        if await db.scalar(scope) is None:
+            raise HTTPException(status_code=400, detail="无效的分页游标")
+    return keyset_query(query, model, after, limit)
+
+def compute_etag(body: bytes) -> str:
+    """基于响应内容的强 ETag"""
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+def version_etag(*parts: Any) -> str:
+    """基于资源版本信息的强 ETag；parts 需覆盖所有会改变响应内容的字段和查询参数"""
+    return compute_etag("|".join(str(part) for part in parts).encode("utf-8"))
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 使用弱比较：忽略 W/ 前缀"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+def etag_headers(etag: str) -> Dict[str, str]:
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+def not_modified(if_none_match: Optional[str], etag: str) -> Optional[Response]:
+    """客户端持有的版本仍是最新时返回 304 响应，否则返回 None"""
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=etag_headers(etag))
+    return None
+
+def cached_json_response(content: Any, if_none_match: Optional[str] = None, headers: Dict[str, str] = None) -> Response:
+    """序列化为 JSON 并附加 ETag；与 If-None-Match 匹配时返回 304"""
+    body = dumps(content)
+    etag = compute_etag(body)
+    headers = {**(headers or {}), **etag_headers(etag)}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def list_response(
+    rows: Sequence[Any],
+    limit: int,
+    serialize: Callable[[Any], Dict],
+    if_none_match: Optional[str] = None
+) -> Response:
+    """返回一页列表；还有下一页时在 X-Next-Cursor 响应头中给出游标"""
+    has_more = len(rows) > limit
+    items: List[Dict] = [serialize(row) for row in rows[:limit]]
+    headers = {"X-Next-Cursor": str(items[-1]["id"])} if has_more and items else {}
+    return cached_json_response(items, if_none_match, headers)
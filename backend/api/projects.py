@@ -2,21 +2,26 @@
 项目管理 API 路由
 """
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import undefer
+from typing import List, Optional
 
-from database import get_db
-from models import Project, User
+from database import get_async_db
+from models import Project
+from services.auth_cache import UserPrincipal
 from .auth import get_current_user
+from .schemas import MessageResponse, ProjectCreated, ProjectDetail, ProjectSummary
+from .pagination import keyset_page, list_response
 
 router = APIRouter()
 
-@router.post("/")
+@router.post("/", response_model=ProjectCreated)
 async def create_project(
     project_data: dict, 
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """创建新项目"""
     new_project = Project(
@@ -27,8 +32,8 @@ async def create_project(
     )
     
     db.add(new_project)
-    db.commit()
-    db.refresh(new_project)
+    await db.commit()
+    await db.refresh(new_project)
     
     return {
         "id": new_project.id,
@@ -37,39 +42,43 @@ async def create_project(
         "created_at": new_project.created_at
     }
 
-@router.get("/")
+@router.get("/", response_model=List[ProjectSummary])
 async def get_projects(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    after: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    if_none_match: Optional[str] = Header(None),
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """获取用户项目列表"""
-    projects = db.query(Project).filter(
-        Project.owner_id == current_user.id,
-        Project.is_active == True
-    ).all()
+    """获取用户项目列表（只查询列表所需的列）"""
+    query, limit = await keyset_page(
+        db, select(Project.id, Project.name, Project.description, Project.created_at, Project.updated_at).where(
+            Project.owner_id == current_user.id,
+            Project.is_active == True
+        ),
+        Project, after, limit
+    )
+    rows = (await db.execute(query)).all()
     
-    return [
-        {
-            "id": project.id,
-            "name": project.name,
-            "description": project.description,
-            "created_at": project.created_at,
-            "updated_at": project.updated_at
-        }
-        for project in projects
-    ]
+    return list_response(rows, limit, lambda project: {
+        "id": project.id,
+        "name": project.name,
+        "description": project.description,
+        "created_at": project.created_at,
+        "updated_at": project.updated_at
+    }, if_none_match)
 
-@router.get("/{project_id}")
+@router.get("/{project_id}", response_model=ProjectDetail)
 async def get_project(
     project_id: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取项目详情"""
-    project = db.query(Project).filter(
+    project = await db.scalar(select(Project).options(undefer(Project.settings)).where(
         Project.id == project_id,
         Project.owner_id == current_user.id
-    ).first()
+    ))
     
     if not project:
         raise HTTPException(status_code=404, detail="项目不存在")
@@ -83,47 +92,48 @@ async def get_project(
         "updated_at": project.updated_at
     }
 
-@router.put("/{project_id}")
+@router.put("/{project_id}", response_model=MessageResponse)
 async def update_project(
     project_id: str,
     project_data: dict,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """更新项目"""
-    project = db.query(Project).filter(
+    project = await db.scalar(select(Project).where(
         Project.id == project_id,
         Project.owner_id == current_user.id
-    ).first()
+    ))
     
     if not project:
         raise HTTPException(status_code=404, detail="项目不存在")
     
     project.name = project_data.get("name", project.name)
     project.description = project_data.get("description", project.description)
-    project.settings = project_data.get("settings", project.settings)
+    if "settings" in project_data:
+        project.settings = project_data["settings"]
     
-    db.commit()
-    db.refresh(project)
+    await db.commit()
+    await db.refresh(project)
     
     return {"message": "项目更新成功"}
 
-@router.delete("/{project_id}")
+@router.delete("/{project_id}", response_model=MessageResponse)
 async def delete_project(
     project_id: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """删除项目（软删除）"""
-    project = db.query(Project).filter(
+    project = await db.scalar(select(Project).where(
         Project.id == project_id,
         Project.owner_id == current_user.id
-    ).first()
+    ))
     
     if not project:
         raise HTTPException(status_code=404, detail="项目不存在")
     
     project.is_active = False
-    db.commit()
+    await db.commit()
     
     return {"message": "项目删除成功"}
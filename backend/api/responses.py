@@ -0,0 +1,97 @@
+"""
+JSON 响应序列化
+- dumps：基于 orjson 的序列化，orjson 不支持的类型回退到 jsonable_encoder；
+- StreamingJSONResponse：分块输出大文档（画布数据、执行日志），
+  大列表逐项序列化，不在内存中拼出完整的响应体
+"""
+
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Iterator
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+
+# 每次发送的块大小
+CHUNK_SIZE = 64 * 1024
+
+# 响应字段向下展开的层数：canvas_data -> nodes 列表，列表中的每项整体序列化
+STREAM_DEPTH = 2
+
+def _default(value: Any) -> Any:
+    return jsonable_encoder(value)
+
+def dumps(content: Any) -> bytes:
+    """序列化为 UTF-8 JSON（紧凑格式，不转义非 ASCII 字符）"""
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+def _iter_value(value: Any, depth: int) -> Iterator[bytes]:
+    if depth > 0 and isinstance(value, dict):
+        yield b"{"
+        for position, (key, item) in enumerate(value.items()):
+            yield (b"," if position else b"") + dumps(str(key)) + b":"
+            yield from _iter_value(item, depth - 1)
+        yield b"}"
+    elif depth > 0 and isinstance(value, list):
+        yield b"["
+        for position, item in enumerate(value):
+            if position:
+                yield b","
+            yield from _iter_value(item, depth - 1)
+        yield b"]"
+    else:
+        yield dumps(value)
+
+async def _parts(
+    content: Dict[str, Any],
+    streams: Dict[str, AsyncIterable[Any]],
+    depth: int
+) -> AsyncIterator[bytes]:
+    yield b"{"
+    fields = 0
+    for name, value in content.items():
+        yield (b"," if fields else b"") + dumps(name) + b":"
+        for part in _iter_value(value, depth):
+            yield part
+        fields += 1
+
+    for name, items in streams.items():
+        yield (b"," if fields else b"") + dumps(name) + b":["
+        count = 0
+        async for item in items:
+            yield (b"," if count else b"") + dumps(item)
+            count += 1
+        yield b"]"
+        fields += 1
+    yield b"}"
+
+async def iter_json(
+    content: Dict[str, Any],
+    streams: Dict[str, AsyncIterable[Any]] = None,
+    depth: int = STREAM_DEPTH
+) -> AsyncIterator[bytes]:
+    """逐块生成 content 的 JSON；streams 中的异步迭代器作为数组字段追加在最后，边读边输出"""
+    buffer = bytearray()
+    async for part in _parts(content, streams or {}, depth):
+        buffer += part
+        if len(buffer) >= CHUNK_SIZE:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+class StreamingJSONResponse(StreamingResponse):
+    """流式 JSON 响应，内容与普通 JSON 响应相同"""
+
+    def __init__(
+        self,
+        content: Dict[str, Any],
+        streams: Dict[str, AsyncIterable[Any]] = None,
+        status_code: int = 200,
+        headers: Dict[str, str] = None
+    ):
+        super().__init__(
+            iter_json(content, streams),
+            status_code=status_code,
+            headers=headers,
+            media_type="application/json"
+        )
@@ -0,0 +1,202 @@
+"""
+API 响应模型
+各接口返回的数据结构；声明为 response_model 后由 pydantic-core 校验并序列化，
+不再经过 jsonable_encoder 逐层递归转换
+"""
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel, ConfigDict, Field
+
+class MessageResponse(BaseModel):
+    message: str
+
+# 认证
+
+class RegisterResponse(MessageResponse):
+    user_id: str
+    username: str
+
+class UserBrief(BaseModel):
+    id: str
+    username: str
+    email: str
+    full_name: Optional[str] = None
+
+class TokenResponse(BaseModel):
+    access_token: str
+    token_type: str
+    user: UserBrief
+
+class UserProfile(UserBrief):
+    is_active: bool
+    created_at: Optional[datetime] = None
+
+class UserStatusResponse(MessageResponse):
+    user_id: str
+    is_active: bool
+
+# 项目
+
+class ProjectCreated(BaseModel):
+    id: str
+    name: str
+    description: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+class ProjectSummary(ProjectCreated):
+    updated_at: Optional[datetime] = None
+
+class ProjectDetail(ProjectSummary):
+    settings: Optional[Dict[str, Any]] = None
+
+# 画布
+
+class CanvasCreated(BaseModel):
+    id: str
+    name: str
+    description: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+class CanvasSummary(CanvasCreated):
+    version: int
+    updated_at: Optional[datetime] = None
+
+class CanvasDetail(CanvasSummary):
+    project_id: str
+    canvas_data: Any = None
+
+class CanvasUpdated(MessageResponse):
+    version: int
+
+class CanvasSaved(CanvasUpdated):
+    saved_at: Optional[datetime] = None
+
+class CanvasVersionInfo(BaseModel):
+    version: int
+    kind: str
+    size: int
+    created_by: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+class CanvasVersionList(BaseModel):
+    current_version: int
+    versions: List[CanvasVersionInfo]
+    next_cursor: Optional[int] = None
+    has_more: bool
+
+class CanvasVersionData(BaseModel):
+    version: int
+    canvas_data: Any = None
+
+class CanvasDiff(BaseModel):
+    from_version: int
+    to_version: int
+    patch: List[Dict[str, Any]]
+
+# Agent 和工具
+
+class AgentCreated(BaseModel):
+    id: str
+    name: str
+    agent_type: str
+    created_at: Optional[datetime] = None
+
+class AgentSummary(AgentCreated):
+    role: Optional[str] = None
+    goal: Optional[str] = None
+
+class AgentDetail(AgentSummary):
+    backstory: Optional[str] = None
+    tools: Optional[List[Any]] = None
+    llm_config: Optional[Dict[str, Any]] = None
+    memory_config: Optional[Dict[str, Any]] = None
+    max_execution_time: Optional[int] = None
+    max_iterations: Optional[int] = None
+    updated_at: Optional[datetime] = None
+
+class ToolCreated(BaseModel):
+    id: str
+    name: str
+    tool_type: str
+    created_at: Optional[datetime] = None
+
+class ToolSummary(BaseModel):
+    # schema 与 BaseModel 的方法同名，字段名加下划线，输出时仍为 schema
+    model_config = ConfigDict(populate_by_name=True)
+
+    id: str
+    name: str
+    description: Optional[str] = None
+    tool_type: str
+    schema_: Optional[Dict[str, Any]] = Field(None, alias="schema")
+
+# 知识库
+
+class KnowledgeBaseCreated(BaseModel):
+    id: str
+    name: str
+    collection_name: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+class KnowledgeBaseSummary(KnowledgeBaseCreated):
+    description: Optional[str] = None
+    embedding_model: Optional[str] = None
+    source_count: int
+    updated_at: Optional[datetime] = None
+
+class KnowledgeSourceSummary(BaseModel):
+    id: str
+    name: str
+    source_type: str
+    processing_status: Optional[str] = None
+    chunk_count: Optional[int] = None
+    created_at: Optional[datetime] = None
+
+class KnowledgeBaseDetail(KnowledgeBaseCreated):
+    description: Optional[str] = None
+    embedding_model: Optional[str] = None
+    chunk_size: Optional[int] = None
+    chunk_overlap: Optional[int] = None
+    sources: List[KnowledgeSourceSummary]
+    updated_at: Optional[datetime] = None
+
+class SourceUploaded(BaseModel):
+    id: str
+    name: str
+    file_path: Optional[str] = None
+    processing_status: Optional[str] = None
+
+class SearchResult(BaseModel):
+    rank: int
+    document: str
+    metadata: Optional[Dict[str, Any]] = None
+    similarity: float
+    source_name: Optional[str] = None
+    chunk_id: Optional[Any] = None
+
+class SearchResponse(BaseModel):
+    query: str
+    results: List[SearchResult]
+
+# 工作流
+
+class RunEvent(BaseModel):
+    id: int
+    event_type: str
+    node_id: Optional[str] = None
+    payload: Any = None
+    created_at: Optional[datetime] = None
+
+class WorkflowStatus(BaseModel):
+    run_id: str
+    status: str
+    started_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+    execution_time: Optional[float] = None
+    error_message: Optional[str] = None
+    execution_log: List[RunEvent]
+    next_cursor: Optional[int] = None
+    prev_cursor: Optional[int] = None
+    has_more: bool
@@ -0,0 +1,46 @@
+"""
+条件表达式基准测试
+对比编译后的条件表达式与每次 eval 的单次求值耗时。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.condition_benchmark --iterations 200000
+"""
+
+import argparse
+import timeit
+from types import SimpleNamespace
+
+from services.condition_engine import compile_condition
+
+# (条件表达式, 等价的 Python 表达式)
+CASES = [
+    ('data.score >= 0.8', 'state.data["score"] >= 0.8'),
+    ('data.score >= 0.8 and data.label != "spam"',
+     'state.data["score"] >= 0.8 and state.data["label"] != "spam"'),
+    ('data.review.status in ["approved", "merged"] or len(results) > 3',
+     'state.data["review"]["status"] in ["approved", "merged"] or len(state.results) > 3'),
+]
+
+STATE = SimpleNamespace(
+    data={"score": 0.9, "label": "ok", "review": {"status": "merged"}},
+    results=[1, 2],
+    error=None
+)
+
+def main():
+    parser = argparse.ArgumentParser(description="条件表达式基准测试")
+    parser.add_argument("--iterations", type=int, default=100000)
+    args = parser.parse_args()
+
+    print(f"{'expression':<66} {'eval ns':>9} {'compiled ns':>12} {'speedup':>8}")
+    for source, python_source in CASES:
+        condition = compile_condition(source)
+        assert condition(STATE) == bool(eval(python_source, {"state": STATE}))
+
+        eval_time = timeit.timeit(lambda: eval(python_source, {"state": STATE}), number=args.iterations)
+        compiled_time = timeit.timeit(lambda: condition(STATE), number=args.iterations)
+        print(f"{source:<66} {eval_time / args.iterations * 1e9:>9.0f} "
+              f"{compiled_time / args.iterations * 1e9:>12.0f} {eval_time / compiled_time:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+基准测试用的确定性假 LLM 和假工具
+不访问网络，按配置的延迟返回可复现的结果
+"""
+
+import asyncio
+import hashlib
+import time
+from threading import Lock
+from typing import Any, List, Optional
+
+from langchain.llms.base import LLM
+from langchain.tools.base import BaseTool
+
+from services.agent_service import AgentService
+
+class SimulatedLatency:
+    """累计假 LLM 和假工具模拟的耗时，用于从总耗时中扣除"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.seconds = 0.0
+            self.llm_calls = 0
+            self.tool_calls = 0
+
+    def record(self, seconds: float, kind: str):
+        with self._lock:
+            self.seconds += seconds
+            if kind == "llm":
+                self.llm_calls += 1
+            else:
+                self.tool_calls += 1
+
+simulated_latency = SimulatedLatency()
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+class FakeLLM(LLM):
+    """确定性假 LLM：回答由提示词哈希决定"""
+
+    latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-deterministic"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        simulated_latency.record(self.latency, "llm")
+        return f"Final Answer: {_digest(prompt)}"
+
+class FakeTool(BaseTool):
+    """确定性假工具"""
+
+    name: str = "fake_tool"
+    description: str = "Deterministic tool used for benchmarking"
+    latency: float = 0.0
+
+    def _run(self, tool_input: Any = "", **kwargs) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        simulated_latency.record(self.latency, "tool")
+        return f"{self.name}:{_digest(str(tool_input))}"
+
+    async def _arun(self, tool_input: Any = "", **kwargs) -> str:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        simulated_latency.record(self.latency, "tool")
+        return f"{self.name}:{_digest(str(tool_input))}"
+
+class FakeAgentService(AgentService):
+    """使用假 LLM 和假工具的 Agent 服务，其余逻辑与 AgentService 一致"""
+
+    def __init__(self, llm_latency: float = 0.0, tool_latency: float = 0.0):
+        self.llm_latency = llm_latency
+        self.tool_latency = tool_latency
+        super().__init__()
+
+    def _init_llm(self):
+        return FakeLLM(latency=self.llm_latency)
+
+    async def _load_tool(self, tool_name: str) -> Optional[BaseTool]:
+        return FakeTool(name=tool_name or "fake_tool", latency=self.tool_latency)
@@ -0,0 +1,115 @@
+"""
+登录吞吐基准测试
+模拟一批并发登录的密码校验，对比在事件循环中直接调用 bcrypt 与使用密码哈希进程池时的
+登录吞吐、延迟，以及同一事件循环上其他请求感受到的最大阻塞时间。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.login_benchmark --logins 64 --concurrency 16
+    python -m benchmarks.login_benchmark --rounds 10 --workers 4 --json
+"""
+
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+from typing import Callable, Dict, List
+
+from passlib.context import CryptContext
+
+from services.password_hasher import PasswordHasher, PasswordHasherBusy
+
+PASSWORD = "correct horse battery staple"
+
+async def _heartbeat(interval: float, lags: List[float], stop: asyncio.Event):
+    """定时唤醒，记录实际唤醒时间比预期晚了多少（即事件循环被阻塞的时长）"""
+    while not stop.is_set():
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        lags.append(max(time.perf_counter() - expected, 0.0))
+
+async def _measure(login: Callable, logins: int, concurrency: int) -> Dict[str, float]:
+    latencies: List[float] = []
+    lags: List[float] = []
+    rejected = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        nonlocal rejected
+        async with semaphore:
+            started_at = time.perf_counter()
+            try:
+                await login()
+            except PasswordHasherBusy:
+                rejected += 1
+                return
+            latencies.append(time.perf_counter() - started_at)
+
+    stop = asyncio.Event()
+    heartbeat = asyncio.create_task(_heartbeat(0.01, lags, stop))
+    started_at = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(logins)))
+    elapsed = time.perf_counter() - started_at
+    stop.set()
+    await heartbeat
+
+    latencies.sort()
+    return {
+        "logins_per_sec": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[max(int(len(latencies) * 0.95) - 1, 0)] * 1000,
+        "max_loop_lag_ms": max(lags, default=0.0) * 1000,
+        "rejected": rejected,
+    }
+
+async def run(args) -> List[Dict]:
+    context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=args.rounds)
+    hashed_password = context.hash(PASSWORD)
+
+    hasher = PasswordHasher(workers=args.workers, queue_limit=args.queue_limit, rounds=args.rounds)
+    await hasher.start()
+
+    async def inline():
+        # 原实现：在 async 路由中同步调用 bcrypt
+        assert context.verify(PASSWORD, hashed_password)
+
+    async def pooled():
+        verified, _ = await hasher.verify(PASSWORD, hashed_password)
+        assert verified
+
+    rows = []
+    try:
+        for concurrency in args.concurrency:
+            for mode, login in (("inline", inline), ("pool", pooled)):
+                await login()
+                result = await _measure(login, args.logins, concurrency)
+                rows.append({"mode": mode, "concurrency": concurrency, **result})
+    finally:
+        hasher.shutdown()
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="登录吞吐基准测试")
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 16])
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt 成本参数")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--queue-limit", type=int, default=None)
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    rows = asyncio.run(run(args))
+
+    if args.json:
+        json.dump(rows, sys.stdout, indent=2)
+        print()
+        return
+
+    print(f"{'mode':<7} {'conc':>5} {'logins/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'loop lag ms':>12} {'rejected':>9}")
+    for row in rows:
+        print(f"{row['mode']:<7} {row['concurrency']:>5} {row['logins_per_sec']:>9.1f} "
+              f"{row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} {row['max_loop_lag_ms']:>12.1f} {row['rejected']:>9}")
+
+if __name__ == "__main__":
+    main()
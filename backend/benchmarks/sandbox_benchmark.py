@@ -0,0 +1,104 @@
+"""
+沙箱进程池基准测试
+对比进程内 exec 与沙箱进程池执行 Python 代码的调用延迟与吞吐。
+（条件表达式已改为编译执行，见 condition_benchmark。）
+
+用法（在 backend 目录下）:
+    python -m benchmarks.sandbox_benchmark --calls 200 --concurrency 1 4 8
+    python -m benchmarks.sandbox_benchmark --workers 4 --json
+"""
+
+import io
+import sys
+import json
+import time
+import asyncio
+import argparse
+import contextlib
+import statistics
+from typing import Callable, Dict, List
+
+from services.sandbox_pool import SandboxPool
+
+WORKLOADS = {
+    "python": "print(sum(i * i for i in range(2000)))",
+}
+
+def _in_process_python(code: str) -> str:
+    stdout = io.StringIO()
+    with contextlib.redirect_stdout(stdout):
+        exec(code, {"__name__": "__bench__"})
+    return stdout.getvalue()
+
+async def _measure(call: Callable, calls: int, concurrency: int) -> Dict[str, float]:
+    """以给定并发度执行 calls 次调用，统计延迟分位数和吞吐"""
+    latencies: List[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            started_at = time.perf_counter()
+            await call()
+            latencies.append(time.perf_counter() - started_at)
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(calls)))
+    elapsed = time.perf_counter() - started_at
+
+    latencies.sort()
+    return {
+        "calls_per_sec": calls / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+async def run(args) -> List[Dict]:
+    pool = SandboxPool(workers=args.workers)
+    await pool.start()
+
+    modes = {
+        "in_process": {
+            # 进程内执行会阻塞事件循环，这里与服务中的原实现保持一致
+            "python": lambda: asyncio.sleep(0, _in_process_python(WORKLOADS["python"])),
+        },
+        "sandbox": {
+            "python": lambda: pool.run_python(WORKLOADS["python"]),
+        },
+    }
+
+    rows = []
+    try:
+        for workload in args.workloads:
+            for concurrency in args.concurrency:
+                for mode, calls in modes.items():
+                    # 预热一次，排除首次导入和进程通信建立的开销
+                    await calls[workload]()
+                    result = await _measure(calls[workload], args.calls, concurrency)
+                    rows.append({"workload": workload, "mode": mode, "concurrency": concurrency, **result})
+    finally:
+        pool.shutdown()
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="沙箱进程池基准测试")
+    parser.add_argument("--workloads", nargs="+", choices=list(WORKLOADS), default=list(WORKLOADS))
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4])
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    rows = asyncio.run(run(args))
+
+    if args.json:
+        json.dump(rows, sys.stdout, indent=2)
+        print()
+        return
+
+    print(f"{'workload':<10} {'mode':<11} {'conc':>5} {'calls/s':>10} {'p50 ms':>9} {'p95 ms':>9}")
+    for row in rows:
+        print(f"{row['workload']:<10} {row['mode']:<11} {row['concurrency']:>5} "
+              f"{row['calls_per_sec']:>10.1f} {row['p50_ms']:>9.3f} {row['p95_ms']:>9.3f}")
+
+if __name__ == "__main__":
+    main()
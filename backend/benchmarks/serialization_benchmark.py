@@ -0,0 +1,178 @@
+"""
+响应序列化基准测试
+对 5 MB 画布详情和 10,000 条执行日志的工作流状态，比较三种输出方式：
+- encoder：原实现，无 response_model，jsonable_encoder + 标准库 json（Starlette JSONResponse）；
+- model：声明 response_model，pydantic-core 校验并序列化后由 ORJSONResponse 输出；
+- stream：StreamingJSONResponse 分块输出（不经过 response_model）。
+报告每次序列化的耗时和内存峰值；stream 另报告最大块大小。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.serialization_benchmark
+    python -m benchmarks.serialization_benchmark --canvas-mb 10 --events 50000 --repeat 5 --json
+"""
+
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from api.responses import iter_json
+from api.schemas import CanvasDetail, WorkflowStatus
+
+def make_canvas(target_mb: float) -> Dict[str, Any]:
+    """生成约 target_mb 大小的画布详情（Agent 节点带完整配置）"""
+    now = datetime.now(timezone.utc)
+    nodes, edges, size = [], [], 0
+    while size < target_mb * 1024 * 1024:
+        index = len(nodes)
+        node = {
+            "id": f"agent_{index}",
+            "type": "agent",
+            "position": {"x": index % 40 * 220.5, "y": index // 40 * 140.25},
+            "data": {
+                "label": f"Agent 节点 {index}",
+                "config": {
+                    "role": "研究员",
+                    "goal": "收集并总结与任务相关的资料，" * 4,
+                    "backstory": "一位经验丰富的分析师，擅长从大量文档中提炼要点。" * 3,
+                    "tools": ["search", "web_scraper", "python"],
+                    "llm_config": {"model": "qwen2.5:7b", "temperature": 0.7, "max_tokens": 2048},
+                },
+            },
+        }
+        nodes.append(node)
+        if index:
+            edges.append({"id": f"e{index}", "source": f"agent_{index - 1}", "target": f"agent_{index}"})
+        size += len(json.dumps(node, ensure_ascii=False).encode("utf-8")) + 80
+    return {
+        "id": "canvas-1",
+        "project_id": "project-1",
+        "name": "大型画布",
+        "description": "序列化基准测试",
+        "canvas_data": {"nodes": nodes, "edges": edges, "viewport": {"x": 0, "y": 0, "zoom": 1}},
+        "version": 42,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+def make_run_status(events: int) -> Dict[str, Any]:
+    """生成带 events 条执行事件的工作流状态"""
+    started_at = datetime.now(timezone.utc)
+    return {
+        "run_id": "run-1",
+        "status": "completed",
+        "started_at": started_at,
+        "completed_at": started_at + timedelta(seconds=events / 100),
+        "execution_time": events / 100,
+        "error_message": None,
+        "execution_log": [
+            {
+                "id": index + 1,
+                "event_type": "node_result",
+                "node_id": f"agent_{index % 50}",
+                "payload": {"status": "completed", "output": f"第 {index} 步的输出内容", "tokens": 128 + index % 64},
+                "created_at": started_at + timedelta(milliseconds=index * 10),
+            }
+            for index in range(events)
+        ],
+        "next_cursor": events,
+        "prev_cursor": 1,
+        "has_more": False,
+    }
+
+def encoder_path(content: Dict) -> Callable[[], Awaitable[bytes]]:
+    async def run():
+        return JSONResponse(jsonable_encoder(content)).body
+    return run
+
+def model_path(content: Dict, model) -> Callable[[], Awaitable[bytes]]:
+    field = create_response_field(name=f"Response_{model.__name__}", type_=model)
+
+    async def run():
+        # 与 FastAPI 处理声明了 response_model 的路由相同的步骤
+        serialized = await serialize_response(field=field, response_content=content, is_coroutine=True)
+        return ORJSONResponse(serialized).body
+    return run
+
+def stream_path(content: Dict, chunk_sizes: List[int]) -> Callable[[], Awaitable[None]]:
+    async def run():
+        # 只统计块大小，不拼接完整响应体（与发送到网络时的内存占用一致）
+        async for chunk in iter_json(content):
+            chunk_sizes.append(len(chunk))
+    return run
+
+async def _measure(run: Callable[[], Awaitable[Any]], repeat: int) -> Dict[str, float]:
+    await run()
+    timings = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        await run()
+        timings.append(time.perf_counter() - started_at)
+
+    tracemalloc.start()
+    await run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "median_ms": statistics.median(timings) * 1000,
+        "min_ms": min(timings) * 1000,
+        "peak_mb": peak / 1024 / 1024,
+    }
+
+async def run(args) -> List[Dict]:
+    payloads = [
+        ("canvas", make_canvas(args.canvas_mb), CanvasDetail),
+        ("run_log", make_run_status(args.events), WorkflowStatus),
+    ]
+    rows = []
+    for name, content, model in payloads:
+        body = await encoder_path(content)()
+        streamed = b"".join([chunk async for chunk in iter_json(content)])
+        assert json.loads(streamed) == json.loads(body), "流式输出与原实现不一致"
+        chunk_sizes: List[int] = []
+        for mode, path in (
+            ("encoder", encoder_path(content)),
+            ("model", model_path(content, model)),
+            ("stream", stream_path(content, chunk_sizes)),
+        ):
+            result = await _measure(path, args.repeat)
+            row = {"payload": name, "mode": mode, "size_mb": len(body) / 1024 / 1024, **result}
+            if mode == "stream":
+                row["max_chunk_kb"] = max(chunk_sizes) / 1024
+            rows.append(row)
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="响应序列化基准测试")
+    parser.add_argument("--canvas-mb", type=float, default=5.0)
+    parser.add_argument("--events", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    rows = asyncio.run(run(args))
+
+    if args.json:
+        json.dump(rows, sys.stdout, indent=2)
+        print()
+        return
+
+    print(f"{'payload':<8} {'mode':<8} {'size MB':>8} {'median ms':>10} {'min ms':>8} {'peak MB':>8} {'chunk KB':>9}")
+    for row in rows:
+        chunk = f"{row['max_chunk_kb']:>9.0f}" if "max_chunk_kb" in row else f"{'-':>9}"
+        print(f"{row['payload']:<8} {row['mode']:<8} {row['size_mb']:>8.2f} {row['median_ms']:>10.1f} "
+              f"{row['min_ms']:>8.1f} {row['peak_mb']:>8.1f} {chunk}")
+
+if __name__ == "__main__":
+    main()
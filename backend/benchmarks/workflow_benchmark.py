@@ -0,0 +1,224 @@
+"""
+工作流执行吞吐基准测试
+使用确定性的假 LLM 和假工具驱动 WorkflowService.execute_workflow，
+将调度开销与模型延迟分离，可完全离线运行。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.workflow_benchmark --sizes 10 100 1000 --runs 5
+    python -m benchmarks.workflow_benchmark --kinds simple --llm-latency 0.01 --json
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import tracemalloc
+from typing import Dict, List
+
+# 必须在导入 config 之前设置，使基准测试使用独立的 SQLite 数据库
+_db_path = os.path.join(tempfile.mkdtemp(prefix="workflow_bench_"), "bench.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_db_path}")
+
+from sqlalchemy import event
+
+from database import engine, async_engine, SessionLocal
+from models import Base, User, Project, Canvas
+from services.workflow_service import WorkflowService
+from services.workflow_cache import workflow_cache
+from benchmarks.fakes import FakeAgentService, simulated_latency
+
+KINDS = ["simple", "crewai", "langgraph"]
+
+class WriteCounter:
+    """统计执行的写语句数量（executemany 计为一次）"""
+
+    def __init__(self):
+        self.writes = 0
+        # 执行路径使用异步引擎，种子数据使用同步引擎
+        for target in (engine, async_engine.sync_engine):
+            event.listen(target, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip()[:6].upper() in ("INSERT", "UPDATE", "DELETE"):
+            self.writes += 1
+
+def build_canvas(kind: str, size: int) -> Dict:
+    """构建指定类型和节点数的画布数据"""
+    nodes = []
+
+    if kind == "crewai":
+        agent_count = max(2, size // 2)
+        for i in range(agent_count):
+            nodes.append({
+                "id": f"agent_{i}",
+                "type": "agent",
+                "data": {
+                    "role": f"Agent {i}",
+                    "goal": f"Goal {i}",
+                    "backstory": "",
+                    "tools": ["search"] if i % 2 else []
+                }
+            })
+        for i in range(max(1, size - agent_count)):
+            nodes.append({
+                "id": f"task_{i}",
+                "type": "task",
+                "data": {"description": f"Task {i}", "agent_index": i % agent_count}
+            })
+        edges = [
+            {"source": f"task_{i}", "target": f"task_{i + 1}"}
+            for i in range(max(1, size - agent_count) - 1)
+        ]
+        return {"nodes": nodes, "edges": edges}
+
+    if kind == "simple":
+        nodes.append({"id": "node_0", "type": "input", "data": {"value": "benchmark"}})
+    else:
+        nodes.append({"id": "node_0", "type": "condition", "entry": True, "condition": "True"})
+
+    for i in range(1, size - 1):
+        if i % 2:
+            nodes.append({
+                "id": f"node_{i}",
+                "type": "agent",
+                "task": f"Step {i}",
+                "config": {"role": "Assistant", "goal": f"Step {i}"},
+                "data": {"config": {"name": f"agent_{i}"}, "task": f"Step {i}"}
+            })
+        else:
+            nodes.append({
+                "id": f"node_{i}",
+                "type": "tool",
+                "tool_name": "calculator",
+                "inputs": {"expression": f"{i} + 1"},
+                "data": {"tool_name": "calculator", "inputs": {"expression": f"{i} + 1"}}
+            })
+
+    if kind == "simple":
+        nodes.append({"id": f"node_{size - 1}", "type": "output", "data": {}})
+    else:
+        # LangGraph 只接受 agent/tool/condition 节点
+        nodes.append({
+            "id": f"node_{size - 1}",
+            "type": "tool",
+            "tool_name": "calculator",
+            "inputs": {},
+            "data": {"tool_name": "calculator", "inputs": {}}
+        })
+
+    edges = [
+        {"source": nodes[i]["id"], "target": nodes[i + 1]["id"]}
+        for i in range(len(nodes) - 1)
+    ]
+    return {"nodes": nodes, "edges": edges}
+
+def seed_canvas(canvas_data: Dict) -> Dict:
+    """写入基准测试用的用户、项目和画布"""
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.username == "bench").first()
+        if not user:
+            user = User(username="bench", email="bench@example.com", hashed_password="-")
+            db.add(user)
+            db.flush()
+
+        project = Project(name="bench", owner_id=user.id)
+        db.add(project)
+        db.flush()
+
+        canvas = Canvas(project_id=project.id, name="bench", canvas_data=canvas_data)
+        db.add(canvas)
+        db.commit()
+
+        return {"project_id": project.id, "canvas_id": canvas.id}
+    finally:
+        db.close()
+
+async def run_case(service: WorkflowService, kind: str, size: int, runs: int,
+                   warm: bool, counter: WriteCounter) -> Dict:
+    """执行单个基准用例"""
+    ids = seed_canvas(build_canvas(kind, size))
+    workflow_data = {"workflow_id": f"bench_{kind}_{size}", **ids}
+
+    # 预热一次，排除导入和首次连接的开销
+    await service.execute_workflow(workflow_data)
+
+    simulated_latency.reset()
+    writes_before = counter.writes
+    successes = 0
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    for _ in range(runs):
+        if not warm:
+            workflow_cache.invalidate(ids["canvas_id"])
+        result = await service.execute_workflow(workflow_data)
+        if result.get("status") == "completed":
+            successes += 1
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    overhead = max(0.0, elapsed - simulated_latency.seconds)
+
+    return {
+        "kind": kind,
+        "nodes": size,
+        "runs": runs,
+        "succeeded": successes,
+        "runs_per_sec": runs / elapsed if elapsed else 0.0,
+        "overhead_per_node_ms": overhead / (runs * size) * 1000,
+        "db_writes_per_run": (counter.writes - writes_before) / runs,
+        "llm_calls_per_run": simulated_latency.llm_calls / runs,
+        "tool_calls_per_run": simulated_latency.tool_calls / runs,
+        "peak_memory_mb": peak / (1024 * 1024)
+    }
+
+def print_table(results: List[Dict]):
+    """以表格形式输出结果"""
+    header = (
+        f"{'kind':<10}{'nodes':>7}{'ok/runs':>9}{'runs/s':>10}"
+        f"{'ovh/node ms':>13}{'db writes':>11}{'peak MB':>10}"
+    )
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['kind']:<10}{r['nodes']:>7}{str(r['succeeded']) + '/' + str(r['runs']):>9}"
+            f"{r['runs_per_sec']:>10.2f}{r['overhead_per_node_ms']:>13.3f}"
+            f"{r['db_writes_per_run']:>11.1f}{r['peak_memory_mb']:>10.2f}"
+        )
+
+async def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="WorkflowService 吞吐基准测试")
+    parser.add_argument("--kinds", nargs="+", choices=KINDS, default=KINDS)
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10, 100, 1000])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="假 LLM 每次调用的延迟（秒）")
+    parser.add_argument("--tool-latency", type=float, default=0.0, help="假工具每次调用的延迟（秒）")
+    parser.add_argument("--warm", action="store_true", help="保留编译后工作流缓存")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args(argv)
+
+    Base.metadata.create_all(bind=engine)
+    counter = WriteCounter()
+
+    service = WorkflowService()
+    service.agent_service = FakeAgentService(args.llm_latency, args.tool_latency)
+
+    results = []
+    for kind in args.kinds:
+        for size in args.sizes:
+            results.append(await run_case(service, kind, size, args.runs, args.warm, counter))
+
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        print_table(results)
+
+if __name__ == "__main__":
+    asyncio.run(main())
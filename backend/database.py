@@ -1,30 +1,126 @@
 """
 数据库连接和会话管理
+API 路由和工作流服务使用异步引擎（asyncpg / aiosqlite），
+同步引擎保留给启动脚本和在工作线程中执行的后台写入
 """
 
+import time
+from threading import Lock
+from typing import Any, AsyncIterator, Dict
+
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from config import settings
 
+# 同步驱动 -> 异步驱动
+_ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+}
+
+def async_database_url(url: str) -> str:
+    """由同步连接串推导异步连接串"""
+    parsed = make_url(url)
+    driver = _ASYNC_DRIVERS.get(parsed.drivername, parsed.drivername)
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+class PoolStats:
+    """连接池等待时间统计"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.timeouts = 0
+
+    def record(self, wait: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "checkouts": self.checkouts,
+            "avg_wait": self.total_wait / self.checkouts if self.checkouts else 0.0,
+            "max_wait": self.max_wait,
+            "timeouts": self.timeouts
+        }
+
+pool_stats = PoolStats()
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """记录每次取连接等待时间的连接池"""
+
+    def _do_get(self):
+        started_at = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            pool_stats.record(time.perf_counter() - started_at, timed_out=True)
+            raise
+        pool_stats.record(time.perf_counter() - started_at)
+        return connection
+
 # 创建数据库引擎
 engine = create_engine(
     settings.DATABASE_URL,
     pool_pre_ping=True,
-    pool_recycle=300,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    echo=settings.DEBUG
+)
+
+# 创建异步数据库引擎
+async_engine = create_async_engine(
+    settings.ASYNC_DATABASE_URL or async_database_url(settings.DATABASE_URL),
+    poolclass=TimedQueuePool,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_pre_ping=True,
+    pool_recycle=settings.DB_POOL_RECYCLE,
     echo=settings.DEBUG
 )
 
 # 创建会话工厂
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 提交后不过期属性，避免在异步上下文中触发隐式加载
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 # 创建基础模型类
 Base = declarative_base()
 
 def get_db() -> Session:
-    """获取数据库会话"""
+    """获取同步数据库会话"""
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    """获取异步数据库会话"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def pool_metrics() -> Dict[str, Any]:
+    """异步连接池状态及等待时间"""
+    pool = async_engine.pool
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "overflow": max(pool.overflow(), 0),
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        **pool_stats.to_dict()
+    }
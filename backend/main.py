@@ -3,25 +3,39 @@ AI Agent 平台后端主入口文件
 基于 FastAPI 构建的 RESTful API 服务
 """
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import Depends, FastAPI, Header, HTTPException, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 import uvicorn
+import asyncio
 import logging
 from contextlib import asynccontextmanager
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from config import settings
-from database import engine, Base
+from database import engine, async_engine, SessionLocal, get_async_db, pool_metrics
+from models import Base, Canvas, Project, WorkflowRun
 from api import auth, projects, canvas, agents, knowledge
+from api.compression import CompressionMiddleware
+from api.pagination import etag_headers, not_modified, version_etag
+from api.responses import StreamingJSONResponse
+from api.schemas import WorkflowStatus
 from services.workflow_service import WorkflowService
-from services.websocket_manager import ConnectionManager
+from services.auth_cache import UserPrincipal
+from services.websocket_manager import connection_manager, execution_channel
+from services.sandbox_pool import sandbox_pool
+from services.password_hasher import password_hasher
+from services.canvas_history import run_compaction
+from services.canvas_collab import collab_manager
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # WebSocket 连接管理器
-manager = ConnectionManager()
+manager = connection_manager
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -29,18 +43,51 @@ async def lifespan(app: FastAPI):
     # 启动时执行
     logger.info("正在启动 AI Agent 平台...")
     
-    # 创建数据库表
+    # 创建缺失的数据库表（开发环境便利；生产环境以 alembic upgrade head 为准）
     Base.metadata.create_all(bind=engine)
     
     # 初始化工作流服务
-    workflow_service = WorkflowService()
+    workflow_service = WorkflowService(connection_manager=manager)
     app.state.workflow_service = workflow_service
     
+    # 加载工具定义并预热工具池
+    tool_registry = workflow_service.agent_service.tool_registry
+    db = SessionLocal()
+    try:
+        tool_registry.load_definitions(db)
+    except Exception as e:
+        logger.warning(f"加载工具定义失败: {e}")
+    finally:
+        db.close()
+    await tool_registry.warm_up()
+    
+    # 预先启动沙箱子进程
+    try:
+        await sandbox_pool.start()
+    except Exception as e:
+        logger.warning(f"启动沙箱进程池失败: {e}")
+    
+    # 预先启动密码哈希子进程
+    try:
+        await password_hasher.start()
+    except Exception as e:
+        logger.warning(f"启动密码哈希进程池失败: {e}")
+    
+    # 启动画布版本历史的后台压缩任务
+    compaction_task = asyncio.create_task(run_compaction()) if settings.CANVAS_COMPACTION_INTERVAL else None
+    
     logger.info("AI Agent 平台启动完成")
     yield
     
     # 关闭时执行
     logger.info("正在关闭 AI Agent 平台...")
+    await workflow_service.agent_service.gateway.aclose()
+    sandbox_pool.shutdown()
+    password_hasher.shutdown()
+    if compaction_task:
+        compaction_task.cancel()
+    await collab_manager.close()
+    await async_engine.dispose()
 
 # 创建 FastAPI 应用实例
 app = FastAPI(
@@ -49,9 +96,18 @@ app = FastAPI(
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
+# 响应压缩中间件（gzip / brotli）
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+    gzip_level=settings.COMPRESSION_GZIP_LEVEL,
+    brotli_quality=settings.COMPRESSION_BROTLI_QUALITY,
+)
+
 # CORS 中间件配置
 app.add_middleware(
     CORSMiddleware,
@@ -59,6 +115,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
 
 # 静态文件服务
@@ -89,6 +146,21 @@ async def health_check():
         "version": "1.0.0"
     }
 
+@app.get("/api/v1/llm/metrics")
+async def llm_metrics():
+    """LLM 网关指标（并发、排队深度、延迟）及各模型的延迟和 token 用量"""
+    agent_service = app.state.workflow_service.agent_service
+    return {
+        "backends": agent_service.gateway.metrics(),
+        "models": agent_service.router.stats(),
+        "cache": agent_service.llm_cache.stats() if agent_service.llm_cache else None
+    }
+
+@app.get("/api/v1/db/metrics")
+async def db_metrics():
+    """数据库连接池指标（占用连接数、取连接等待时间）"""
+    return pool_metrics()
+
 @app.websocket("/ws/{client_id}")
 async def websocket_endpoint(websocket: WebSocket, client_id: str):
     """WebSocket 连接端点，用于实时通信"""
@@ -124,6 +196,82 @@ async def execute_workflow(workflow_data: dict):
         logger.error(f"工作流执行失败: {e}")
         return {"success": False, "error": str(e)}
 
+@app.get("/api/v1/workflow/status/{run_id}", response_model=WorkflowStatus)
+async def get_workflow_status(
+    run_id: str,
+    response: Response,
+    after: int = None,
+    limit: int = None,
+    stream: bool = False,
+    if_none_match: str = Header(None)
+):
+    """获取工作流执行状态及分页执行日志
+    
+    stream=true 时不分页，流式返回 after 之后的全部执行日志。
+    ETag 由执行状态和事件条数生成，状态和日志都没有变化时返回 304。
+    """
+    workflow_service = app.state.workflow_service
+    run_version = await workflow_service.get_workflow_status_version(run_id)
+    if run_version is None:
+        raise HTTPException(status_code=404, detail="工作流记录不存在")
+    etag = version_etag(*run_version, after, limit, stream)
+    cached = not_modified(if_none_match, etag)
+    if cached:
+        return cached
+    
+    if stream:
+        result = await workflow_service.stream_workflow_status(run_id, after=after)
+        if result is None:
+            raise HTTPException(status_code=404, detail="工作流记录不存在")
+        status, events = result
+        return StreamingJSONResponse(status, {"execution_log": events}, headers=etag_headers(etag))
+    
+    status = await workflow_service.get_workflow_status(run_id, after=after, limit=limit)
+    if "error" in status:
+        raise HTTPException(status_code=404, detail=status["error"])
+    response.headers.update(etag_headers(etag))
+    return status
+
+async def _get_owned_run(db: AsyncSession, run_id: str, user_id: str) -> WorkflowRun:
+    """读取当前用户项目下画布的执行记录"""
+    workflow_run = await db.scalar(
+        select(WorkflowRun)
+        .join(Canvas, WorkflowRun.canvas_id == Canvas.id)
+        .join(Project, Canvas.project_id == Project.id)
+        .where(WorkflowRun.id == run_id, Project.owner_id == user_id)
+    )
+    if not workflow_run:
+        raise HTTPException(status_code=404, detail="工作流记录不存在或无权限")
+    return workflow_run
+
+@app.post("/api/v1/workflow/resume/{run_id}")
+async def resume_workflow(
+    run_id: str,
+    current_user: UserPrincipal = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """从检查点恢复工作流执行，结果只推送到该执行的画布频道"""
+    workflow_run = await _get_owned_run(db, run_id, current_user.id)
+    canvas_id = workflow_run.canvas_id
+    workflow_id = (workflow_run.input_data or {}).get("workflow_id")
+    try:
+        workflow_service = app.state.workflow_service
+        result = await workflow_service.resume_workflow(run_id)
+        
+        if "error" in result and "status" not in result:
+            return {"success": False, "error": result["error"]}
+        
+        if workflow_id:
+            await manager.publish(execution_channel(canvas_id, workflow_id), {
+                "type": "workflow_result",
+                "data": result
+            })
+        
+        return {"success": True, "result": result}
+    except Exception as e:
+        logger.error(f"工作流恢复失败: {e}")
+        return {"success": False, "error": str(e)}
+
 if __name__ == "__main__":
     uvicorn.run(
         "main:app",
@@ -3,15 +3,23 @@
 使用 SQLAlchemy ORM 定义数据库表结构
 """
 
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, JSON, Float
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, JSON, Float, UniqueConstraint, Index
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.orm import relationship, deferred
+from sqlalchemy.sql import column, func
 import uuid
 from datetime import datetime
 
 Base = declarative_base()
 
+def active_index(name: str, *columns) -> Index:
+    """只包含未软删除行（is_active 为真）的部分索引；不支持部分索引的数据库上为普通索引"""
+    condition = column("is_active") == True
+    return Index(name, *columns, postgresql_where=condition, sqlite_where=condition)
+
+# 列表按 (created_at, id) 倒序分页，索引列顺序与之一致
+NEWEST_FIRST = (column("created_at").desc(), column("id").desc())
+
 class User(Base):
     """用户模型"""
     __tablename__ = "users"
@@ -33,12 +41,13 @@ class User(Base):
 class Project(Base):
     """项目模型"""
     __tablename__ = "projects"
+    __table_args__ = (active_index("ix_projects_owner_active", "owner_id", *NEWEST_FIRST),)
     
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     name = Column(String(100), nullable=False)
     description = Column(Text)
     owner_id = Column(String, ForeignKey("users.id"), nullable=False)
-    settings = Column(JSON)  # 项目配置信息
+    settings = deferred(Column(JSON))  # 项目配置信息（延迟加载）
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -51,12 +60,13 @@ class Project(Base):
 class Canvas(Base):
     """画布模型"""
     __tablename__ = "canvases"
+    __table_args__ = (active_index("ix_canvases_project_active", "project_id", *NEWEST_FIRST),)
     
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     project_id = Column(String, ForeignKey("projects.id"), nullable=False)
     name = Column(String(100), nullable=False)
     description = Column(Text)
-    canvas_data = Column(JSON)  # 存储节点、连接等画布数据
+    canvas_data = deferred(Column(JSON))  # 存储节点、连接等画布数据（延迟加载，需要时 undefer）
     version = Column(Integer, default=1)
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -65,10 +75,31 @@ class Canvas(Base):
     # 关联关系
     project = relationship("Project", back_populates="canvases")
     workflow_runs = relationship("WorkflowRun", back_populates="canvas")
+    versions = relationship("CanvasVersion", back_populates="canvas")
+
+class CanvasVersion(Base):
+    """画布版本历史模型（定期全量快照 + 相邻版本间的增量补丁）"""
+    __tablename__ = "canvas_versions"
+    __table_args__ = (
+        UniqueConstraint("canvas_id", "version", name="uq_canvas_version"),
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    canvas_id = Column(String, ForeignKey("canvases.id"), nullable=False)
+    version = Column(Integer, nullable=False)
+    kind = Column(String(20), nullable=False)  # snapshot, delta
+    data = Column(JSON)  # snapshot 为完整画布数据，delta 为相对上一版本的补丁
+    size = Column(Integer, default=0)  # data 序列化后的字节数
+    created_by = Column(String, ForeignKey("users.id"))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    # 关联关系
+    canvas = relationship("Canvas", back_populates="versions")
 
 class AgentConfig(Base):
     """Agent 配置模型"""
     __tablename__ = "agent_configs"
+    __table_args__ = (active_index("ix_agent_configs_active", *NEWEST_FIRST),)
     
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     name = Column(String(100), nullable=False)
@@ -85,9 +116,35 @@ class AgentConfig(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+class AgentMemoryTurn(Base):
+    """Agent 对话记忆（按 Agent 和会话存储的每一轮消息）"""
+    __tablename__ = "agent_memory_turns"
+    __table_args__ = (Index("ix_agent_memory_turns_agent_session", "agent_id", "session_id", "id"),)
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    agent_id = Column(String(100), nullable=False)
+    session_id = Column(String(100), nullable=False)
+    role = Column(String(20), nullable=False)  # user, assistant
+    content = Column(Text, nullable=False)
+    token_count = Column(Integer, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class AgentMemorySession(Base):
+    """Agent 会话的滚动摘要"""
+    __tablename__ = "agent_memory_sessions"
+    __table_args__ = (UniqueConstraint("agent_id", "session_id", name="uq_agent_memory_session"),)
+    
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    agent_id = Column(String(100), nullable=False)
+    session_id = Column(String(100), nullable=False)
+    summary = Column(Text, default="")
+    summarized_until = Column(Integer, default=0)  # 已并入摘要的最后一轮消息 ID
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
 class Tool(Base):
     """工具模型"""
     __tablename__ = "tools"
+    __table_args__ = (active_index("ix_tools_active", *NEWEST_FIRST),)
     
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     name = Column(String(100), nullable=False, unique=True)
@@ -101,6 +158,7 @@ class Tool(Base):
 class KnowledgeBase(Base):
     """知识库模型"""
     __tablename__ = "knowledge_bases"
+    __table_args__ = (active_index("ix_knowledge_bases_owner_active", "owner_id", *NEWEST_FIRST),)
     
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     name = Column(String(100), nullable=False)
@@ -121,6 +179,7 @@ class KnowledgeBase(Base):
 class KnowledgeSource(Base):
     """知识源模型"""
     __tablename__ = "knowledge_sources"
+    __table_args__ = (Index("ix_knowledge_sources_kb_created", "knowledge_base_id", "created_at"),)
     
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     knowledge_base_id = Column(String, ForeignKey("knowledge_bases.id"), nullable=False)
@@ -129,7 +188,7 @@ class KnowledgeSource(Base):
     file_path = Column(String(500))
     url = Column(String(500))
     content = Column(Text)
-    metadata = Column(JSON)
+    source_metadata = Column("metadata", JSON)  # metadata 为 SQLAlchemy 保留属性名
     processing_status = Column(String(50), default="pending")  # pending, processing, completed, failed
     chunk_count = Column(Integer, default=0)
     file_size = Column(Integer)
@@ -142,6 +201,7 @@ class KnowledgeSource(Base):
 class WorkflowRun(Base):
     """工作流执行记录模型"""
     __tablename__ = "workflow_runs"
+    __table_args__ = (Index("ix_workflow_runs_canvas_created", "canvas_id", *NEWEST_FIRST),)
     
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     project_id = Column(String, ForeignKey("projects.id"), nullable=False)
@@ -149,7 +209,7 @@ class WorkflowRun(Base):
     status = Column(String(50), default="pending")  # pending, running, completed, failed, cancelled
     input_data = Column(JSON)
     output_data = Column(JSON)
-    execution_log = Column(JSON)  # 详细执行日志
+    execution_log = Column(JSON)  # 详细执行日志（旧版，新日志写入 workflow_run_events）
     error_message = Column(Text)
     started_at = Column(DateTime(timezone=True))
     completed_at = Column(DateTime(timezone=True))
@@ -159,3 +219,38 @@ class WorkflowRun(Base):
     # 关联关系
     project = relationship("Project", back_populates="workflow_runs")
     canvas = relationship("Canvas", back_populates="workflow_runs")
+    events = relationship("WorkflowRunEvent", back_populates="workflow_run")
+    checkpoints = relationship("WorkflowCheckpoint", back_populates="workflow_run")
+
+class WorkflowRunEvent(Base):
+    """工作流执行事件模型（追加写入的执行日志）"""
+    __tablename__ = "workflow_run_events"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)  # 同时作为分页游标
+    run_id = Column(String, ForeignKey("workflow_runs.id"), nullable=False, index=True)
+    event_type = Column(String(50), nullable=False)  # node_result, workflow_result, error, etc.
+    node_id = Column(String)
+    payload = Column(JSON)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    # 关联关系
+    workflow_run = relationship("WorkflowRun", back_populates="events")
+
+class WorkflowCheckpoint(Base):
+    """工作流节点检查点模型"""
+    __tablename__ = "workflow_checkpoints"
+    __table_args__ = (
+        UniqueConstraint("run_id", "node_id", name="uq_workflow_checkpoint_run_node"),
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    run_id = Column(String, ForeignKey("workflow_runs.id"), nullable=False, index=True)
+    node_id = Column(String, nullable=False)
+    status = Column(String(50), nullable=False)  # completed, failed
+    output = Column(JSON)  # 节点输出
+    error_message = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    
+    # 关联关系
+    workflow_run = relationship("WorkflowRun", back_populates="checkpoints")
@@ -5,44 +5,104 @@ Agent 服务
 
 import asyncio
 import json
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, NamedTuple, Optional, Tuple, Union
 from datetime import datetime
 import logging
 
 from langchain.llms.base import LLM
 from langchain.tools.base import BaseTool
-from crewai import Agent, Task, Crew
+from crewai import Agent, Task
 from langgraph import Graph, StateGraph
 from langgraph.graph import END
 
 from config import settings
 from models import AgentConfig, WorkflowRun
+from .checkpoint_service import current_checkpoint
+from .workflow_cache import workflow_cache
+from .llm_gateway import LLMGateway
+from .model_router import ModelRouter
+from .llm_cache import LLMResponseCache
+from .token_stream import current_stream_node
+from .tool_registry import tool_registry
+from .condition_engine import ConditionSyntaxError, compile_condition
+from .memory_service import AgentMemoryService, current_memory_session
 
 logger = logging.getLogger(__name__)
 
+class CrewAgentSpec(NamedTuple):
+    """编译后的 CrewAI Agent 配置（llm_config 为 JSON 字符串，整体不可变）"""
+    role: str
+    goal: str
+    backstory: str
+    tools: Tuple[str, ...]
+    llm_config: str
+    max_execution_time: int
+    max_iterations: int
+
 class AgentService:
     """Agent 服务类"""
     
     def __init__(self):
+        self.gateway = LLMGateway()
+        self.llm_cache = LLMResponseCache() if settings.LLM_CACHE_ENABLED else None
+        self.router = ModelRouter(self.gateway, self.llm_cache)
         self.llm = self._init_llm()
-        self.tools = {}
+        self.tool_registry = tool_registry
+        self.memory = AgentMemoryService(summarize=self.generate)
         self.agents = {}
         
     def _init_llm(self):
-        """初始化 LLM"""
+        """初始化默认 LLM（经模型路由和响应缓存访问网关）"""
+        return self.router.get_llm({})
+    
+    def _llm_for(self, llm_config: Optional[Dict]) -> LLM:
+        """根据 Agent 的 llm_config 选择 LLM，未配置时使用默认 LLM"""
+        if not llm_config:
+            return self.llm
+        return self.router.get_llm(llm_config)
+    
+    async def generate(self, prompt: str, **kwargs) -> str:
+        """直接通过网关异步调用 LLM，不占用线程池"""
+        return await self.gateway.generate(prompt, **kwargs)
+    
+    async def _recall_memory(self, agent_id: str, memory_config: Optional[Dict], query: str) -> Optional[str]:
+        """为启用记忆的 Agent 组装记忆上下文"""
+        session_id = current_memory_session.get()
+        if not agent_id or not session_id or not (memory_config or {}).get("enabled"):
+            return None
         try:
-            # 这里可以根据配置选择不同的 LLM
-            from langchain.llms import Ollama
-            return Ollama(
-                model=settings.DEFAULT_LLM_MODEL,
-                base_url=settings.OLLAMA_BASE_URL
-            )
+            return await self.memory.build_context(agent_id, session_id, query, memory_config) or None
+        except Exception as e:
+            logger.warning(f"读取 Agent 记忆失败: {e}")
+            return None
+    
+    async def _save_memory(self, agent_id: str, memory_config: Optional[Dict], query: str, response: Any):
+        """记录启用记忆的 Agent 的本轮对话"""
+        session_id = current_memory_session.get()
+        if not agent_id or not session_id or not (memory_config or {}).get("enabled"):
+            return
+        try:
+            await self.memory.remember(agent_id, session_id, query, response, memory_config)
         except Exception as e:
-            logger.warning(f"无法连接本地 LLM，使用 OpenAI: {e}")
-            from langchain.llms import OpenAI
-            return OpenAI(api_key=settings.OPENAI_API_KEY)
+            logger.warning(f"写入 Agent 记忆失败: {e}")
     
-    async def create_crewai_agent(self, config: AgentConfig) -> Agent:
+    @staticmethod
+    def _compile_crew_agents(agent_configs: List[Dict]) -> Tuple[CrewAgentSpec, ...]:
+        """把画布中的 Agent 配置编译为不可变的规格，可安全地在多次执行之间缓存"""
+        return tuple(
+            CrewAgentSpec(
+                role=config.get("role", "Assistant"),
+                goal=config.get("goal", ""),
+                backstory=config.get("backstory", ""),
+                tools=tuple(config.get("tools") or ()),
+                llm_config=json.dumps(config.get("llm_config") or {}, sort_keys=True),
+                max_execution_time=config.get("max_execution_time", 300),
+                max_iterations=config.get("max_iterations", 10)
+            )
+            for config in agent_configs
+        )
+    
+    async def create_crewai_agent(self, config: Union[AgentConfig, CrewAgentSpec]) -> Agent:
         """创建 CrewAI Agent"""
         tools = await self._load_tools(config.tools)
         
@@ -51,9 +111,12 @@ class AgentService:
             goal=config.goal,
             backstory=config.backstory,
             tools=tools,
-            llm=self.llm,
+            llm=self._llm_for(
+                json.loads(config.llm_config) if isinstance(config.llm_config, str) else config.llm_config
+            ),
             verbose=True,
-            memory=config.memory_config.get("enabled", False),
+            # 对话记忆由 AgentMemoryService 管理，不启用 CrewAI 自带的记忆
+            memory=False,
             max_execution_time=config.max_execution_time,
             max_iter=config.max_iterations
         )
@@ -78,17 +141,17 @@ class AgentService:
                 if node["type"] == "agent":
                     workflow.add_node(
                         node["id"],
-                        self._create_agent_node(node)
+                        self._checkpointed(node, self._create_agent_node(node))
                     )
                 elif node["type"] == "tool":
                     workflow.add_node(
                         node["id"],
-                        self._create_tool_node(node)
+                        self._checkpointed(node, self._create_tool_node(node))
                     )
                 elif node["type"] == "condition":
                     workflow.add_node(
                         node["id"],
-                        self._create_condition_node(node)
+                        self._checkpointed(node, self._create_condition_node(node))
                     )
             
             # 添加边（连接）
@@ -105,9 +168,41 @@ class AgentService:
         
         return create_state_graph()
     
+    def _checkpointed(self, node_data: Dict, node_fn):
+        """为节点添加检查点：已完成的节点直接复用结果，执行后立即保存"""
+        node_id = node_data["id"]
+        
+        async def checkpointed_node(state):
+            checkpoint = current_checkpoint.get()
+            if checkpoint and node_id in checkpoint.completed:
+                result = checkpoint.completed[node_id]
+                state.data[node_id] = result
+                state.results.append({
+                    "node_id": node_id,
+                    "type": node_data["type"],
+                    "result": result,
+                    "resumed": True,
+                    "timestamp": datetime.now().isoformat()
+                })
+                return state
+            
+            state = await node_fn(state)
+            
+            if checkpoint:
+                if state.error:
+                    await checkpoint.save(node_id, status="failed", error=state.error)
+                else:
+                    await checkpoint.save(node_id, state.data.get(node_id))
+            
+            return state
+        
+        return checkpointed_node
+    
     def _create_agent_node(self, node_data: Dict):
         """创建 Agent 节点"""
         async def agent_node(state):
+            # 该节点的 LLM 输出以节点 ID 推送到执行面板
+            stream_node = current_stream_node.set(node_data["id"])
             try:
                 agent_config = node_data.get("config", {})
                 
@@ -116,17 +211,22 @@ class AgentService:
                     role=agent_config.get("role", "Assistant"),
                     goal=agent_config.get("goal", "Help with the task"),
                     backstory=agent_config.get("backstory", ""),
-                    llm=self.llm,
+                    llm=self._llm_for(agent_config.get("llm_config")),
                     tools=await self._load_tools(agent_config.get("tools", []))
                 )
                 
-                # 执行任务
+                # 执行任务，启用记忆时把历史对话作为上下文
+                description = node_data.get("task", "")
+                agent_id = agent_config.get("agent_id", node_data["id"])
+                memory_config = agent_config.get("memory_config")
                 task = Task(
-                    description=node_data.get("task", ""),
+                    description=description,
                     agent=agent
                 )
                 
-                result = await asyncio.to_thread(task.execute)
+                memory = await self._recall_memory(agent_id, memory_config, description)
+                result = await asyncio.to_thread(task.execute, memory)
+                await self._save_memory(agent_id, memory_config, description, result)
                 
                 state.data[node_data["id"]] = result
                 state.results.append({
@@ -142,6 +242,9 @@ class AgentService:
                 logger.error(f"Agent 节点执行失败: {e}")
                 state.error = str(e)
                 return state
+            
+            finally:
+                current_stream_node.reset(stream_node)
         
         return agent_node
     
@@ -174,14 +277,25 @@ class AgentService:
         return tool_node
     
     def _create_condition_node(self, node_data: Dict):
-        """创建条件节点"""
+        """创建条件节点
+
+        表达式在构建图时编译，编译后的图按画布版本缓存，执行时不再解析。
+        表达式无效（如旧版的 Python 写法或为空）时只有该节点失败，不影响整个工作流的构建。
+        """
+        try:
+            condition = compile_condition(node_data.get("condition", ""))
+            compile_error = None
+        except ConditionSyntaxError as e:
+            condition = None
+            compile_error = f"条件表达式无效: {e}"
+            logger.warning(f"条件节点 {node_data['id']} {compile_error}")
+        
         async def condition_node(state):
+            if condition is None:
+                state.error = compile_error
+                return state
             try:
-                condition = node_data.get("condition", "")
-                
-                # 简单条件判断逻辑
-                # 这里可以扩展为更复杂的条件判断
-                result = eval(condition, {"state": state})
+                result = condition.evaluate(state)
                 
                 state.data[node_data["id"]] = result
                 state.results.append({
@@ -210,54 +324,51 @@ class AgentService:
         return tools
     
     async def _load_tool(self, tool_name: str) -> Optional[BaseTool]:
-        """加载单个工具"""
-        # 这里实现工具加载逻辑
-        # 可以从数据库或配置文件中加载工具定义
-        
-        if tool_name == "search":
-            from langchain.tools import DuckDuckGoSearchRun
-            return DuckDuckGoSearchRun()
-        elif tool_name == "calculator":
-            from langchain.tools import Calculator
-            return Calculator()
-        elif tool_name == "python":
-            from langchain.tools import PythonREPLTool
-            return PythonREPLTool()
-        
-        logger.warning(f"未找到工具: {tool_name}")
-        return None
+        """加载单个工具（从工具注册表获取池化实例的代理）"""
+        tool = await self.tool_registry.get(tool_name)
+        if tool is None:
+            logger.warning(f"未找到工具: {tool_name}")
+        return tool
     
-    async def execute_crew_workflow(self, crew_config: Dict) -> Dict:
-        """执行 CrewAI 团队工作流"""
+    async def execute_crew_workflow(self, crew_config: Dict, cache_key: Tuple[str, int] = None) -> Dict:
+        """执行 CrewAI 团队工作流
+        
+        cache_key 为 (画布 ID, 画布版本)，传入时复用编译好的 Agent 配置；
+        Agent 对象带有执行状态，每次执行重新创建，不在并发执行之间共享。
+        """
         try:
-            # 创建 Agent 列表
-            agents = []
-            for agent_config in crew_config.get("agents", []):
-                agent = await self.create_crewai_agent(agent_config)
-                agents.append(agent)
+            specs = workflow_cache.get(*cache_key) if cache_key else None
             
-            # 创建任务列表
-            tasks = []
-            for task_config in crew_config.get("tasks", []):
-                task = Task(
-                    description=task_config["description"],
-                    agent=agents[task_config.get("agent_index", 0)]
-                )
-                tasks.append(task)
+            if specs is None:
+                specs = self._compile_crew_agents(crew_config.get("agents", []))
+                if cache_key:
+                    workflow_cache.put(*cache_key, specs)
             
-            # 创建团队
-            crew = Crew(
-                agents=agents,
-                tasks=tasks,
-                verbose=True
-            )
+            agents = [await self.create_crewai_agent(spec) for spec in specs]
             
-            # 执行工作流
-            result = await asyncio.to_thread(crew.kickoff)
+            task_configs = crew_config.get("tasks", [])
+            outputs = await self._run_crew_tasks(agents, task_configs, crew_config.get("agents", []))
+            
+            # 按依赖顺序合并结果；没有其他任务依赖的任务为团队结果，多个时按任务 ID 返回
+            task_results = [
+                {
+                    "node_id": task_config["id"],
+                    "type": "task",
+                    "result": outputs[task_config["id"]],
+                    "timestamp": datetime.now().isoformat()
+                }
+                for task_config in self._topological_order(task_configs)
+            ]
+            sinks = self._sink_tasks(task_configs)
+            if len(sinks) > 1:
+                result = {task_id: outputs[task_id] for task_id in sinks}
+            else:
+                result = outputs[sinks[0]] if sinks else None
             
             return {
                 "success": True,
                 "result": result,
+                "task_results": task_results,
                 "execution_time": None  # 可以添加执行时间统计
             }
             
@@ -268,11 +379,121 @@ class AgentService:
                 "error": str(e)
             }
     
-    async def execute_langgraph_workflow(self, workflow_data: Dict) -> Dict:
-        """执行 LangGraph 工作流"""
+    def _topological_order(self, task_configs: List[Dict]) -> List[Dict]:
+        """按依赖关系对任务排序，同层保持画布中的原始顺序"""
+        task_ids = {task["id"] for task in task_configs}
+        remaining = {
+            task["id"]: {dep for dep in task.get("depends_on", []) if dep in task_ids}
+            for task in task_configs
+        }
+        
+        order = []
+        while remaining:
+            ready = [task for task in task_configs if task["id"] in remaining and not remaining[task["id"]]]
+            if not ready:
+                raise ValueError("任务依赖存在环")
+            for task in ready:
+                order.append(task)
+                del remaining[task["id"]]
+            for deps in remaining.values():
+                deps.difference_update(task["id"] for task in ready)
+        
+        return order
+    
+    @staticmethod
+    def _sink_tasks(task_configs: List[Dict]) -> List[str]:
+        """没有其他任务依赖的任务 ID，保持画布中的原始顺序"""
+        depended = {dep for task in task_configs for dep in task.get("depends_on", [])}
+        return [task["id"] for task in task_configs if task["id"] not in depended]
+    
+    async def _run_crew_tasks(self, agents: List[Agent], task_configs: List[Dict],
+                              agent_configs: List[Dict] = None) -> Dict[str, Any]:
+        """并发执行相互独立的任务
+        
+        每个任务在其依赖全部完成后立即开始，总并发受 CREW_MAX_PARALLEL_TASKS 限制；
+        同一个 Agent 同时只执行一个任务。启用记忆的 Agent 在执行前读取、执行后写入记忆。
+        """
+        agent_configs = agent_configs or []
+        order = self._topological_order(task_configs)
+        task_ids = {task["id"] for task in order}
+        outputs: Dict[str, Any] = {}
+        finished = {task["id"]: asyncio.Event() for task in order}
+        failed = set()
+        semaphore = asyncio.Semaphore(settings.CREW_MAX_PARALLEL_TASKS)
+        agent_locks = [asyncio.Lock() for _ in agents]
+        checkpoint = current_checkpoint.get()
+        
+        async def run_task(task_config: Dict):
+            task_id = task_config["id"]
+            try:
+                deps = [dep for dep in task_config.get("depends_on", []) if dep in task_ids]
+                for dep in deps:
+                    await finished[dep].wait()
+                if any(dep in failed for dep in deps):
+                    raise RuntimeError(f"任务 {task_id} 的上游任务执行失败")
+                
+                if checkpoint and task_id in checkpoint.completed:
+                    outputs[task_id] = checkpoint.completed[task_id]
+                    return
+                
+                agent_index = task_config.get("agent_index", 0)
+                context = "\n\n".join(str(outputs[dep]) for dep in deps) or None
+                
+                agent_config = agent_configs[agent_index] if agent_index < len(agent_configs) else {}
+                agent_id = agent_config.get("id")
+                memory_config = agent_config.get("memory_config")
+                
+                async with semaphore, agent_locks[agent_index]:
+                    task = Task(
+                        description=task_config["description"],
+                        agent=agents[agent_index]
+                    )
+                    memory = await self._recall_memory(agent_id, memory_config, task_config["description"])
+                    if memory:
+                        context = f"{memory}\n\n{context}" if context else memory
+                    
+                    stream_node = current_stream_node.set(task_id)
+                    try:
+                        outputs[task_id] = await asyncio.to_thread(task.execute, context)
+                    finally:
+                        current_stream_node.reset(stream_node)
+                    
+                    await self._save_memory(agent_id, memory_config, task_config["description"], outputs[task_id])
+                
+                if checkpoint:
+                    await checkpoint.save(task_id, outputs[task_id])
+                    
+            except Exception as e:
+                failed.add(task_id)
+                if checkpoint:
+                    await checkpoint.save(task_id, None, "failed", str(e))
+                raise
+            
+            finally:
+                finished[task_id].set()
+        
+        results = await asyncio.gather(*(run_task(task) for task in order), return_exceptions=True)
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            raise errors[0]
+        
+        return outputs
+    
+    async def execute_langgraph_workflow(self, workflow_data: Dict, cache_key: Tuple[str, int] = None) -> Dict:
+        """执行 LangGraph 工作流
+        
+        cache_key 为 (画布 ID, 画布版本)，传入时复用已编译的工作流图。
+        """
         try:
-            # 创建工作流图
-            workflow = await self.create_langgraph_workflow(workflow_data)
+            app = workflow_cache.get(*cache_key) if cache_key else None
+            
+            if app is None:
+                # 创建并编译工作流图
+                workflow = await self.create_langgraph_workflow(workflow_data)
+                app = workflow.compile()
+                
+                if cache_key:
+                    workflow_cache.put(*cache_key, app)
             
             # 初始化状态
             initial_state = {
@@ -282,8 +503,7 @@ class AgentService:
                 "error": None
             }
             
-            # 编译并执行工作流
-            app = workflow.compile()
+            # 执行工作流
             final_state = await asyncio.to_thread(app.invoke, initial_state)
             
             return {
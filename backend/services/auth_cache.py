@@ -0,0 +1,160 @@
+"""
+用户身份缓存
+按 (用户 ID, 令牌哈希) 短时缓存已验证的用户身份，认证热路径无需查询数据库；
+用户被停用或修改时按用户 ID 失效，可选 Redis 后端在多个进程间共享
+"""
+
+import json
+import time
+import hashlib
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+import logging
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+class UserPrincipal:
+    """已认证用户的只读快照，字段与接口中用到的 User 属性一致"""
+
+    __slots__ = ("id", "username", "email", "full_name", "is_active", "is_superuser", "created_at")
+
+    def __init__(self, id: str, username: str, email: str = None, full_name: str = None,
+                 is_active: bool = True, is_superuser: bool = False, created_at: datetime = None):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.full_name = full_name
+        self.is_active = is_active
+        self.is_superuser = is_superuser
+        self.created_at = created_at
+
+    @classmethod
+    def from_user(cls, user) -> "UserPrincipal":
+        return cls(
+            id=user.id,
+            username=user.username,
+            email=user.email,
+            full_name=user.full_name,
+            is_active=bool(user.is_active),
+            is_superuser=bool(user.is_superuser),
+            created_at=user.created_at
+        )
+
+    def to_json(self) -> str:
+        data = {name: getattr(self, name) for name in self.__slots__}
+        if self.created_at is not None:
+            data["created_at"] = self.created_at.isoformat()
+        return json.dumps(data)
+
+    @classmethod
+    def from_json(cls, raw: str) -> "UserPrincipal":
+        data = json.loads(raw)
+        if data.get("created_at"):
+            data["created_at"] = datetime.fromisoformat(data["created_at"])
+        return cls(**data)
+
+def token_key(user_id: str, token: str) -> str:
+    """缓存键：用户 ID 前缀便于按用户失效，令牌只保存哈希"""
+    return f"{user_id}:{hashlib.sha256(token.encode('utf-8')).hexdigest()}"
+
+class MemoryPrincipalBackend:
+    """进程内缓存后端（LRU + TTL）"""
+
+    def __init__(self, max_entries: int = None):
+        self.max_entries = max_entries or settings.AUTH_CACHE_MAX_ENTRIES
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: str, ttl: int):
+        self._entries[key] = (time.time() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def delete_prefix(self, prefix: str):
+        for key in [key for key in self._entries if key.startswith(prefix)]:
+            del self._entries[key]
+
+class RedisPrincipalBackend:
+    """Redis 缓存后端，失效操作对所有进程生效"""
+
+    def __init__(self, url: str = None, prefix: str = "auth_principal:"):
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(url or settings.REDIS_URL, decode_responses=True)
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[str]:
+        try:
+            return await self.client.get(self.prefix + key)
+        except Exception as e:
+            logger.warning(f"读取 Redis 身份缓存失败: {e}")
+            return None
+
+    async def set(self, key: str, value: str, ttl: int):
+        try:
+            await self.client.set(self.prefix + key, value, ex=ttl)
+        except Exception as e:
+            logger.warning(f"写入 Redis 身份缓存失败: {e}")
+
+    async def delete_prefix(self, prefix: str):
+        try:
+            keys = [key async for key in self.client.scan_iter(match=f"{self.prefix}{prefix}*")]
+            if keys:
+                await self.client.delete(*keys)
+        except Exception as e:
+            logger.warning(f"清除 Redis 身份缓存失败: {e}")
+
+class PrincipalCache:
+    """用户身份缓存类"""
+
+    def __init__(self, backend=None, ttl: int = None):
+        if backend is None:
+            backend = RedisPrincipalBackend() if settings.AUTH_CACHE_BACKEND == "redis" else MemoryPrincipalBackend()
+        self.backend = backend
+        self.ttl = ttl or settings.AUTH_CACHE_TTL
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, user_id: str, token: str) -> Optional[UserPrincipal]:
+        raw = await self.backend.get(token_key(user_id, token))
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return UserPrincipal.from_json(raw)
+
+    async def set(self, token: str, principal: UserPrincipal, expires_at: float = None):
+        """写入缓存，TTL 不超过令牌剩余有效期"""
+        ttl = self.ttl
+        if expires_at is not None:
+            ttl = min(ttl, int(expires_at - time.time()))
+        if ttl > 0:
+            await self.backend.set(token_key(principal.id, token), principal.to_json(), ttl)
+
+    async def invalidate(self, user_id: str):
+        """清除该用户所有令牌的缓存身份（停用、修改用户后调用）"""
+        await self.backend.delete_prefix(f"{user_id}:")
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+principal_cache = PrincipalCache()
@@ -0,0 +1,304 @@
+"""
+画布协同编辑
+每个画布一个房间：服务端按到达顺序为操作编号并只广播给该画布的参与者，同时转发在线状态和光标。
+操作在内存中的文档上应用，按时间间隔或数量批量写入画布和版本历史，而不是每次编辑保存整个文档
+"""
+
+import json
+import uuid
+import asyncio
+from typing import Any, Dict, List, Optional
+import logging
+
+from fastapi import WebSocket
+from sqlalchemy import select
+
+from config import settings
+from database import AsyncSessionLocal
+from models import Canvas
+from .canvas_patch import ENTITY_OPS, PatchError, apply_patch
+from .canvas_history import write_canvas_data
+from .workflow_cache import workflow_cache
+
+logger = logging.getLogger(__name__)
+
+# 参与者光标颜色，按加入顺序轮流分配
+COLORS = ["#ef4444", "#f59e0b", "#10b981", "#3b82f6", "#8b5cf6", "#ec4899", "#14b8a6", "#f97316"]
+
+def _encode(message: Dict) -> str:
+    return json.dumps(message, ensure_ascii=False, default=str)
+
+class Participant:
+    """房间中的一个连接
+
+    消息先进入有界发送队列，由独立的任务写出，慢客户端不会阻塞房间内的其他参与者。
+    """
+
+    def __init__(self, websocket: WebSocket, user, color: str):
+        self.client_id = uuid.uuid4().hex[:12]
+        self.websocket = websocket
+        self.user_id = user.id
+        self.username = user.username
+        self.color = color
+        self.cursor: Optional[Dict] = None
+        self.closed = False
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=settings.COLLAB_SEND_QUEUE_SIZE)
+        self._writer = asyncio.create_task(self._write_loop())
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "client_id": self.client_id,
+            "user_id": self.user_id,
+            "username": self.username,
+            "color": self.color,
+            "cursor": self.cursor
+        }
+
+    def send(self, text: str, droppable: bool = False):
+        """放入发送队列；队列已满时丢弃可丢弃的消息（光标），否则断开连接，客户端重连后重新同步"""
+        if self.closed:
+            return
+        try:
+            self._queue.put_nowait(text)
+        except asyncio.QueueFull:
+            if not droppable:
+                logger.warning(f"协同客户端 {self.client_id} 发送队列已满，断开连接")
+                self.close()
+
+    async def _write_loop(self):
+        try:
+            while True:
+                await self.websocket.send_text(await self._queue.get())
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.debug(f"推送到协同客户端 {self.client_id} 失败: {e}")
+        finally:
+            self.closed = True
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self._writer.cancel()
+        # 关闭连接后读循环收到断开事件，由其调用 leave 清理
+        asyncio.create_task(self._close_websocket())
+
+    async def _close_websocket(self):
+        try:
+            await self.websocket.close(code=1013)
+        except Exception:
+            pass
+
+class CanvasRoom:
+    """单个画布的协同房间
+
+    操作的校验、应用、编号和广播之间没有 await，在事件循环中天然按到达顺序串行执行。
+    """
+
+    def __init__(self, canvas_id: str, version: int, document: Any):
+        self.canvas_id = canvas_id
+        self.version = version  # 已持久化的画布版本
+        self.document = document if document is not None else {"nodes": [], "edges": []}
+        self.seq = 0  # 操作序号，每个被接受的操作消息加一
+        self.participants: Dict[str, Participant] = {}
+        self.pending: List[Dict] = []  # 尚未持久化的操作
+        self.pending_user: Optional[str] = None
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def broadcast(self, message: Dict, exclude: str = None, droppable: bool = False):
+        """序列化一次，推送给房间内的参与者"""
+        text = _encode(message)
+        for client_id, participant in list(self.participants.items()):
+            if client_id != exclude:
+                participant.send(text, droppable)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "type": "snapshot",
+            "version": self.version,
+            "seq": self.seq,
+            "canvas_data": self.document,
+            "participants": [participant.info() for participant in self.participants.values()]
+        }
+
+    def apply(self, participant: Participant, message: Dict):
+        """应用一条操作消息并广播（发送者收到的广播即为确认）"""
+        patch = message.get("patch")
+        client_seq = message.get("client_seq")
+
+        def reject(error: str):
+            participant.send(_encode({
+                "type": "op_rejected", "client_seq": client_seq, "error": error, "seq": self.seq
+            }))
+
+        if not isinstance(patch, list) or not patch:
+            return reject("patch 必须是非空的操作列表")
+        # JSON Patch 依赖数组下标，只接受基于最新序号的提交；按 ID 的操作可直接按到达顺序应用
+        if any(not isinstance(op, dict) or op.get("op") not in ENTITY_OPS for op in patch) \
+                and message.get("base_seq") != self.seq:
+            return reject("文档已变化，请同步后重试")
+        try:
+            self.document = apply_patch(self.document, patch)
+        except PatchError as e:
+            return reject(str(e))
+
+        self.seq += 1
+        self.pending.extend(patch)
+        self.pending_user = participant.user_id
+        self.broadcast({
+            "type": "op",
+            "seq": self.seq,
+            "client_id": participant.client_id,
+            "client_seq": client_seq,
+            "patch": patch
+        })
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        # 在 _flush_later 中调用时当前任务就是 _flush_task，它即将结束，需要另建任务
+        running = self._flush_task is not None and not self._flush_task.done() \
+            and self._flush_task is not asyncio.current_task()
+        if len(self.pending) >= settings.COLLAB_FLUSH_MAX_OPS:
+            asyncio.create_task(self.flush())
+        elif not running:
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(settings.COLLAB_FLUSH_INTERVAL)
+        await self.flush()
+
+    async def flush(self):
+        """把累积的操作作为一个版本写入数据库"""
+        async with self._flush_lock:
+            for _ in range(2):
+                if not self.pending:
+                    return
+                batch, self.pending = self.pending, []
+                document, user_id, base_version = self.document, self.pending_user, self.version
+                try:
+                    async with AsyncSessionLocal() as db:
+                        saved = await write_canvas_data(
+                            db, self.canvas_id, base_version, document, patch=batch, user_id=user_id
+                        )
+                        if saved is not None:
+                            await db.commit()
+                            self.version = saved.version
+                            workflow_cache.invalidate(self.canvas_id)
+                            self.broadcast({"type": "saved", "version": saved.version, "seq": self.seq})
+                            # 写入期间到达的操作没有安排保存，需要再安排一次
+                            if self.pending:
+                                self._schedule_flush()
+                            return
+                        await db.rollback()
+                        await self._rebase(db, batch)
+                except Exception as e:
+                    logger.error(f"保存协同编辑操作失败: {e}")
+                    self.pending = batch + self.pending
+                    self._schedule_flush()
+                    return
+
+    async def _rebase(self, db, batch: List[Dict]):
+        """画布在房间外被修改（REST 保存等）：在最新版本上重放未保存的操作，并让所有参与者重新同步"""
+        row = (await db.execute(
+            select(Canvas.version, Canvas.canvas_data).where(Canvas.id == self.canvas_id)
+        )).first()
+        if row is None:
+            logger.warning(f"画布 {self.canvas_id} 已不存在，丢弃未保存的协同编辑操作")
+            self.pending = []
+            return
+        operations = batch + self.pending
+        try:
+            self.document = apply_patch(row.canvas_data or {"nodes": [], "edges": []}, operations)
+            self.pending = operations
+        except PatchError as e:
+            logger.warning(f"协同编辑操作无法在最新版本上重放，已丢弃: {e}")
+            self.document = row.canvas_data
+            self.pending = []
+        self.version = row.version
+        self.seq += 1
+        self.broadcast(self.snapshot())
+
+class CollabManager:
+    """协同编辑房间管理器"""
+
+    def __init__(self):
+        self.rooms: Dict[str, CanvasRoom] = {}
+        self._lock = asyncio.Lock()
+
+    async def _room(self, canvas_id: str) -> Optional[CanvasRoom]:
+        """获取或创建房间；画布不存在时返回 None"""
+        async with self._lock:
+            room = self.rooms.get(canvas_id)
+            if room is None:
+                async with AsyncSessionLocal() as db:
+                    row = (await db.execute(
+                        select(Canvas.version, Canvas.canvas_data).where(Canvas.id == canvas_id)
+                    )).first()
+                if row is None:
+                    return None
+                room = CanvasRoom(canvas_id, row.version, row.canvas_data)
+                self.rooms[canvas_id] = room
+            return room
+
+    async def join(self, canvas_id: str, websocket: WebSocket, user) -> Optional[Participant]:
+        """加入画布房间：向新参与者发送当前文档和在线列表，并通知其他参与者；画布不存在时返回 None"""
+        room = await self._room(canvas_id)
+        if room is None:
+            return None
+        participant = Participant(websocket, user, COLORS[len(room.participants) % len(COLORS)])
+        room.participants[participant.client_id] = participant
+        participant.send(_encode({**room.snapshot(), "client_id": participant.client_id}))
+        room.broadcast({"type": "join", **participant.info()}, exclude=participant.client_id)
+        return participant
+
+    async def leave(self, canvas_id: str, participant: Participant):
+        """离开房间；最后一个参与者离开时保存未持久化的操作并关闭房间"""
+        participant.close()
+        room = self.rooms.get(canvas_id)
+        if room is None or room.participants.pop(participant.client_id, None) is None:
+            return
+        room.broadcast({"type": "leave", "client_id": participant.client_id})
+        if not room.participants:
+            await room.flush()
+            if not room.participants and self.rooms.get(canvas_id) is room:
+                del self.rooms[canvas_id]
+
+    def handle(self, canvas_id: str, participant: Participant, message: Dict):
+        """处理客户端消息"""
+        room = self.rooms.get(canvas_id)
+        if room is None or not isinstance(message, dict):
+            return
+        kind = message.get("type")
+        if kind == "op":
+            room.apply(participant, message)
+        elif kind == "cursor":
+            participant.cursor = {"x": message.get("x"), "y": message.get("y"), "selection": message.get("selection")}
+            room.broadcast(
+                {"type": "cursor", "client_id": participant.client_id, **participant.cursor},
+                exclude=participant.client_id, droppable=True
+            )
+        elif kind == "sync":
+            participant.send(_encode(room.snapshot()))
+
+    async def external_update(self, canvas_id: str, version: int, document: Any):
+        """画布通过 REST 接口保存后同步到房间；有未保存的操作时由下次写入时的冲突处理合并"""
+        room = self.rooms.get(canvas_id)
+        if room is None or room.pending or version <= room.version:
+            return
+        room.version = version
+        room.document = document
+        room.seq += 1
+        room.broadcast(room.snapshot())
+
+    async def close(self):
+        """应用关闭时保存所有房间未持久化的操作"""
+        for room in list(self.rooms.values()):
+            await room.flush()
+            for participant in list(room.participants.values()):
+                participant.close()
+        self.rooms.clear()
+
+# 全局协同编辑管理器
+collab_manager = CollabManager()
@@ -0,0 +1,209 @@
+"""
+画布版本历史服务
+每次保存记录一个版本：每隔 CANVAS_SNAPSHOT_INTERVAL 个版本保存全量快照，其余只保存相对上一版本的补丁。
+重建任意版本最多回放 CANVAS_SNAPSHOT_INTERVAL - 1 个补丁。
+
+保留策略：后台任务定期删除早于 CANVAS_HISTORY_RETENTION_DAYS 天的增量。
+保留期内的版本都可以查看、比较和恢复；更早的历史只保留快照版本，
+其间的增量版本不再出现在版本列表中，按版本号读取时抛出 VersionCompactedError。
+"""
+
+import json
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+import logging
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from database import AsyncSessionLocal
+from models import Canvas, CanvasVersion
+from .canvas_patch import apply_patch, diff_documents
+
+logger = logging.getLogger(__name__)
+
+class VersionCompactedError(LookupError):
+    """版本的增量已按保留策略压缩，无法重建"""
+
+def _size(data: Any) -> int:
+    return len(json.dumps(data, separators=(",", ":"), default=str))
+
+async def record_version(
+    db: AsyncSession,
+    canvas_id: str,
+    version: int,
+    document: Any,
+    previous: Any = None,
+    patch: List[Dict] = None,
+    user_id: str = None
+):
+    """记录画布的新版本（加入调用方的事务，由调用方提交）
+
+    patch 为从上一版本到本版本的补丁，未提供时由 previous 计算。
+    上一版本缺失（旧数据或已被压缩）、距上次快照已满间隔或补丁过大时保存快照。
+    """
+    latest = (await db.execute(
+        select(CanvasVersion.version).where(CanvasVersion.canvas_id == canvas_id)
+        .order_by(CanvasVersion.version.desc()).limit(1)
+    )).scalar()
+    last_snapshot = await db.scalar(
+        select(func.max(CanvasVersion.version)).where(
+            CanvasVersion.canvas_id == canvas_id,
+            CanvasVersion.kind == "snapshot"
+        )
+    )
+
+    kind, data = "snapshot", document
+    chained = latest == version - 1 and last_snapshot is not None
+    if chained and version - last_snapshot < settings.CANVAS_SNAPSHOT_INTERVAL:
+        if patch is None and previous is not None:
+            patch = diff_documents(previous, document)
+        if patch is not None and _size(patch) < _size(document) * settings.CANVAS_DELTA_MAX_RATIO:
+            kind, data = "delta", patch
+
+    db.add(CanvasVersion(
+        canvas_id=canvas_id,
+        version=version,
+        kind=kind,
+        data=data,
+        size=_size(data),
+        created_by=user_id
+    ))
+
+async def write_canvas_data(
+    db: AsyncSession,
+    canvas_id: str,
+    base_version: int,
+    new_data: Any,
+    previous: Any = None,
+    patch: List[Dict] = None,
+    user_id: str = None,
+    fields: Dict[str, Any] = None
+):
+    """以 base_version 为条件更新画布数据并记录新版本（由调用方提交）
+
+    fields 为同一条 UPDATE 中一并更新的其他列（如名称、描述）。
+    返回 (version, updated_at)；读取之后若有其他写入先提交，版本不再匹配，返回 None。
+    """
+    saved = (await db.execute(
+        update(Canvas)
+        .where(Canvas.id == canvas_id, Canvas.version == base_version)
+        .values(canvas_data=new_data, version=Canvas.version + 1, **(fields or {}))
+        .returning(Canvas.version, Canvas.updated_at)
+        .execution_options(synchronize_session=False)
+    )).first()
+    if saved is None:
+        return None
+
+    await record_version(db, canvas_id, saved.version, new_data, previous=previous, patch=patch, user_id=user_id)
+    return saved
+
+async def load_version(db: AsyncSession, canvas_id: str, version: int) -> Optional[Any]:
+    """重建指定版本的画布数据：最近的快照加之后的补丁
+
+    没有记录该版本及之前的任何快照（如引入版本历史之前的版本）时返回 None；
+    快照之后的增量已被压缩时抛出 VersionCompactedError。
+    """
+    snapshot = (await db.execute(
+        select(CanvasVersion.version, CanvasVersion.data).where(
+            CanvasVersion.canvas_id == canvas_id,
+            CanvasVersion.kind == "snapshot",
+            CanvasVersion.version <= version
+        ).order_by(CanvasVersion.version.desc()).limit(1)
+    )).first()
+    if snapshot is None:
+        return None
+    if snapshot.version == version:
+        return snapshot.data
+
+    deltas = (await db.execute(
+        select(CanvasVersion.data).where(
+            CanvasVersion.canvas_id == canvas_id,
+            CanvasVersion.kind == "delta",
+            CanvasVersion.version > snapshot.version,
+            CanvasVersion.version <= version
+        ).order_by(CanvasVersion.version.asc())
+    )).scalars().all()
+    if len(deltas) != version - snapshot.version:
+        raise VersionCompactedError(version)
+
+    # 合并为一个补丁应用，只复制一次文档
+    return apply_patch(snapshot.data, [operation for delta in deltas for operation in delta])
+
+async def list_versions(
+    db: AsyncSession,
+    canvas_id: str,
+    before: Optional[int] = None,
+    limit: int = None
+) -> Dict[str, Any]:
+    """按版本号倒序列出版本元数据（不读取快照和补丁内容）；已压缩的增量版本不在列表中"""
+    limit = min(limit or settings.CANVAS_VERSION_PAGE_SIZE, settings.LIST_MAX_PAGE_SIZE)
+    query = select(
+        CanvasVersion.version,
+        CanvasVersion.kind,
+        CanvasVersion.size,
+        CanvasVersion.created_by,
+        CanvasVersion.created_at
+    ).where(CanvasVersion.canvas_id == canvas_id)
+    if before is not None:
+        query = query.where(CanvasVersion.version < before)
+
+    rows = (await db.execute(query.order_by(CanvasVersion.version.desc()).limit(limit + 1))).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    return {
+        "versions": [
+            {
+                "version": row.version,
+                "kind": row.kind,
+                "size": row.size,
+                "created_by": row.created_by,
+                "created_at": row.created_at
+            }
+            for row in rows
+        ],
+        "next_cursor": rows[-1].version if rows and has_more else None,
+        "has_more": has_more
+    }
+
+async def compact_history(db: AsyncSession, retention_days: int = None) -> int:
+    """删除过期的增量版本，返回删除条数
+
+    对每个画布，找到早于保留期的最新快照 S，删除 S 之前且早于保留期的增量。
+    S 及之后的版本仍可完整重建；更早的历史只保留快照版本。
+    """
+    retention_days = settings.CANVAS_HISTORY_RETENTION_DAYS if retention_days is None else retention_days
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+
+    snapshots = CanvasVersion.__table__.alias("snapshots")
+    keep_from = select(func.max(snapshots.c.version)).where(
+        snapshots.c.canvas_id == CanvasVersion.canvas_id,
+        snapshots.c.kind == "snapshot",
+        snapshots.c.created_at < cutoff
+    ).scalar_subquery()
+
+    result = await db.execute(
+        delete(CanvasVersion).where(
+            CanvasVersion.kind == "delta",
+            CanvasVersion.created_at < cutoff,
+            CanvasVersion.version < keep_from
+        ).execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount or 0
+
+async def run_compaction(interval: int = None):
+    """后台压缩任务，由应用生命周期启动和取消"""
+    interval = interval or settings.CANVAS_COMPACTION_INTERVAL
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with AsyncSessionLocal() as db:
+                deleted = await compact_history(db)
+            if deleted:
+                logger.info(f"画布版本历史压缩完成，删除 {deleted} 条增量")
+        except Exception as e:
+            logger.error(f"压缩画布版本历史失败: {e}")
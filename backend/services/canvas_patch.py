@@ -0,0 +1,275 @@
+"""
+画布增量补丁
+支持两类操作，可在同一补丁中混用：
+- JSON Patch（RFC 6902）：add / remove / replace / move / copy / test，路径为 JSON Pointer；
+- 按 ID 的节点和边操作：add_node / update_node / remove_node / add_edge / update_edge / remove_edge，
+  不依赖数组下标，适合多端并发编辑后的合并
+补丁整体生效或整体失败
+"""
+
+import copy
+from typing import Any, Dict, List, Optional
+
+class PatchError(ValueError):
+    """补丁格式错误或无法应用到当前文档"""
+
+JSON_PATCH_OPS = {"add", "remove", "replace", "move", "copy", "test"}
+
+# 实体操作 -> (集合字段, 动作)
+ENTITY_OPS = {
+    "add_node": ("nodes", "add"),
+    "update_node": ("nodes", "update"),
+    "remove_node": ("nodes", "remove"),
+    "add_edge": ("edges", "add"),
+    "update_edge": ("edges", "update"),
+    "remove_edge": ("edges", "remove"),
+}
+
+# JSON Pointer
+
+def _parse_pointer(path: str) -> List[str]:
+    if not isinstance(path, str) or (path and not path.startswith("/")):
+        raise PatchError(f"无效的路径: {path!r}")
+    if path == "":
+        return []
+    return [token.replace("~1", "/").replace("~0", "~") for token in path[1:].split("/")]
+
+def _index(container: list, token: str, allow_end: bool = False) -> int:
+    if token == "-" and allow_end:
+        return len(container)
+    if not token.isdigit() or (token != "0" and token.startswith("0")):
+        raise PatchError(f"无效的数组下标: {token!r}")
+    index = int(token)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise PatchError(f"数组下标越界: {index}")
+    return index
+
+def _child(container: Any, token: str) -> Any:
+    if isinstance(container, dict):
+        if token not in container:
+            raise PatchError(f"路径不存在: {token!r}")
+        return container[token]
+    if isinstance(container, list):
+        return container[_index(container, token)]
+    raise PatchError(f"无法在标量上解析路径: {token!r}")
+
+def _resolve(document: Any, tokens: List[str]) -> Any:
+    for token in tokens:
+        document = _child(document, token)
+    return document
+
+def _add(document: Any, tokens: List[str], value: Any) -> Any:
+    if not tokens:
+        return value
+    parent = _resolve(document, tokens[:-1])
+    if isinstance(parent, dict):
+        parent[tokens[-1]] = value
+    elif isinstance(parent, list):
+        parent.insert(_index(parent, tokens[-1], allow_end=True), value)
+    else:
+        raise PatchError("父路径不是对象或数组")
+    return document
+
+def _remove(document: Any, tokens: List[str]) -> Any:
+    """删除并返回目标值"""
+    if not tokens:
+        raise PatchError("不能删除文档根节点")
+    parent = _resolve(document, tokens[:-1])
+    value = _child(parent, tokens[-1])
+    if isinstance(parent, dict):
+        del parent[tokens[-1]]
+    else:
+        del parent[_index(parent, tokens[-1])]
+    return value
+
+def _apply_json_patch_op(document: Any, operation: Dict) -> Any:
+    op = operation["op"]
+    tokens = _parse_pointer(operation.get("path"))
+
+    if op in ("add", "replace", "test") and "value" not in operation:
+        raise PatchError(f"{op} 操作缺少 value")
+
+    if op == "add":
+        return _add(document, tokens, copy.deepcopy(operation["value"]))
+    if op == "remove":
+        _remove(document, tokens)
+        return document
+    if op == "replace":
+        if not tokens:
+            return copy.deepcopy(operation["value"])
+        _remove(document, tokens)
+        return _add(document, tokens, copy.deepcopy(operation["value"]))
+    if op == "test":
+        if _resolve(document, tokens) != operation["value"]:
+            raise PatchError(f"test 操作不匹配: {operation['path']}")
+        return document
+
+    source = _parse_pointer(operation.get("from"))
+    if op == "move":
+        if tokens[:len(source)] == source and tokens != source:
+            raise PatchError("不能把节点移动到它自己的子路径下")
+        return _add(document, tokens, _remove(document, source))
+    # copy
+    return _add(document, tokens, copy.deepcopy(_resolve(document, source)))
+
+# 按 ID 的实体操作
+
+def _find(items: List[Dict], item_id: str) -> Optional[int]:
+    for position, item in enumerate(items):
+        if isinstance(item, dict) and item.get("id") == item_id:
+            return position
+    return None
+
+def _apply_entity_op(document: Dict, operation: Dict) -> Dict:
+    if not isinstance(document, dict):
+        raise PatchError("画布数据不是对象")
+    field, action = ENTITY_OPS[operation["op"]]
+    items = document.setdefault(field, [])
+    if not isinstance(items, list):
+        raise PatchError(f"{field} 不是数组")
+
+    if action == "add":
+        item = operation.get("node" if field == "nodes" else "edge")
+        if not isinstance(item, dict) or "id" not in item:
+            raise PatchError(f"{operation['op']} 缺少带 id 的对象")
+        if _find(items, item["id"]) is not None:
+            raise PatchError(f"ID 已存在: {item['id']}")
+        items.append(copy.deepcopy(item))
+        return document
+
+    position = _find(items, operation.get("id"))
+    if position is None:
+        raise PatchError(f"ID 不存在: {operation.get('id')}")
+
+    if action == "update":
+        changes = operation.get("set") or {}
+        removed = operation.get("unset") or []
+        if not isinstance(changes, dict):
+            raise PatchError("set 必须是对象")
+        if not isinstance(removed, list) or not all(isinstance(key, str) for key in removed):
+            raise PatchError("unset 必须是字符串数组")
+        if "id" in changes or "id" in removed:
+            raise PatchError("不能修改 id")
+        # 替换为新对象而不是原地修改，调用方只需浅复制列表即可保证原文档不变
+        item = dict(items[position])
+        items[position] = item
+        for key, value in changes.items():
+            item[key] = copy.deepcopy(value)
+        for key in removed:
+            item.pop(key, None)
+        return document
+
+    del items[position]
+    if field == "nodes" and isinstance(document.get("edges"), list):
+        # 与前端一致：删除节点时一并删除与其相连的边（不是对象的元素原样保留）
+        document["edges"] = [
+            edge for edge in document["edges"]
+            if not isinstance(edge, dict)
+            or (edge.get("source") != operation["id"] and edge.get("target") != operation["id"])
+        ]
+    return document
+
+def _copy_for(document: Any, operations: List[Dict]) -> Any:
+    """只含按 ID 操作时只复制顶层对象和节点、边列表（实体操作不会原地修改元素），否则深复制"""
+    if isinstance(document, dict) and all(
+        isinstance(operation, dict) and operation.get("op") in ENTITY_OPS for operation in operations
+    ):
+        document = dict(document)
+        for field in ("nodes", "edges"):
+            if isinstance(document.get(field), list):
+                document[field] = list(document[field])
+        return document
+    return copy.deepcopy(document)
+
+def apply_patch(document: Any, operations: List[Dict]) -> Any:
+    """将补丁应用到文档副本上，返回新文档；任一操作失败时抛出 PatchError，原文档不变"""
+    if not isinstance(operations, list):
+        raise PatchError("补丁必须是操作列表")
+
+    document = _copy_for(document, operations)
+    for position, operation in enumerate(operations):
+        op = operation.get("op") if isinstance(operation, dict) else None
+        try:
+            if op in JSON_PATCH_OPS:
+                document = _apply_json_patch_op(document, operation)
+            elif op in ENTITY_OPS:
+                document = _apply_entity_op(document, operation)
+            else:
+                raise PatchError(f"不支持的操作: {op!r}")
+        except PatchError as e:
+            raise PatchError(f"第 {position} 个操作失败: {e}") from None
+    return document
+
+# 差异计算
+
+def _escape(token: str) -> str:
+    return token.replace("~", "~0").replace("/", "~1")
+
+def _is_entity_list(items: Any) -> bool:
+    if not isinstance(items, list):
+        return False
+    ids = [item.get("id") if isinstance(item, dict) else None for item in items]
+    return None not in ids and len(set(ids)) == len(ids)
+
+def _diff_entities(old: List[Dict], new: List[Dict], kind: str) -> Optional[Dict[str, List[Dict]]]:
+    """按 ID 比较节点或边；应用操作后顺序与 new 不一致时返回 None"""
+    old_by_id = {item["id"]: item for item in old}
+    new_ids = {item["id"] for item in new}
+    ops = {"removed": [], "added": [], "updated": []}
+
+    for item in old:
+        if item["id"] not in new_ids:
+            ops["removed"].append({"op": f"remove_{kind}", "id": item["id"]})
+    for item in new:
+        previous = old_by_id.get(item["id"])
+        if previous is None:
+            ops["added"].append({"op": f"add_{kind}", kind: item})
+            continue
+        changes = {key: value for key, value in item.items() if key != "id" and previous.get(key, ...) != value}
+        unset = [key for key in previous if key not in item]
+        if changes or unset:
+            operation = {"op": f"update_{kind}", "id": item["id"], "set": changes}
+            if unset:
+                operation["unset"] = unset
+            ops["updated"].append(operation)
+
+    # 实体操作把新增项追加到末尾，顺序对不上时改为整体替换
+    expected = [item["id"] for item in old if item["id"] in new_ids] + [op[kind]["id"] for op in ops["added"]]
+    if expected != [item["id"] for item in new]:
+        return None
+    return ops
+
+def diff_documents(old: Any, new: Any) -> List[Dict]:
+    """计算把 old 变为 new 的补丁，节点和边使用按 ID 的操作，其余字段使用 JSON Patch"""
+    if old == new:
+        return []
+    if not isinstance(old, dict) or not isinstance(new, dict):
+        return [{"op": "replace", "path": "", "value": copy.deepcopy(new)}]
+
+    entity_ops = {}
+    for field, kind in (("nodes", "node"), ("edges", "edge")):
+        if field in old and field in new and _is_entity_list(old[field]) and _is_entity_list(new[field]):
+            ops = _diff_entities(old[field], new[field], kind)
+            if ops is not None:
+                entity_ops[field] = ops
+
+    patch: List[Dict] = []
+    if entity_ops:
+        nodes = entity_ops.get("nodes", {})
+        edges = entity_ops.get("edges", {})
+        # 先处理边的删除和修改，再删节点（删节点会连带删除仍指向它的边），最后新增
+        patch.extend(edges.get("removed", []))
+        patch.extend(edges.get("updated", []))
+        patch.extend(nodes.get("removed", []))
+        patch.extend(nodes.get("added", []))
+        patch.extend(nodes.get("updated", []))
+        patch.extend(edges.get("added", []))
+
+    for key in old:
+        if key not in new:
+            patch.append({"op": "remove", "path": f"/{_escape(key)}"})
+    for key, value in new.items():
+        if key in entity_ops or old.get(key, ...) == value and key in old:
+            continue
+        patch.append({"op": "add", "path": f"/{_escape(key)}", "value": copy.deepcopy(value)})
+    return copy.deepcopy(patch)
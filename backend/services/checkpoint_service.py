@@ -0,0 +1,90 @@
+"""
+工作流检查点服务
+按节点持久化工作流执行状态，支持从失败节点恢复执行
+"""
+
+from contextvars import ContextVar
+from typing import Dict, List, Any, Optional, Set
+import logging
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import WorkflowCheckpoint
+from database import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+class RunCheckpoint:
+    """单次工作流执行的检查点
+
+    completed 保存可直接复用的节点输出；save 在节点完成或失败时立即落库，
+    使进程重启后仍能恢复。每次写入使用独立的异步会话，可被并发执行的节点同时调用。
+    """
+
+    def __init__(self, run_id: str, completed: Dict[str, Any] = None):
+        self.run_id = run_id
+        self.completed = completed or {}
+
+    async def save(self, node_id: str, output: Any = None, status: str = "completed", error: str = None):
+        """保存节点检查点"""
+        async with AsyncSessionLocal() as db:
+            try:
+                checkpoint = await db.scalar(select(WorkflowCheckpoint).where(
+                    WorkflowCheckpoint.run_id == self.run_id,
+                    WorkflowCheckpoint.node_id == node_id
+                ))
+
+                if not checkpoint:
+                    checkpoint = WorkflowCheckpoint(run_id=self.run_id, node_id=node_id)
+                    db.add(checkpoint)
+
+                checkpoint.status = status
+                checkpoint.output = output
+                checkpoint.error_message = error
+                await db.commit()
+
+            except Exception as e:
+                logger.error(f"保存检查点失败: {e}")
+                await db.rollback()
+
+# 当前执行上下文中的检查点，节点函数可直接读取
+current_checkpoint: ContextVar[Optional[RunCheckpoint]] = ContextVar("current_checkpoint", default=None)
+
+async def load_completed_outputs(db: AsyncSession, run_id: str) -> Dict[str, Any]:
+    """读取已完成节点的输出"""
+    checkpoints = (await db.scalars(select(WorkflowCheckpoint).where(
+        WorkflowCheckpoint.run_id == run_id,
+        WorkflowCheckpoint.status == "completed"
+    ))).all()
+
+    return {checkpoint.node_id: checkpoint.output for checkpoint in checkpoints}
+
+def nodes_to_rerun(canvas_data: Dict, completed_ids: Set[str],
+                   checkpointed_types: Optional[Set[str]] = None) -> Set[str]:
+    """计算需要重新执行的节点：未完成的节点及其全部下游节点
+
+    checkpointed_types 为会单独执行并保存检查点的节点类型（None 表示全部节点）；
+    其他类型的节点（如 CrewAI 中只提供配置的 Agent 节点）永远没有检查点，不作为重新执行的起点。
+    """
+    nodes = canvas_data.get("nodes", [])
+    edges = canvas_data.get("edges", [])
+
+    downstream: Dict[str, List[str]] = {}
+    for edge in edges:
+        downstream.setdefault(edge["source"], []).append(edge["target"])
+
+    rerun = set()
+    stack = [
+        node["id"] for node in nodes
+        if node["id"] not in completed_ids
+        and (checkpointed_types is None or node.get("type") in checkpointed_types)
+    ]
+    while stack:
+        node_id = stack.pop()
+        if node_id in rerun:
+            continue
+        rerun.add(node_id)
+        stack.extend(downstream.get(node_id, []))
+
+    return rerun
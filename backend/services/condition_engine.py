@@ -0,0 +1,277 @@
+"""
+条件表达式引擎
+LangGraph 条件节点使用的小型表达式语言：解析一次并编译为闭包，
+支持比较、布尔逻辑和对 state.data 的路径查找，不执行任意代码
+
+语法示例:
+    state.data.score >= 0.8 and state.data.label != "spam"
+    data.review.status in ["approved", "merged"] or not data.flags[0]
+    len(results) > 3 && exists(data.summary)
+    data.delta > -0.5
+"""
+
+import ast
+import re
+from functools import lru_cache
+from typing import Any, Callable, List, Optional, Tuple
+
+class ConditionSyntaxError(ValueError):
+    """条件表达式语法错误"""
+
+_TOKEN_RE = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<number>\d+\.\d*|\.\d+|\d+)
+  | (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+  | (?P<op>==|!=|<=|>=|&&|\|\||[<>!()\[\].,-])
+  | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+""", re.VERBOSE)
+
+_CONSTANTS = {"true": True, "false": False, "null": None,
+              "True": True, "False": False, "None": None}
+_COMPARISONS = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a is not None and b is not None and a < b,
+    "<=": lambda a, b: a is not None and b is not None and a <= b,
+    ">": lambda a, b: a is not None and b is not None and a > b,
+    ">=": lambda a, b: a is not None and b is not None and a >= b,
+    "in": lambda a, b: b is not None and a in b,
+    "not in": lambda a, b: b is None or a not in b,
+}
+_FUNCTIONS = {
+    "len": lambda value: len(value) if value is not None else 0,
+    "exists": lambda value: value is not None,
+    "lower": lambda value: str(value).lower() if value is not None else None,
+}
+# 路径根：state 指向整个状态，data / results 是 state.data / state.results 的简写
+_ROOTS = ("state", "data", "results")
+# 非 dict 的状态对象上允许读取的属性，其余属性（包括 __class__ 等）一律不可访问
+_STATE_FIELDS = frozenset(("data", "results", "error", "current_step"))
+
+def _tokenize(source: str) -> List[Tuple[str, str]]:
+    tokens, pos = [], 0
+    while pos < len(source):
+        match = _TOKEN_RE.match(source, pos)
+        if match is None:
+            raise ConditionSyntaxError(f"无法识别的字符 {source[pos]!r}（位置 {pos}）")
+        pos = match.end()
+        if match.lastgroup != "ws":
+            tokens.append((match.lastgroup, match.group()))
+    return tokens
+
+def _lookup(value: Any, key: Any) -> Any:
+    """按键、下标或状态字段取值，缺失时返回 None"""
+    if value is None:
+        return None
+    if isinstance(value, dict):
+        return value.get(key)
+    if isinstance(value, (list, tuple)):
+        if isinstance(key, int) and -len(value) <= key < len(value):
+            return value[key]
+        return None
+    if key in _STATE_FIELDS:
+        return getattr(value, key, None)
+    return None
+
+def _negate(value: Any) -> Any:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return -value
+    return None
+
+class _Parser:
+    """递归下降解析器，直接生成闭包
+
+    每个节点编译为 (fn, constant)，constant 表示不依赖状态，可在编译期折叠。
+    """
+
+    def __init__(self, source: str):
+        self.source = source
+        self.tokens = _tokenize(source)
+        self.pos = 0
+        self.paths: List[str] = []
+
+    def _peek(self, offset: int = 0) -> Optional[Tuple[str, str]]:
+        index = self.pos + offset
+        return self.tokens[index] if index < len(self.tokens) else None
+
+    def _accept(self, *values: str) -> Optional[str]:
+        token = self._peek()
+        if token is not None and token[1] in values and token[0] in ("op", "name"):
+            self.pos += 1
+            return token[1]
+        return None
+
+    def _expect(self, value: str):
+        if self._accept(value) is None:
+            token = self._peek()
+            raise ConditionSyntaxError(f"缺少 {value!r}，实际为 {token[1] if token else '表达式结尾'!r}")
+
+    @staticmethod
+    def _fold(fn: Callable, constant: bool) -> Tuple[Callable, bool]:
+        if constant:
+            value = fn(None)
+            return (lambda state: value), True
+        return fn, False
+
+    def parse(self) -> Tuple[Callable, bool]:
+        if not self.tokens:
+            raise ConditionSyntaxError("条件表达式为空")
+        node = self._or()
+        if self._peek() is not None:
+            raise ConditionSyntaxError(f"多余的内容: {self._peek()[1]!r}")
+        return node
+
+    def _or(self):
+        left, constant = self._and()
+        while self._accept("or", "||"):
+            right, right_constant = self._and()
+            left = (lambda l, r: lambda state: bool(l(state)) or bool(r(state)))(left, right)
+            constant = constant and right_constant
+        return self._fold(left, constant)
+
+    def _and(self):
+        left, constant = self._not()
+        while self._accept("and", "&&"):
+            right, right_constant = self._not()
+            left = (lambda l, r: lambda state: bool(l(state)) and bool(r(state)))(left, right)
+            constant = constant and right_constant
+        return left, constant
+
+    def _not(self):
+        if self._accept("not", "!"):
+            operand, constant = self._not()
+            return (lambda state: not operand(state)), constant
+        return self._comparison()
+
+    def _comparison(self):
+        left, constant = self._operand()
+        token = self._peek()
+        if token is None:
+            return left, constant
+
+        if token[1] == "not" and self._peek(1) == ("name", "in"):
+            self.pos += 2
+            op = "not in"
+        elif token[0] in ("op", "name") and token[1] in _COMPARISONS:
+            self.pos += 1
+            op = token[1]
+        else:
+            return left, constant
+
+        right, right_constant = self._operand()
+        compare = _COMPARISONS[op]
+
+        def fn(state):
+            try:
+                return compare(left(state), right(state))
+            except TypeError:
+                # 类型不可比较（如字符串与数字）视为不满足
+                return False
+        return fn, constant and right_constant
+
+    def _operand(self):
+        token = self._peek()
+        if token is None:
+            raise ConditionSyntaxError("表达式不完整")
+        kind, text = token
+
+        if kind == "number":
+            self.pos += 1
+            value = float(text) if "." in text else int(text)
+            return (lambda state: value), True
+        if self._accept("-"):
+            operand, constant = self._operand()
+            return self._fold(lambda state: _negate(operand(state)), constant)
+        if kind == "string":
+            self.pos += 1
+            value = ast.literal_eval(text)
+            return (lambda state: value), True
+        if self._accept("("):
+            node = self._or()
+            self._expect(")")
+            return node
+        if self._accept("["):
+            items = []
+            if not self._accept("]"):
+                items.append(self._or())
+                while self._accept(","):
+                    items.append(self._or())
+                self._expect("]")
+            fns = [item[0] for item in items]
+            return (lambda state: [fn(state) for fn in fns]), all(item[1] for item in items)
+        if kind == "name":
+            if text in _CONSTANTS:
+                self.pos += 1
+                value = _CONSTANTS[text]
+                return (lambda state: value), True
+            if text in _FUNCTIONS and self._peek(1) == ("op", "("):
+                self.pos += 2
+                argument, constant = self._or()
+                self._expect(")")
+                function = _FUNCTIONS[text]
+                return (lambda state: function(argument(state))), constant
+            if text in _ROOTS:
+                return self._path()
+            raise ConditionSyntaxError(f"未知的名称 {text!r}，路径须以 {'/'.join(_ROOTS)} 开头")
+        raise ConditionSyntaxError(f"意外的符号 {text!r}")
+
+    def _path(self):
+        """解析路径，如 state.data.items[0]["name"]"""
+        root = self.tokens[self.pos][1]
+        self.pos += 1
+        keys: List[Any] = [] if root == "state" else [root]
+
+        while True:
+            if self._accept("."):
+                token = self._peek()
+                if token is None or token[0] != "name":
+                    raise ConditionSyntaxError("'.' 之后需要字段名")
+                if token[1].startswith("_"):
+                    raise ConditionSyntaxError(f"不能访问以下划线开头的字段 {token[1]!r}")
+                self.pos += 1
+                keys.append(token[1])
+            elif self._accept("["):
+                token = self._peek()
+                if token is None or token[0] not in ("number", "string"):
+                    raise ConditionSyntaxError("'[' 中只能是整数下标或字符串键")
+                self.pos += 1
+                keys.append(int(token[1]) if token[0] == "number" else ast.literal_eval(token[1]))
+                self._expect("]")
+            else:
+                break
+
+        self.paths.append(".".join(str(key) for key in keys) or "state")
+        keys = tuple(keys)
+
+        def fn(state):
+            value = state
+            for key in keys:
+                value = _lookup(value, key)
+            return value
+        return fn, False
+
+class CompiledCondition:
+    """编译后的条件表达式"""
+
+    __slots__ = ("source", "paths", "constant", "_fn")
+
+    def __init__(self, source: str, fn: Callable, paths: List[str], constant: bool):
+        self.source = source
+        self.paths = tuple(paths)  # 表达式读取的状态路径
+        self.constant = constant  # 不依赖状态，结果可在编译期确定（静态路由）
+        self._fn = fn
+
+    def evaluate(self, state: Any) -> bool:
+        return bool(self._fn(state))
+
+    __call__ = evaluate
+
+    def __repr__(self) -> str:
+        return f"CompiledCondition({self.source!r})"
+
+@lru_cache(maxsize=1024)
+def compile_condition(source: str) -> CompiledCondition:
+    """解析并编译条件表达式，相同表达式只编译一次"""
+    parser = _Parser(source.strip())
+    fn, constant = parser.parse()
+    return CompiledCondition(source, fn, parser.paths, constant)
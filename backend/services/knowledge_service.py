@@ -14,7 +14,9 @@ from chromadb.config import Settings
 import PyPDF2
 import docx2txt
 from sentence_transformers import SentenceTransformer
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 
 from config import settings
 from models import KnowledgeSource
@@ -62,16 +64,20 @@ class KnowledgeService:
             logger.error(f"删除集合失败: {e}")
             return False
     
-    async def process_file_source(self, source_id: str, db: Session):
+    async def process_file_source(self, source_id: str, db: AsyncSession):
         """处理文件源"""
-        source = db.query(KnowledgeSource).filter(KnowledgeSource.id == source_id).first()
+        source = await db.scalar(
+            select(KnowledgeSource)
+            .options(selectinload(KnowledgeSource.knowledge_base))
+            .where(KnowledgeSource.id == source_id)
+        )
         if not source:
             raise ValueError("知识源不存在")
         
         try:
             # 更新处理状态
             source.processing_status = "processing"
-            db.commit()
+            await db.commit()
             
             # 提取文档文本
             text_content = await self._extract_text_from_file(source.file_path)
@@ -96,14 +102,14 @@ class KnowledgeService:
             # 更新处理状态
             source.processing_status = "completed"
             source.chunk_count = len(chunks)
-            db.commit()
+            await db.commit()
             
             logger.info(f"文件处理完成: {source.name}, 生成 {len(chunks)} 个块")
             
         except Exception as e:
             logger.error(f"文件处理失败: {e}")
             source.processing_status = "failed"
-            db.commit()
+            await db.commit()
             raise
     
     async def _extract_text_from_file(self, file_path: str) -> str:
@@ -233,6 +239,10 @@ class KnowledgeService:
         
         return await asyncio.to_thread(encode)
     
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """生成文本嵌入向量（供 Agent 记忆等其他服务复用）"""
+        return await self._generate_embeddings(texts)
+    
     async def search(self, collection_name: str, query: str, n_results: int = 5) -> List[Dict]:
         """在知识库中搜索"""
         try:
@@ -0,0 +1,227 @@
+"""
+LLM 响应缓存服务
+按 (模型, 参数, 提示词哈希) 缓存 LLM 响应，支持 TTL 和容量上限，
+可选 Redis 后端和基于嵌入向量的语义近似匹配
+"""
+
+import json
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Dict, List, Any, Optional, Tuple
+import logging
+
+import numpy as np
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+class CacheUsage:
+    """单次工作流执行的缓存命中统计"""
+
+    def __init__(self, workflow_id: str = None):
+        self.workflow_id = workflow_id
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        total = self.hits + self.semantic_hits + self.misses
+        return {
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.semantic_hits) / total if total else 0.0
+        }
+
+# 当前执行上下文的缓存统计，由 WorkflowService 设置
+current_cache_usage: ContextVar[Optional[CacheUsage]] = ContextVar("current_cache_usage", default=None)
+
+class MemoryCacheBackend:
+    """内存缓存后端（LRU + TTL）"""
+
+    def __init__(self, max_entries: int = None):
+        self.max_entries = max_entries or settings.LLM_CACHE_MAX_ENTRIES
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: str, ttl: int):
+        self._entries[key] = (time.time() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+class RedisCacheBackend:
+    """Redis 缓存后端，容量上限由 Redis 的 maxmemory 淘汰策略控制"""
+
+    def __init__(self, url: str = None, prefix: str = "llm_cache:"):
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(url or settings.REDIS_URL, decode_responses=True)
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[str]:
+        try:
+            return await self.client.get(self.prefix + key)
+        except Exception as e:
+            logger.warning(f"读取 Redis 缓存失败: {e}")
+            return None
+
+    async def set(self, key: str, value: str, ttl: int):
+        try:
+            await self.client.set(self.prefix + key, value, ex=ttl)
+        except Exception as e:
+            logger.warning(f"写入 Redis 缓存失败: {e}")
+
+class _ScopeVectors:
+    """单个作用域的嵌入矩阵，按需倍增容量，写满后循环覆盖最早的条目"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.matrix: Optional[np.ndarray] = None
+        self.keys: List[str] = []
+        self.size = 0
+        self._next = 0
+
+    def add(self, vector: np.ndarray, key: str):
+        if self.matrix is None:
+            self.matrix = np.empty((min(16, self.max_entries), vector.shape[0]), dtype=np.float32)
+        elif self.size == len(self.matrix) and self.size < self.max_entries:
+            grown = np.empty((min(self.size * 2, self.max_entries), self.matrix.shape[1]), dtype=np.float32)
+            grown[:self.size] = self.matrix
+            self.matrix = grown
+
+        self.matrix[self._next] = vector
+        if self._next < len(self.keys):
+            self.keys[self._next] = key
+        else:
+            self.keys.append(key)
+        self.size = max(self.size, self._next + 1)
+        self._next = (self._next + 1) % self.max_entries
+
+class SemanticIndex:
+    """提示词嵌入索引，用于查找相似提示词对应的缓存键"""
+
+    def __init__(self, threshold: float = None, max_entries: int = None):
+        self.threshold = threshold or settings.LLM_CACHE_SEMANTIC_THRESHOLD
+        self.max_entries = max_entries or settings.LLM_CACHE_MAX_ENTRIES
+        self._entries: Dict[str, _ScopeVectors] = {}
+        self._model = None
+
+    def _encode(self, text: str) -> np.ndarray:
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(settings.LLM_CACHE_EMBEDDING_MODEL)
+        vector = self._model.encode([text])[0]
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    async def embed(self, text: str) -> np.ndarray:
+        return await asyncio.to_thread(self._encode, text)
+
+    def add(self, scope: str, vector: np.ndarray, key: str):
+        entries = self._entries.get(scope)
+        if entries is None:
+            entries = self._entries[scope] = _ScopeVectors(self.max_entries)
+        entries.add(vector, key)
+
+    def lookup(self, scope: str, vector: np.ndarray) -> Optional[str]:
+        """返回相似度超过阈值的最相近条目的缓存键（直接使用预分配的矩阵，不逐次拼接）"""
+        entries = self._entries.get(scope)
+        if not entries or not entries.size:
+            return None
+        similarities = entries.matrix[:entries.size] @ vector
+        best = int(np.argmax(similarities))
+        if similarities[best] >= self.threshold:
+            return entries.keys[best]
+        return None
+
+class LLMResponseCache:
+    """LLM 响应缓存类"""
+
+    def __init__(self, backend=None, semantic: bool = None, ttl: int = None):
+        if backend is None:
+            backend = RedisCacheBackend() if settings.LLM_CACHE_BACKEND == "redis" else MemoryCacheBackend()
+        self.backend = backend
+        self.ttl = ttl or settings.LLM_CACHE_TTL
+        semantic = settings.LLM_CACHE_SEMANTIC if semantic is None else semantic
+        self.semantic_index = SemanticIndex() if semantic else None
+        # 按最近使用淘汰，避免统计随工作流数量无限增长
+        self.workflow_usage: "OrderedDict[str, CacheUsage]" = OrderedDict()
+        self.total = CacheUsage()
+
+    @staticmethod
+    def scope_key(model_config: Dict, stop: List[str], params: Dict) -> str:
+        """模型和参数部分的键"""
+        raw = json.dumps([model_config, stop, params], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def entry_key(scope: str, prompt: str) -> str:
+        return f"{scope}:{hashlib.sha256(prompt.encode('utf-8')).hexdigest()}"
+
+    def _record(self, kind: str):
+        usages = [self.total]
+        usage = current_cache_usage.get()
+        if usage is not None:
+            usages.append(usage)
+            if usage.workflow_id:
+                usages.append(self._workflow_usage(usage.workflow_id))
+        for item in usages:
+            setattr(item, kind, getattr(item, kind) + 1)
+
+    def _workflow_usage(self, workflow_id: str) -> CacheUsage:
+        usage = self.workflow_usage.get(workflow_id)
+        if usage is None:
+            usage = self.workflow_usage[workflow_id] = CacheUsage(workflow_id)
+            while len(self.workflow_usage) > settings.LLM_CACHE_MAX_WORKFLOW_STATS:
+                self.workflow_usage.popitem(last=False)
+        self.workflow_usage.move_to_end(workflow_id)
+        return usage
+
+    async def get(self, scope: str, prompt: str) -> Optional[str]:
+        """查找缓存；精确匹配未命中时按语义相似度查找"""
+        value = await self.backend.get(self.entry_key(scope, prompt))
+        if value is not None:
+            self._record("hits")
+            return value
+
+        if self.semantic_index is not None:
+            key = self.semantic_index.lookup(scope, await self.semantic_index.embed(prompt))
+            if key is not None:
+                value = await self.backend.get(key)
+                if value is not None:
+                    self._record("semantic_hits")
+                    return value
+
+        self._record("misses")
+        return None
+
+    async def set(self, scope: str, prompt: str, value: str):
+        """写入缓存"""
+        key = self.entry_key(scope, prompt)
+        await self.backend.set(key, value, self.ttl)
+        if self.semantic_index is not None:
+            self.semantic_index.add(scope, await self.semantic_index.embed(prompt), key)
+
+    def stats(self) -> Dict[str, Any]:
+        """总体及各工作流的命中率"""
+        return {
+            "total": self.total.to_dict(),
+            "workflows": {
+                workflow_id: usage.to_dict()
+                for workflow_id, usage in self.workflow_usage.items()
+            }
+        }
@@ -0,0 +1,460 @@
+"""
+LLM 网关服务
+基于 httpx 的原生异步 LLM 客户端，复用 HTTP/2 长连接，
+按后端限制并发（按优先级排队）并统计排队深度、延迟等指标，
+合并并发的相同确定性请求
+"""
+
+import json
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, List, Any, Optional, Tuple
+import logging
+
+import httpx
+
+from config import settings
+from .llm_scheduler import PRIORITIES, PriorityLimiter, QueueStats, current_llm_priority
+
+logger = logging.getLogger(__name__)
+
+class LLMBackendError(Exception):
+    """LLM 后端调用失败"""
+
+# 请求未发出（连接失败、连接池超时）或后端明确表示暂时不可用时才重试；
+# 读取超时不重试，后端可能仍在生成，重试只会加倍负载
+_RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+_RETRYABLE_STATUS = (429, 502, 503, 504)
+_MAX_RETRY_DELAY = 30.0
+
+class LLMBackend:
+    """单个 LLM 后端：连接池、优先级并发限制和指标"""
+
+    def __init__(self, name: str, base_url: str, max_concurrency: int,
+                 headers: Dict[str, str] = None, transport: httpx.AsyncBaseTransport = None):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.max_concurrency = max_concurrency
+        self.headers = headers or {}
+        self.transport = transport
+        self.limiter = PriorityLimiter(max_concurrency)
+        self._client: Optional[httpx.AsyncClient] = None
+
+        # 指标
+        self.queued = 0
+        self.max_queue_depth = 0
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.retries = 0
+        self.total_latency = 0.0
+        self.total_queue_time = 0.0
+        self.queue_stats = QueueStats()
+        self.coalesced = 0  # 合并到进行中请求的次数
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """延迟创建客户端，确保绑定到当前事件循环"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self.headers,
+                http2=settings.LLM_HTTP2 and self.transport is None,
+                timeout=httpx.Timeout(settings.LLM_REQUEST_TIMEOUT, connect=10.0),
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency,
+                    keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY
+                ),
+                transport=self.transport
+            )
+        return self._client
+
+    async def _acquire(self, model: str = None) -> Tuple[float, float]:
+        """按当前优先级等待并发名额，返回 (开始执行的时间, 排队时间)"""
+        priority = current_llm_priority.get()
+        enqueued_at = time.perf_counter()
+        self.queued += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queued)
+        try:
+            await self.limiter.acquire(PRIORITIES.get(priority, 0), model)
+        finally:
+            self.queued -= 1
+
+        started_at = time.perf_counter()
+        queue_time = started_at - enqueued_at
+        self.total_queue_time += queue_time
+        self.queue_stats.record(priority, queue_time)
+        self.in_flight += 1
+        self.requests += 1
+        return started_at, queue_time
+
+    def _release(self, started_at: float, model: str = None):
+        self.total_latency += time.perf_counter() - started_at
+        self.in_flight -= 1
+        self.limiter.release(model)
+
+    def _wrap_error(self, e: httpx.HTTPError) -> LLMBackendError:
+        self.errors += 1
+        if isinstance(e, httpx.TimeoutException):
+            self.timeouts += 1
+            return LLMBackendError(f"{self.name} 请求超时: {e}")
+        return LLMBackendError(f"{self.name} 请求失败: {e}")
+
+    @staticmethod
+    def _retry_delay(e: httpx.HTTPError, attempt: int) -> Optional[float]:
+        """可重试时返回等待时间，否则返回 None；429/503 的 Retry-After（秒）优先"""
+        if attempt >= settings.LLM_MAX_RETRIES:
+            return None
+        delay = settings.LLM_RETRY_BACKOFF * 2 ** attempt
+        if isinstance(e, httpx.HTTPStatusError):
+            if e.response.status_code not in _RETRYABLE_STATUS:
+                return None
+            try:
+                delay = max(delay, float(e.response.headers.get("retry-after", 0)))
+            except ValueError:
+                pass
+        elif not isinstance(e, _RETRYABLE_ERRORS):
+            return None
+        return min(delay, _MAX_RETRY_DELAY)
+
+    async def post(self, path: str, payload: Dict, timeout: float = None) -> Dict:
+        """在并发限制下发送请求"""
+        return (await self.post_timed(path, payload, timeout))[0]
+
+    async def post_timed(self, path: str, payload: Dict, timeout: float = None) -> Tuple[Dict, float]:
+        """在并发限制下发送请求，同时返回该请求的排队时间
+
+        可重试的失败在退避后重新排队，等待期间不占用并发名额。
+        """
+        model = payload.get("model")
+        attempt = 0
+        while True:
+            started_at, queue_time = await self._acquire(model)
+            try:
+                response = await self.client.post(
+                    path,
+                    json=payload,
+                    timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT
+                )
+                response.raise_for_status()
+                return response.json(), queue_time
+            except httpx.HTTPError as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise self._wrap_error(e) from e
+            finally:
+                self._release(started_at, model)
+            self.retries += 1
+            attempt += 1
+            logger.warning(f"{self.name} 请求失败，{delay:.1f}s 后第 {attempt} 次重试")
+            await asyncio.sleep(delay)
+
+    async def stream_lines(self, path: str, payload: Dict, timeout: float = None) -> AsyncIterator[str]:
+        """在并发限制下发送流式请求，逐行返回响应内容
+
+        只有在收到任何内容之前失败才重试，已经输出的部分不会重复。
+        """
+        model = payload.get("model")
+        attempt = 0
+        while True:
+            started_at, _ = await self._acquire(model)
+            received = False
+            try:
+                async with self.client.stream(
+                    "POST",
+                    path,
+                    json=payload,
+                    timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT
+                ) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if line:
+                            received = True
+                            yield line
+                return
+            except httpx.HTTPError as e:
+                delay = None if received else self._retry_delay(e, attempt)
+                if delay is None:
+                    raise self._wrap_error(e) from e
+            finally:
+                self._release(started_at, model)
+            self.retries += 1
+            attempt += 1
+            logger.warning(f"{self.name} 流式请求失败，{delay:.1f}s 后第 {attempt} 次重试")
+            await asyncio.sleep(delay)
+
+    def metrics(self) -> Dict[str, Any]:
+        """后端指标"""
+        completed = self.requests - self.in_flight
+        return {
+            "base_url": self.base_url,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queued,
+            "max_queue_depth": self.max_queue_depth,
+            "requests": self.requests,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "retries": self.retries,
+            "avg_latency": self.total_latency / completed if completed else 0.0,
+            "avg_queue_time": self.total_queue_time / self.requests if self.requests else 0.0,
+            "queue_by_priority": self.queue_stats.to_dict(),
+            "coalesced": self.coalesced
+        }
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+class LLMGateway:
+    """LLM 网关类
+
+    为 Ollama 和 OpenAI 兼容接口各维护一个连接池和优先级并发限制。
+    可通过 transports 注入 httpx 传输层，便于对接本地模拟服务。
+
+    llm_config 可指定 base_url，但只允许 LLM_ALLOWED_BASE_URLS 中的地址；
+    自定义地址不会带上默认后端的认证头，需要认证时由 llm_config 的 api_key 提供。
+
+    Ollama 没有批量生成接口：并发请求按优先级和模型分组排队，由 Ollama 在服务端
+    并行处理（OLLAMA_NUM_PARALLEL）；参数确定（temperature 为 0 或指定 seed）的相同请求
+    合并为一次调用。
+    """
+
+    def __init__(self, transports: Dict[str, httpx.AsyncBaseTransport] = None):
+        transports = transports or {}
+        self.backends: Dict[str, LLMBackend] = {
+            "ollama": LLMBackend(
+                "ollama",
+                settings.OLLAMA_BASE_URL,
+                settings.LLM_MAX_CONCURRENCY_OLLAMA,
+                transport=transports.get("ollama")
+            ),
+            "openai": LLMBackend(
+                "openai",
+                settings.OPENAI_BASE_URL,
+                settings.LLM_MAX_CONCURRENCY_OPENAI,
+                headers={"Authorization": f"Bearer {settings.OPENAI_API_KEY}"},
+                transport=transports.get("openai")
+            )
+        }
+        try:
+            self.loop: Optional[asyncio.AbstractEventLoop] = asyncio.get_running_loop()
+        except RuntimeError:
+            self.loop = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # 自定义地址的后端，按最近使用排序
+        self._custom: "OrderedDict[str, LLMBackend]" = OrderedDict()
+        self._allowed_urls = {url.rstrip("/") for url in settings.LLM_ALLOWED_BASE_URLS}
+
+    def backend(self, kind: str, base_url: str = None, api_key: str = None) -> LLMBackend:
+        """获取后端；base_url 与默认地址不同时按地址（和 api_key）单独建立连接池"""
+        if kind not in ("ollama", "openai"):
+            raise ValueError(f"未知的 LLM 后端: {kind}")
+
+        default = self.backends[kind]
+        base_url = base_url.rstrip("/") if base_url else None
+        if (not base_url or base_url == default.base_url) and not api_key:
+            return default
+
+        base_url = base_url or default.base_url
+        if base_url != default.base_url and base_url not in self._allowed_urls:
+            raise LLMBackendError(f"不允许的 LLM 地址: {base_url}")
+
+        name = f"{kind}@{base_url}"
+        if api_key:
+            name += f"#{hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:8]}"
+        backend = self._custom.get(name)
+        if backend is None:
+            # 不复制默认后端的认证头，避免把服务端的密钥发往其他地址
+            backend = LLMBackend(
+                name,
+                base_url,
+                default.max_concurrency,
+                headers={"Authorization": f"Bearer {api_key}"} if api_key else None,
+                transport=default.transport
+            )
+            self._custom[name] = backend
+            self.backends[name] = backend
+            self._evict_custom()
+        self._custom.move_to_end(name)
+        return backend
+
+    def _evict_custom(self):
+        """自定义后端超出上限时关闭最久未用的空闲后端（有请求在途的保留）"""
+        for name in list(self._custom):
+            if len(self._custom) <= settings.LLM_MAX_CUSTOM_BACKENDS:
+                return
+            backend = self._custom[name]
+            if backend.in_flight or backend.queued:
+                continue
+            del self._custom[name]
+            del self.backends[name]
+            asyncio.ensure_future(backend.aclose())
+
+    async def generate(self, prompt: str, **kwargs) -> str:
+        """生成文本"""
+        return (await self.complete(prompt, **kwargs))["text"]
+
+    async def complete(self, prompt: str, model: str = None, backend: str = None, base_url: str = None,
+                       api_key: str = None, stop: List[str] = None, timeout: float = None,
+                       **params) -> Dict[str, Any]:
+        """生成文本并返回 token 用量"""
+        kind = backend or settings.DEFAULT_LLM_BACKEND
+        target = self.backend(kind, base_url, api_key)
+
+        # 记录网关所在的事件循环，供同步调用桥接
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+
+        if kind == "ollama":
+            return await self._complete_ollama(target, prompt, model, stop, timeout, params)
+        return await self._complete_openai(target, prompt, model, stop, timeout, params)
+
+    async def _complete_ollama(self, target: LLMBackend, prompt: str, model: str,
+                               stop: List[str], timeout: float, params: Dict) -> Dict[str, Any]:
+        options = dict(params)
+        if stop:
+            options["stop"] = stop
+        payload = {
+            "model": model or settings.DEFAULT_LLM_MODEL,
+            "prompt": prompt,
+            "stream": False,
+            "options": options
+        }
+
+        if not (settings.LLM_COALESCE_IDENTICAL and self._deterministic(options)):
+            return await self._request_ollama(target, payload, timeout)
+
+        key = json.dumps([target.name, payload], sort_keys=True, default=str)
+        future = self._inflight.get(key)
+        if future is not None:
+            target.coalesced += 1
+            result = await asyncio.shield(future)
+            return {**result, "queue_time": 0.0, "coalesced": True}
+
+        future = asyncio.ensure_future(self._request_ollama(target, payload, timeout))
+        self._inflight[key] = future
+        future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield：某个调用方被取消时不影响合并到该请求的其他调用方
+        return await asyncio.shield(future)
+
+    @staticmethod
+    def _deterministic(options: Dict) -> bool:
+        return options.get("temperature") == 0 or options.get("seed") is not None
+
+    async def _request_ollama(self, target: LLMBackend, payload: Dict, timeout: float) -> Dict[str, Any]:
+        data, queue_time = await target.post_timed("/api/generate", payload, timeout)
+        return {
+            "text": data.get("response", ""),
+            "prompt_tokens": data.get("prompt_eval_count", 0),
+            "completion_tokens": data.get("eval_count", 0),
+            "queue_time": queue_time
+        }
+
+    async def _complete_openai(self, target: LLMBackend, prompt: str, model: str,
+                               stop: List[str], timeout: float, params: Dict) -> Dict[str, Any]:
+        payload = {
+            "model": model or settings.OPENAI_DEFAULT_MODEL,
+            "messages": [{"role": "user", "content": prompt}],
+            **params
+        }
+        if stop:
+            payload["stop"] = stop
+        data, queue_time = await target.post_timed("/chat/completions", payload, timeout)
+        usage = data.get("usage") or {}
+        return {
+            "text": data["choices"][0]["message"]["content"],
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+            "queue_time": queue_time
+        }
+
+    async def stream(self, prompt: str, model: str = None, backend: str = None, base_url: str = None,
+                     api_key: str = None, stop: List[str] = None, timeout: float = None,
+                     **params) -> AsyncIterator[Dict[str, Any]]:
+        """流式生成文本
+
+        逐个返回 {"text": ...}，最后返回带 token 用量的 {"done": True, ...}。
+        """
+        kind = backend or settings.DEFAULT_LLM_BACKEND
+        target = self.backend(kind, base_url, api_key)
+
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+
+        if kind == "ollama":
+            options = dict(params)
+            if stop:
+                options["stop"] = stop
+            lines = target.stream_lines("/api/generate", {
+                "model": model or settings.DEFAULT_LLM_MODEL,
+                "prompt": prompt,
+                "stream": True,
+                "options": options
+            }, timeout)
+            async for line in lines:
+                data = json.loads(line)
+                if data.get("response"):
+                    yield {"text": data["response"]}
+                if data.get("done"):
+                    yield {
+                        "done": True,
+                        "prompt_tokens": data.get("prompt_eval_count", 0),
+                        "completion_tokens": data.get("eval_count", 0)
+                    }
+            return
+
+        payload = {
+            "model": model or settings.OPENAI_DEFAULT_MODEL,
+            "messages": [{"role": "user", "content": prompt}],
+            "stream": True,
+            **params
+        }
+        if stop:
+            payload["stop"] = stop
+        chunks = 0
+        async for line in target.stream_lines("/chat/completions", payload, timeout):
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            choices = json.loads(data).get("choices") or [{}]
+            text = (choices[0].get("delta") or {}).get("content")
+            if text:
+                chunks += 1
+                yield {"text": text}
+        # 流式接口不一定返回用量，以分片数近似输出 token 数
+        yield {"done": True, "prompt_tokens": 0, "completion_tokens": chunks}
+
+    def run_sync(self, coro):
+        """供同步框架（CrewAI 等在工作线程中）调用，协程仍在网关的事件循环上执行"""
+        if self.loop is None or not self.loop.is_running():
+            coro.close()
+            raise LLMBackendError("LLM 网关的事件循环未运行")
+        try:
+            in_loop_thread = asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            in_loop_thread = False
+        if in_loop_thread:
+            coro.close()
+            raise LLMBackendError("不能在网关事件循环线程中同步调用，请使用 generate")
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def generate_sync(self, prompt: str, **kwargs) -> str:
+        """同步生成文本"""
+        return self.run_sync(self.generate(prompt, **kwargs))
+
+    def metrics(self) -> Dict[str, Dict]:
+        """所有后端的指标"""
+        return {name: backend.metrics() for name, backend in self.backends.items()}
+
+    async def aclose(self):
+        """关闭所有连接"""
+        for backend in self.backends.values():
+            await backend.aclose()
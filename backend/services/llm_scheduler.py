@@ -0,0 +1,131 @@
+"""
+LLM 请求调度
+按优先级分配后端并发名额：交互式执行优先于批量执行，
+同优先级内优先调度已加载模型的请求，减少本地 Ollama 的模型切换
+"""
+
+import asyncio
+import itertools
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from config import settings
+
+# 优先级名称 -> 数值（越小越先调度）
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+# 当前执行的优先级，由 WorkflowService 根据执行参数设置
+current_llm_priority: ContextVar[str] = ContextVar("current_llm_priority", default="interactive")
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "model", "future", "skips")
+
+    def __init__(self, priority: int, seq: int, model: Optional[str], future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.model = model
+        self.future = future
+        self.skips = 0  # 因模型分组被后来者插队的次数
+
+class PriorityLimiter:
+    """带优先级的并发限制器
+
+    名额空闲时按以下顺序唤醒等待者：
+    1. 优先级数值最小的一组；
+    2. 组内优先选择正在执行或刚执行过的模型（同模型请求成组送往后端）；
+    3. 其余先到先得。被插队超过 max_skips 次的请求直接调度，避免饿死。
+    """
+
+    def __init__(self, limit: int, max_skips: int = None):
+        self.limit = limit
+        self.max_skips = settings.LLM_AFFINITY_MAX_SKIPS if max_skips is None else max_skips
+        self.active = 0
+        self.last_model: Optional[str] = None
+        self._active_models: Counter = Counter()
+        self._waiters: List[_Waiter] = []
+        self._seq = itertools.count()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def _grant(self, model: Optional[str]):
+        self.active += 1
+        if model:
+            self._active_models[model] += 1
+            self.last_model = model
+
+    async def acquire(self, priority: int = 0, model: str = None):
+        if self.active < self.limit and not self._waiters:
+            self._grant(model)
+            return
+
+        waiter = _Waiter(priority, next(self._seq), model, asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            elif waiter.future.done() and not waiter.future.cancelled():
+                # 已分配名额但调用方被取消，归还名额
+                self.release(model)
+            raise
+
+    def release(self, model: str = None):
+        self.active -= 1
+        if model:
+            self._active_models[model] -= 1
+            if self._active_models[model] <= 0:
+                del self._active_models[model]
+        self._wake()
+
+    def _pick(self) -> _Waiter:
+        best = min(waiter.priority for waiter in self._waiters)
+        group = sorted((w for w in self._waiters if w.priority == best), key=lambda w: w.seq)
+        oldest = group[0]
+        if oldest.skips >= self.max_skips:
+            return oldest
+
+        loaded = [
+            w for w in group
+            if w.model and (w.model in self._active_models or w.model == self.last_model)
+        ]
+        chosen = loaded[0] if loaded else oldest
+        for waiter in group:
+            if waiter.seq >= chosen.seq:
+                break
+            waiter.skips += 1
+        return chosen
+
+    def _wake(self):
+        while self.active < self.limit and self._waiters:
+            waiter = self._pick()
+            self._waiters.remove(waiter)
+            if waiter.future.done():
+                continue
+            self._grant(waiter.model)
+            waiter.future.set_result(None)
+
+class QueueStats:
+    """按优先级统计排队时间"""
+
+    def __init__(self):
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def record(self, priority: str, queue_time: float):
+        stats = self._stats.setdefault(priority, {"requests": 0, "total": 0.0, "max": 0.0})
+        stats["requests"] += 1
+        stats["total"] += queue_time
+        stats["max"] = max(stats["max"], queue_time)
+
+    def to_dict(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            priority: {
+                "requests": stats["requests"],
+                "avg_queue_time": stats["total"] / stats["requests"],
+                "max_queue_time": stats["max"]
+            }
+            for priority, stats in self._stats.items()
+        }
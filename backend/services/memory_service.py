@@ -0,0 +1,302 @@
+"""
+Agent 记忆服务
+按 (Agent, 会话) 持久化对话，支持滑动窗口和滚动摘要两种策略，
+在 token 预算内组装记忆上下文，并通过知识库的嵌入向量召回相关的历史消息
+"""
+
+import re
+import asyncio
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import logging
+
+from config import settings
+from database import SessionLocal
+from models import AgentMemoryTurn, AgentMemorySession
+
+logger = logging.getLogger(__name__)
+
+_CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]")
+_WORD_RE = re.compile(r"[A-Za-z0-9_]+")
+
+# 当前执行的记忆会话 ID，由 WorkflowService 设置
+current_memory_session: ContextVar[Optional[str]] = ContextVar("current_memory_session", default=None)
+
+def estimate_tokens(text: str) -> int:
+    """近似 token 数：中日韩字符按字计，其余按词计"""
+    if not text:
+        return 0
+    return len(_CJK_RE.findall(text)) + len(_WORD_RE.findall(text))
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """按近似 token 数从末尾截断，保留最新的内容"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high) // 2
+        if estimate_tokens(text[mid:]) > max_tokens:
+            low = mid + 1
+        else:
+            high = mid
+    return text[low:]
+
+def _format_turns(turns: List[Dict]) -> str:
+    return "\n".join(f"{turn['role']}: {turn['content']}" for turn in turns)
+
+class AgentMemoryService:
+    """Agent 记忆服务类
+
+    summarize 为异步摘要函数（传入提示词，返回摘要），未提供时摘要策略退化为滑动窗口。
+    """
+
+    def __init__(self, summarize: Callable[[str], Awaitable[str]] = None):
+        self.summarize = summarize
+        self._knowledge = None
+        self._recall_available = True
+
+    @staticmethod
+    def resolve_config(memory_config: Optional[Dict]) -> Dict[str, Any]:
+        """合并 Agent 的 memory_config 与默认配置"""
+        memory_config = memory_config or {}
+        return {
+            "enabled": bool(memory_config.get("enabled", False)),
+            "strategy": memory_config.get("strategy", settings.MEMORY_STRATEGY),
+            "window_turns": int(memory_config.get("window_turns", settings.MEMORY_WINDOW_TURNS)),
+            "max_tokens": int(memory_config.get("max_tokens", settings.MEMORY_MAX_TOKENS)),
+            "recall_k": int(memory_config.get("recall_k", settings.MEMORY_RECALL_K)),
+        }
+
+    # 数据库访问（同步，在线程中执行）
+
+    def _load(self, agent_id: str, session_id: str, window_turns: int) -> Tuple[str, List[Dict]]:
+        """读取会话摘要和摘要之后的最近消息"""
+        db = SessionLocal()
+        try:
+            session = db.query(AgentMemorySession).filter(
+                AgentMemorySession.agent_id == agent_id,
+                AgentMemorySession.session_id == session_id
+            ).first()
+            summary = session.summary if session else ""
+            summarized_until = session.summarized_until if session else 0
+
+            turns = db.query(AgentMemoryTurn).filter(
+                AgentMemoryTurn.agent_id == agent_id,
+                AgentMemoryTurn.session_id == session_id,
+                AgentMemoryTurn.id > summarized_until
+            ).order_by(AgentMemoryTurn.id.desc()).limit(window_turns).all()
+
+            return summary or "", [
+                {"id": turn.id, "role": turn.role, "content": turn.content, "tokens": turn.token_count}
+                for turn in reversed(turns)
+            ]
+        finally:
+            db.close()
+
+    def _append(self, agent_id: str, session_id: str, messages: List[Tuple[str, str]]) -> List[Dict]:
+        db = SessionLocal()
+        try:
+            turns = [
+                AgentMemoryTurn(
+                    agent_id=agent_id,
+                    session_id=session_id,
+                    role=role,
+                    content=content,
+                    token_count=estimate_tokens(content)
+                )
+                for role, content in messages
+            ]
+            db.add_all(turns)
+            db.commit()
+            return [{"id": turn.id, "role": turn.role, "content": turn.content} for turn in turns]
+        finally:
+            db.close()
+
+    def _overflow(self, agent_id: str, session_id: str, window_turns: int) -> Tuple[str, List[Dict]]:
+        """返回当前摘要和超出窗口、尚未并入摘要的消息"""
+        db = SessionLocal()
+        try:
+            session = db.query(AgentMemorySession).filter(
+                AgentMemorySession.agent_id == agent_id,
+                AgentMemorySession.session_id == session_id
+            ).first()
+            summarized_until = session.summarized_until if session else 0
+
+            turns = db.query(AgentMemoryTurn).filter(
+                AgentMemoryTurn.agent_id == agent_id,
+                AgentMemoryTurn.session_id == session_id,
+                AgentMemoryTurn.id > summarized_until
+            ).order_by(AgentMemoryTurn.id).all()
+
+            overflow = turns[:max(len(turns) - window_turns, 0)]
+            return (session.summary if session else "") or "", [
+                {"id": turn.id, "role": turn.role, "content": turn.content} for turn in overflow
+            ]
+        finally:
+            db.close()
+
+    def _save_summary(self, agent_id: str, session_id: str, summary: str, summarized_until: int):
+        db = SessionLocal()
+        try:
+            session = db.query(AgentMemorySession).filter(
+                AgentMemorySession.agent_id == agent_id,
+                AgentMemorySession.session_id == session_id
+            ).first()
+            if session is None:
+                session = AgentMemorySession(agent_id=agent_id, session_id=session_id)
+                db.add(session)
+            session.summary = summary
+            session.summarized_until = summarized_until
+            db.commit()
+        finally:
+            db.close()
+
+    # 语义召回
+
+    def _load_knowledge(self):
+        """复用知识库服务的 ChromaDB 客户端和嵌入模型，不可用时关闭召回"""
+        if self._knowledge is None and self._recall_available:
+            try:
+                from .knowledge_service import KnowledgeService
+                self._knowledge = KnowledgeService()
+            except Exception as e:
+                logger.warning(f"记忆召回不可用: {e}")
+                self._recall_available = False
+        return self._knowledge
+
+    async def _collection(self):
+        """返回 (知识库服务, 记忆集合)，召回不可用时返回 None"""
+        knowledge = await asyncio.to_thread(self._load_knowledge)
+        if knowledge is None:
+            return None
+        collection = await asyncio.to_thread(
+            knowledge.chroma_client.get_or_create_collection, name=settings.MEMORY_COLLECTION_NAME
+        )
+        return knowledge, collection
+
+    async def _index(self, agent_id: str, session_id: str, turns: List[Dict]):
+        try:
+            target = await self._collection()
+            if target is None:
+                return
+            knowledge, collection = target
+            embeddings = await knowledge.embed([turn["content"] for turn in turns])
+            await asyncio.to_thread(
+                collection.add,
+                ids=[f"turn-{turn['id']}" for turn in turns],
+                documents=[turn["content"] for turn in turns],
+                embeddings=embeddings,
+                metadatas=[
+                    {"agent_id": agent_id, "session_id": session_id, "turn_id": turn["id"], "role": turn["role"]}
+                    for turn in turns
+                ]
+            )
+        except Exception as e:
+            logger.warning(f"写入记忆索引失败: {e}")
+
+    async def _recall(self, agent_id: str, session_id: str, query: str, k: int, exclude: set) -> List[Dict]:
+        """召回该 Agent 在本会话中与查询最相关的历史消息，排除已在窗口中的消息
+
+        agent_id 默认是画布节点 ID，复制的画布会重复使用，因此必须同时按会话过滤，
+        否则会召回其他用户或其他会话的对话。
+        """
+        if not query:
+            return []
+        try:
+            target = await self._collection()
+            if target is None:
+                return []
+            knowledge, collection = target
+            embedding = await knowledge.embed([query])
+            results = await asyncio.to_thread(
+                collection.query,
+                query_embeddings=embedding,
+                n_results=k + len(exclude),
+                where={"$and": [{"agent_id": agent_id}, {"session_id": session_id}]},
+                include=["documents", "metadatas"]
+            )
+        except Exception as e:
+            logger.warning(f"记忆召回失败: {e}")
+            return []
+
+        recalled = []
+        for document, metadata in zip(results["documents"][0], results["metadatas"][0]):
+            if metadata.get("turn_id") in exclude:
+                continue
+            recalled.append({"role": metadata.get("role", ""), "content": document})
+            if len(recalled) >= k:
+                break
+        return recalled
+
+    # 对外接口
+
+    async def build_context(self, agent_id: str, session_id: str, query: str, memory_config: Dict) -> str:
+        """组装注入提示词的记忆上下文，总长度不超过 max_tokens
+
+        预算优先给最近的消息，其次是滚动摘要，最后是语义召回的历史消息。
+        """
+        config = self.resolve_config(memory_config)
+        budget = config["max_tokens"]
+        summary, turns = await asyncio.to_thread(self._load, agent_id, session_id, config["window_turns"])
+
+        recent: List[Dict] = []
+        for turn in reversed(turns):
+            if turn["tokens"] > budget:
+                break
+            recent.insert(0, turn)
+            budget -= turn["tokens"]
+
+        summary = _truncate(summary, min(budget, settings.MEMORY_SUMMARY_MAX_TOKENS)) if summary else ""
+        budget -= estimate_tokens(summary)
+
+        recalled = []
+        if config["recall_k"] > 0 and budget > 0:
+            exclude = {turn["id"] for turn in turns}
+            for turn in await self._recall(agent_id, session_id, query, config["recall_k"], exclude):
+                tokens = estimate_tokens(turn["content"])
+                if tokens > budget:
+                    break
+                recalled.append(turn)
+                budget -= tokens
+
+        sections = []
+        if summary:
+            sections.append(f"对话摘要:\n{summary}")
+        if recalled:
+            sections.append(f"相关历史:\n{_format_turns(recalled)}")
+        if recent:
+            sections.append(f"最近对话:\n{_format_turns(recent)}")
+        return "\n\n".join(sections)
+
+    async def remember(self, agent_id: str, session_id: str, query: str, response: Any, memory_config: Dict):
+        """记录一轮对话；摘要策略下把超出窗口的消息并入滚动摘要"""
+        config = self.resolve_config(memory_config)
+        turns = await asyncio.to_thread(
+            self._append, agent_id, session_id, [("user", query), ("assistant", str(response))]
+        )
+
+        if config["recall_k"] > 0:
+            await self._index(agent_id, session_id, turns)
+
+        if config["strategy"] == "summary" and self.summarize is not None:
+            await self._fold(agent_id, session_id, config["window_turns"])
+
+    async def _fold(self, agent_id: str, session_id: str, window_turns: int):
+        summary, overflow = await asyncio.to_thread(self._overflow, agent_id, session_id, window_turns)
+        if not overflow:
+            return
+
+        prompt = (
+            f"请将以下对话合并到已有摘要中，保留事实、决定和未完成事项，"
+            f"不超过 {settings.MEMORY_SUMMARY_MAX_TOKENS} 个词。\n\n"
+            f"已有摘要:\n{summary or '（无）'}\n\n新增对话:\n{_format_turns(overflow)}\n\n新摘要:"
+        )
+        try:
+            new_summary = await self.summarize(prompt)
+        except Exception as e:
+            # 摘要失败时保留原文，下次再合并
+            logger.warning(f"生成记忆摘要失败: {e}")
+            return
+
+        new_summary = _truncate(new_summary.strip(), settings.MEMORY_SUMMARY_MAX_TOKENS)
+        await asyncio.to_thread(self._save_summary, agent_id, session_id, new_summary, overflow[-1]["id"])
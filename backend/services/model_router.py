@@ -0,0 +1,208 @@
+"""
+模型路由服务
+根据 Agent 的 llm_config 选择模型，按配置缓存 LLM 客户端，
+支持回退链并统计每个模型的延迟和 token 用量
+"""
+
+import json
+import time
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional
+import logging
+
+from langchain.llms.base import LLM
+
+from config import settings
+from .llm_gateway import LLMGateway
+from .llm_cache import LLMResponseCache
+from .token_stream import current_token_stream, current_stream_node
+
+logger = logging.getLogger(__name__)
+
+# llm_config 中不属于生成参数的字段
+_ROUTING_FIELDS = ("backend", "model", "base_url", "api_key", "fallbacks", "cache")
+
+class ModelStats:
+    """单个模型的调用统计"""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.fallbacks = 0  # 因该模型失败而切换到下一个模型的次数
+        self.total_latency = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.ttft_count = 0
+        self.total_ttft = 0.0
+        self.queued_calls = 0
+        self.total_queue_time = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        succeeded = self.calls - self.errors
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "fallbacks": self.fallbacks,
+            "avg_latency": self.total_latency / succeeded if succeeded else 0.0,
+            "avg_ttft": self.total_ttft / self.ttft_count if self.ttft_count else 0.0,
+            "avg_queue_time": self.total_queue_time / self.queued_calls if self.queued_calls else 0.0,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens
+        }
+
+class ModelRouter:
+    """模型路由类
+
+    llm_config 示例:
+        {"backend": "ollama", "model": "qwen2:0.5b", "temperature": 0.2,
+         "fallbacks": [{"backend": "openai", "model": "gpt-3.5-turbo"}],
+         "cache": true}
+
+    cache 未设置时只缓存 temperature 为 0 的确定性调用；设为 true / false 时强制开启 / 关闭。
+    """
+
+    def __init__(self, gateway: LLMGateway, cache: LLMResponseCache = None):
+        self.gateway = gateway
+        self.cache = cache
+        # 按配置缓存的客户端，按最近使用淘汰（配置来自用户，数量不固定）
+        self._llms: "OrderedDict[str, RoutedLLM]" = OrderedDict()
+        self._stats: Dict[str, ModelStats] = {}
+
+    @staticmethod
+    def normalize(llm_config: Dict) -> Dict[str, Any]:
+        """补全默认值，得到单个模型的完整配置"""
+        backend = llm_config.get("backend") or settings.DEFAULT_LLM_BACKEND
+        default_model = settings.DEFAULT_LLM_MODEL if backend == "ollama" else settings.OPENAI_DEFAULT_MODEL
+        return {
+            "backend": backend,
+            "model": llm_config.get("model") or default_model,
+            "base_url": llm_config.get("base_url"),
+            "api_key": llm_config.get("api_key"),
+            "params": {k: v for k, v in llm_config.items() if k not in _ROUTING_FIELDS}
+        }
+
+    def get_llm(self, llm_config: Dict) -> "RoutedLLM":
+        """获取（或创建）对应配置的 LLM 客户端"""
+        candidates = [self.normalize(llm_config)]
+        candidates += [self.normalize(fallback) for fallback in llm_config.get("fallbacks", [])]
+
+        key = json.dumps(candidates, sort_keys=True)
+        if key not in self._llms:
+            self._llms[key] = RoutedLLM(
+                router=self,
+                candidates=candidates,
+                use_cache=llm_config.get("cache")
+            )
+            while len(self._llms) > settings.LLM_CLIENT_CACHE_SIZE:
+                self._llms.popitem(last=False)
+        self._llms.move_to_end(key)
+        return self._llms[key]
+
+    async def complete(self, candidates: List[Dict], prompt: str, stop: List[str] = None,
+                       use_cache: Optional[bool] = None, **kwargs) -> str:
+        """按回退链依次尝试，返回第一个成功的结果
+
+        当前上下文存在 token 流时以流式方式调用，并把 token 推送到执行面板。
+        """
+        token_stream = current_token_stream.get()
+        node_id = current_stream_node.get()
+        called_at = time.perf_counter()
+
+        scope = None
+        if self.cache is not None and self._cacheable(candidates[0], use_cache, kwargs):
+            # 缓存键只取主模型配置，回退模型的结果同样可复用
+            scope = LLMResponseCache.scope_key(candidates[0], stop, kwargs)
+            cached = await self.cache.get(scope, prompt)
+            if cached is not None:
+                if token_stream is not None and node_id:
+                    token_stream.record_first_token(node_id, time.perf_counter() - called_at)
+                    token_stream.push(node_id, cached)
+                return cached
+
+        last_error = None
+        for index, candidate in enumerate(candidates):
+            stats = self._stats.setdefault(f"{candidate['backend']}:{candidate['model']}", ModelStats())
+            stats.calls += 1
+            started_at = time.perf_counter()
+            request = {
+                "model": candidate["model"],
+                "backend": candidate["backend"],
+                "base_url": candidate["base_url"],
+                "api_key": candidate["api_key"],
+                "stop": stop,
+                **candidate["params"],
+                **kwargs
+            }
+            parts: List[str] = []
+            try:
+                if token_stream is None:
+                    result = await self.gateway.complete(prompt, **request)
+                else:
+                    result = {"prompt_tokens": 0, "completion_tokens": 0}
+                    async for chunk in self.gateway.stream(prompt, **request):
+                        if chunk.get("done"):
+                            result = chunk
+                            continue
+                        if not parts:
+                            stats.ttft_count += 1
+                            stats.total_ttft += time.perf_counter() - started_at
+                            if node_id:
+                                token_stream.record_first_token(node_id, time.perf_counter() - called_at)
+                        parts.append(chunk["text"])
+                        if node_id:
+                            token_stream.push(node_id, chunk["text"])
+                    result["text"] = "".join(parts)
+            except Exception as e:
+                stats.errors += 1
+                if parts:
+                    # 已经输出了部分 token，不能再切换模型
+                    raise
+                if index < len(candidates) - 1:
+                    stats.fallbacks += 1
+                last_error = e
+                logger.warning(f"模型 {candidate['model']} 调用失败，尝试下一个: {e}")
+                continue
+
+            stats.total_latency += time.perf_counter() - started_at
+            stats.prompt_tokens += result["prompt_tokens"]
+            stats.completion_tokens += result["completion_tokens"]
+            if "queue_time" in result:
+                stats.queued_calls += 1
+                stats.total_queue_time += result["queue_time"]
+
+            if scope is not None:
+                await self.cache.set(scope, prompt, result["text"])
+            return result["text"]
+
+        raise last_error
+
+    @staticmethod
+    def _cacheable(candidate: Dict, use_cache: Optional[bool], kwargs: Dict) -> bool:
+        """显式配置优先；否则只有 temperature 为 0 时结果才可复用（未设置时各后端默认大于 0）"""
+        if use_cache is not None:
+            return use_cache
+        temperature = kwargs.get("temperature", candidate["params"].get("temperature"))
+        return temperature is not None and float(temperature) == 0
+
+    def stats(self) -> Dict[str, Dict]:
+        """每个模型的调用统计"""
+        return {model: stats.to_dict() for model, stats in self._stats.items()}
+
+class RoutedLLM(LLM):
+    """带回退链的 LangChain LLM 适配器"""
+
+    router: Any
+    candidates: List[Dict[str, Any]]
+    use_cache: Optional[bool] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "routed"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs) -> str:
+        return self.router.gateway.run_sync(
+            self.router.complete(self.candidates, prompt, stop, self.use_cache, **kwargs)
+        )
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs) -> str:
+        return await self.router.complete(self.candidates, prompt, stop, self.use_cache, **kwargs)
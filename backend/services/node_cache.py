@@ -0,0 +1,137 @@
+"""
+节点结果缓存服务
+为确定性的工作流节点缓存执行结果，支持增量重新执行
+"""
+
+import os
+import json
+import asyncio
+import hashlib
+import threading
+from typing import Dict, List, Any, Optional
+import logging
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+class NodeResultCache:
+    """节点结果缓存类
+
+    结果以 JSON 文件形式保存在本地目录中，键为节点配置、上游输出和
+    模型/工具版本的哈希。文件读写在线程池中执行，不阻塞事件循环。
+
+    写入时累加估算的总大小，只有估算值超过上限时才扫描目录，按最近访问时间淘汰，
+    而不是每次写入都列出整个目录。
+    """
+
+    def __init__(self, cache_dir: str = None, max_bytes: int = None):
+        self.cache_dir = cache_dir or settings.NODE_CACHE_DIR
+        self.max_bytes = max_bytes or settings.NODE_CACHE_MAX_BYTES
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # 估算的缓存总大小，None 表示尚未扫描过目录
+        self._estimated_bytes: Optional[int] = None
+        self._evict_lock = threading.Lock()
+
+    @staticmethod
+    def is_enabled(node: Dict) -> bool:
+        """节点是否开启了结果缓存（需显式开启）"""
+        return bool(node.get("data", {}).get("cache", False))
+
+    @staticmethod
+    def make_key(node: Dict, upstream_results: List[Any], version: str) -> str:
+        """根据节点配置、上游输出和版本生成缓存键"""
+        node_config = {
+            "type": node.get("type"),
+            "data": node.get("data", {})
+        }
+        raw = json.dumps(
+            [node_config, upstream_results, version],
+            sort_keys=True,
+            default=str,
+            ensure_ascii=False
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    async def get(self, key: str) -> Optional[Dict]:
+        """读取缓存结果，未命中返回 None"""
+        return await asyncio.to_thread(self._read, key)
+
+    async def set(self, key: str, value: Dict):
+        """写入缓存结果"""
+        await asyncio.to_thread(self._write, key, value)
+
+    def _read(self, key: str) -> Optional[Dict]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            # 更新访问时间，用于淘汰
+            os.utime(path, None)
+            return value
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"读取节点缓存失败: {e}")
+            return None
+
+    def _write(self, key: str, value: Dict):
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(value, f, ensure_ascii=False, default=str)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"写入节点缓存失败: {e}")
+            return
+
+        with self._evict_lock:
+            if self._estimated_bytes is not None:
+                # 覆盖已有条目时会高估，最多只是提前一次扫描
+                self._estimated_bytes += size
+                if self._estimated_bytes <= self.max_bytes:
+                    return
+            self._estimated_bytes = self._evict()
+
+    def _evict(self) -> int:
+        """总大小超过上限时淘汰最久未访问的条目，返回淘汰后的总大小"""
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        if total <= self.max_bytes:
+            return total
+
+        # 命中时会刷新 mtime，因此按 mtime 排序即为按最近访问排序
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+        return total
+
+    def clear(self):
+        """清空缓存"""
+        with self._evict_lock:
+            for name in os.listdir(self.cache_dir):
+                if name.endswith(".json"):
+                    os.remove(os.path.join(self.cache_dir, name))
+            self._estimated_bytes = 0
@@ -0,0 +1,115 @@
+"""
+密码哈希进程池
+bcrypt 计算在独立的子进程中执行，不阻塞事件循环；
+排队请求数有上限，超出时立即拒绝而不是无限堆积
+"""
+
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Optional, Tuple
+import logging
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+class PasswordHasherBusy(Exception):
+    """哈希请求排队已满"""
+
+# 子进程内按 rounds 缓存 CryptContext
+_contexts: Dict[int, Any] = {}
+
+def _context(rounds: int):
+    context = _contexts.get(rounds)
+    if context is None:
+        from passlib.context import CryptContext
+        context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+        _contexts[rounds] = context
+    return context
+
+def _hash(password: str, rounds: int) -> str:
+    return _context(rounds).hash(password)
+
+def _verify(password: str, hashed_password: str, rounds: int) -> Tuple[bool, Optional[str]]:
+    """校验密码；哈希参数与当前配置不一致时同时返回新哈希"""
+    try:
+        return _context(rounds).verify_and_update(password, hashed_password)
+    except ValueError:
+        # 无法识别的哈希格式
+        return False, None
+
+def _noop() -> int:
+    import os
+    return os.getpid()
+
+class PasswordHasher:
+    """密码哈希进程池类"""
+
+    def __init__(self, workers: int = None, queue_limit: int = None, rounds: int = None):
+        self.workers = workers or settings.PASSWORD_HASH_WORKERS
+        self.queue_limit = settings.PASSWORD_HASH_QUEUE_LIMIT if queue_limit is None else queue_limit
+        self.rounds = rounds or settings.PASSWORD_BCRYPT_ROUNDS
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.pending = 0
+        self.rejected = 0
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("forkserver")
+            )
+        return self._executor
+
+    async def start(self):
+        """预先启动所有子进程"""
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(
+            loop.run_in_executor(self.executor, _noop) for _ in range(self.workers)
+        ))
+
+    async def _submit(self, fn, *args):
+        # 正在计算的 workers 个加上最多 queue_limit 个排队
+        if self.pending >= self.workers + self.queue_limit:
+            self.rejected += 1
+            raise PasswordHasherBusy("密码校验请求过多，请稍后重试")
+
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, fn, *args)
+        except BrokenProcessPool:
+            logger.warning("密码哈希子进程异常退出，重建进程池")
+            self.shutdown()
+            raise
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        """生成密码哈希"""
+        return await self._submit(_hash, password, self.rounds)
+
+    async def verify(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """校验密码，返回 (是否匹配, 需要更新时的新哈希)"""
+        return await self._submit(_verify, password, hashed_password, self.rounds)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "pending": self.pending,
+            "queue_limit": self.queue_limit,
+            "rejected": self.rejected,
+            "rounds": self.rounds
+        }
+
+    def shutdown(self):
+        """关闭进程池"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+# 全局密码哈希进程池
+password_hasher = PasswordHasher()
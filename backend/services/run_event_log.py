@@ -0,0 +1,129 @@
+"""
+执行事件日志服务
+以追加写入的方式记录工作流执行事件，支持批量插入、基于游标的分页读取和逐批流式读取
+"""
+
+from typing import AsyncIterator, Dict, List, Any, Optional, Tuple
+import logging
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from models import WorkflowRunEvent
+
+logger = logging.getLogger(__name__)
+
+class RunEventLog:
+    """执行事件日志类
+
+    事件先缓存在内存中，达到批量大小或显式 flush 时一次性插入，
+    不再读取并重写整个 JSON 列。
+    """
+
+    def __init__(self, db: AsyncSession, run_id: str, batch_size: int = None):
+        self.db = db
+        self.run_id = run_id
+        self.batch_size = batch_size or settings.EXECUTION_LOG_BATCH_SIZE
+        self._buffer: List[Dict] = []
+        self.event_count = 0
+
+    async def append(self, event_type: str, payload: Dict = None, node_id: str = None):
+        """追加一条事件"""
+        self._buffer.append({
+            "run_id": self.run_id,
+            "event_type": event_type,
+            "node_id": node_id,
+            "payload": payload or {}
+        })
+        self.event_count += 1
+
+        if len(self._buffer) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        """批量写入缓冲区中的事件
+
+        写入失败时事件放回缓冲区（下次 flush 重试）并抛出异常，由调用方将执行标记为失败。
+        """
+        if not self._buffer:
+            return
+
+        rows, self._buffer = self._buffer, []
+        try:
+            await self.db.execute(insert(WorkflowRunEvent), rows)
+            await self.db.commit()
+        except Exception as e:
+            logger.error(f"写入执行事件失败: {e}")
+            self._buffer[:0] = rows
+            await self.db.rollback()
+            raise
+
+def _event_dict(event: WorkflowRunEvent) -> Dict[str, Any]:
+    return {
+        "id": event.id,
+        "event_type": event.event_type,
+        "node_id": event.node_id,
+        "payload": event.payload,
+        "created_at": event.created_at
+    }
+
+async def read_events(
+    db: AsyncSession,
+    run_id: str,
+    after: Optional[int] = None,
+    limit: int = None
+) -> Dict[str, Any]:
+    """读取执行事件
+
+    指定 after 时按游标正向读取其后的事件；否则返回最新的 limit 条（尾部）。
+    """
+    limit = limit or settings.EXECUTION_LOG_PAGE_SIZE
+    query = select(WorkflowRunEvent).where(WorkflowRunEvent.run_id == run_id)
+
+    if after is not None:
+        events = (await db.scalars(
+            query.where(WorkflowRunEvent.id > after).order_by(WorkflowRunEvent.id.asc()).limit(limit + 1)
+        )).all()
+        has_more = len(events) > limit
+        events = events[:limit]
+    else:
+        events = (await db.scalars(
+            query.order_by(WorkflowRunEvent.id.desc()).limit(limit + 1)
+        )).all()
+        has_more = len(events) > limit
+        events = list(reversed(events[:limit]))
+
+    return {
+        "events": [_event_dict(event) for event in events],
+        "next_cursor": events[-1].id if events else after,
+        "prev_cursor": events[0].id if events else None,
+        "has_more": has_more
+    }
+
+async def count_events(db: AsyncSession, run_id: str) -> Tuple[int, Optional[int]]:
+    """返回 (事件条数, 最后一条事件的 ID)；事件只追加，二者可作为执行日志的版本"""
+    count, last_id = (await db.execute(
+        select(func.count(WorkflowRunEvent.id), func.max(WorkflowRunEvent.id)).where(WorkflowRunEvent.run_id == run_id)
+    )).one()
+    return count, last_id
+
+async def iter_events(
+    db: AsyncSession,
+    run_id: str,
+    after: Optional[int] = None,
+    batch_size: int = 1000
+) -> AsyncIterator[Dict[str, Any]]:
+    """按 ID 顺序逐批读取 after 之后的全部事件，用于流式输出完整日志"""
+    while True:
+        query = select(WorkflowRunEvent).where(WorkflowRunEvent.run_id == run_id)
+        if after is not None:
+            query = query.where(WorkflowRunEvent.id > after)
+        events = (await db.scalars(query.order_by(WorkflowRunEvent.id.asc()).limit(batch_size))).all()
+        for event in events:
+            yield _event_dict(event)
+        if len(events) < batch_size:
+            return
+        after = events[-1].id
+        # 已输出的事件不再需要，避免会话中累积大量对象
+        db.expunge_all()
@@ -0,0 +1,295 @@
+"""
+沙箱进程池
+在预先启动、可复用的子进程中执行用户的 Python 代码，避免阻塞 API 进程或争用 GIL：
+- 隔离由操作系统限制保证：子进程清空环境变量，只保留与父进程通信的管道，
+  不能再打开文件或套接字（RLIMIT_NOFILE）、写文件（RLIMIT_FSIZE）或创建进程（RLIMIT_NPROC），
+  并限制内存；每次调用在子进程内限制 CPU 时间和墙钟时间；
+- 受限的内置函数、模块白名单和 AST 检查（禁止下划线属性、栈帧属性和按字符串查找属性的
+  str.format）只是额外的一层，不作为安全边界；
+- 调用超时或子进程异常退出时只替换该子进程，不影响其他正在执行的调用。
+"""
+
+import ast
+import asyncio
+import builtins
+import contextlib
+import io
+import multiprocessing
+import multiprocessing.connection
+import os
+import queue
+import resource
+import signal
+import threading
+import types
+from typing import Any, Dict, List
+import logging
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# 子进程未能自行中断时，父进程在超时之后再等待的时间，之后强制结束该子进程
+_KILL_GRACE = 1.0
+
+_SAFE_BUILTINS = (
+    "abs", "all", "any", "ascii", "bin", "bool", "bytearray", "bytes", "callable", "chr",
+    "complex", "dict", "divmod", "enumerate", "filter", "float", "format", "frozenset",
+    "hash", "hex", "int", "isinstance", "issubclass", "iter", "len", "list", "map", "max",
+    "min", "next", "oct", "ord", "pow", "print", "range", "repr", "reversed", "round",
+    "set", "slice", "sorted", "str", "sum", "tuple", "zip",
+    "type", "object", "property", "staticmethod", "classmethod", "super", "__build_class__",
+    "ArithmeticError", "AssertionError", "AttributeError", "Exception", "IndexError",
+    "KeyError", "LookupError", "NameError", "NotImplementedError", "OverflowError",
+    "RuntimeError", "StopIteration", "TypeError", "ValueError", "ZeroDivisionError",
+)
+
+# 可经由栈帧、生成器等对象取得全局命名空间的属性
+_BLOCKED_ATTRIBUTES = frozenset((
+    "gi_frame", "gi_code", "gi_yieldfrom", "cr_frame", "cr_code", "cr_await",
+    "ag_frame", "ag_code", "f_globals", "f_locals", "f_builtins", "f_back", "f_code",
+    "tb_frame", "tb_next",
+    # 按字段名字符串读取属性（"{0.__class__}".format(x)），可绕过对代码中属性名的检查
+    "format", "format_map",
+))
+
+# 允许导入的模块中不暴露的成员：同样按字符串名称读取属性
+_HIDDEN_MEMBERS = {
+    "string": ("Formatter", "Template"),
+}
+
+# 子进程中与父进程通信的管道使用的文件描述符，之后的描述符全部关闭
+_CONN_FD = 3
+
+class SandboxError(Exception):
+    """沙箱执行失败（超时、超出资源限制、代码不被允许或进程异常）"""
+
+class _CpuLimitExceeded(BaseException):
+    pass
+
+class _TimeLimitExceeded(BaseException):
+    pass
+
+def _on_cpu_limit(signum, frame):
+    raise _CpuLimitExceeded()
+
+def _on_time_limit(signum, frame):
+    raise _TimeLimitExceeded()
+
+def _init_worker(conn, memory_bytes: int):
+    """子进程初始化：隔离进程并安装 CPU 和墙钟超限处理，返回与父进程通信的连接
+
+    先导入白名单中的模块（导入需要打开文件），再把管道移到固定的描述符上、关闭其余描述符，
+    之后把描述符上限设为管道之后的第一个，子进程无法再打开任何文件或套接字。
+    """
+    for name in settings.SANDBOX_ALLOWED_MODULES:
+        __import__(name)
+    os.environ.clear()
+
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    fd = os.dup(conn.fileno())
+    conn.close()
+    if fd != _CONN_FD:
+        os.dup2(fd, _CONN_FD)
+        os.close(fd)
+    os.closerange(_CONN_FD + 1, resource.getrlimit(resource.RLIMIT_NOFILE)[0])
+    conn = multiprocessing.connection.Connection(_CONN_FD)
+
+    resource.setrlimit(resource.RLIMIT_NOFILE, (_CONN_FD + 1, _CONN_FD + 1))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (0, 0))
+    resource.setrlimit(resource.RLIMIT_NPROC, (0, 0))
+    if memory_bytes:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+    signal.signal(signal.SIGXCPU, _on_cpu_limit)
+    signal.signal(signal.SIGALRM, _on_time_limit)
+    return conn
+
+def _cpu_used() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+def _with_limits(cpu_seconds: float, timeout: float, fn, *args):
+    """在本次调用的 CPU 时间和墙钟时间预算内执行
+
+    CPU 只调整软限制：超限时触发 SIGXCPU 并中断当前调用，进程可继续复用；
+    墙钟时间由 SIGALRM 中断。吞掉这些信号的代码由父进程的超时兜底，只结束这一个子进程。
+    """
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = int(_cpu_used() + cpu_seconds) + 1
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return fn(*args)
+    except _CpuLimitExceeded:
+        return {"ok": False, "error": f"超出 CPU 时间限制 ({cpu_seconds}s)"}
+    except _TimeLimitExceeded:
+        return {"ok": False, "error": f"执行超时 ({timeout}s)"}
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        resource.setrlimit(resource.RLIMIT_CPU, (hard, hard))
+
+def _module_proxy(module: types.ModuleType) -> types.SimpleNamespace:
+    """只暴露模块的公开成员，不包括它导入的其他模块（如 datetime.sys）和 _HIDDEN_MEMBERS 中的成员"""
+    hidden = _HIDDEN_MEMBERS.get(module.__name__, ())
+    return types.SimpleNamespace(**{
+        name: value for name, value in vars(module).items()
+        if not name.startswith("_") and not isinstance(value, types.ModuleType) and name not in hidden
+    })
+
+def _restricted_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if level or name not in settings.SANDBOX_ALLOWED_MODULES:
+        raise ImportError(f"不允许导入模块 {name!r}")
+    return _module_proxy(__import__(name))
+
+def _safe_builtins() -> Dict[str, Any]:
+    safe = {name: getattr(builtins, name) for name in _SAFE_BUILTINS}
+    safe["__import__"] = _restricted_import
+    return safe
+
+def _check_code(tree: ast.AST):
+    """拒绝访问下划线开头的属性和名称，以及栈帧等内部属性"""
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Attribute) and (node.attr.startswith("_") or node.attr in _BLOCKED_ATTRIBUTES):
+            raise SandboxError(f"不允许访问属性 {node.attr!r}")
+        if isinstance(node, ast.Name) and node.id.startswith("__"):
+            raise SandboxError(f"不允许使用名称 {node.id!r}")
+
+def _run_python(code: str, max_output: int) -> Dict[str, Any]:
+    """执行 Python 代码并返回标准输出"""
+    stdout = io.StringIO()
+    try:
+        tree = ast.parse(code, mode="exec")
+        _check_code(tree)
+        compiled = compile(tree, "<sandbox>", "exec")
+    except (SyntaxError, SandboxError) as e:
+        return {"ok": False, "error": f"{type(e).__name__}: {e}"}
+    try:
+        with contextlib.redirect_stdout(stdout):
+            exec(compiled, {"__name__": "__sandbox__", "__builtins__": _safe_builtins()})
+        return {"ok": True, "output": stdout.getvalue()[:max_output]}
+    except MemoryError:
+        return {"ok": False, "error": "超出内存限制"}
+    except Exception as e:
+        return {"ok": False, "error": f"{type(e).__name__}: {e}", "output": stdout.getvalue()[:max_output]}
+
+def _worker_main(conn, memory_bytes: int):
+    """子进程主循环：逐个接收请求并返回结果，父进程关闭连接时退出"""
+    conn = _init_worker(conn, memory_bytes)
+    while True:
+        try:
+            cpu_seconds, timeout, code, max_output = conn.recv()
+        except (EOFError, OSError):
+            return
+        conn.send(_with_limits(cpu_seconds, timeout, _run_python, code, max_output))
+
+class _Worker:
+    """单个沙箱子进程及其通信管道"""
+
+    def __init__(self, context, memory_bytes: int):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child, memory_bytes), daemon=True)
+        self.process.start()
+        child.close()
+
+    def call(self, request: tuple, timeout: float) -> Dict[str, Any]:
+        """发送请求并等待结果；超时抛出 TimeoutError，进程退出抛出 EOFError/OSError"""
+        self.conn.send(request)
+        if not self.conn.poll(timeout):
+            raise TimeoutError()
+        return self.conn.recv()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join(timeout=1)
+        self.conn.close()
+
+class SandboxPool:
+    """沙箱进程池类
+
+    空闲子进程放在线程安全的队列中，事件循环和工作线程中的同步框架都可以调用；
+    排队等待空闲子进程的时间不计入超时。
+    """
+
+    def __init__(self, workers: int = None, cpu_seconds: float = None,
+                 memory_mb: int = None, timeout: float = None):
+        self.workers = workers or settings.SANDBOX_WORKERS
+        self.cpu_seconds = cpu_seconds or settings.SANDBOX_CPU_SECONDS
+        self.memory_bytes = (memory_mb or settings.SANDBOX_MEMORY_MB) * 1024 * 1024
+        self.timeout = timeout or settings.SANDBOX_TIMEOUT
+        self._context = multiprocessing.get_context("forkserver")
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._all: List[_Worker] = []
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+
+    def _spawn(self) -> _Worker:
+        worker = _Worker(self._context, self.memory_bytes)
+        with self._lock:
+            self._all.append(worker)
+        return worker
+
+    def _ensure_started(self):
+        if len(self._all) >= self.workers:
+            return
+        with self._start_lock:
+            for _ in range(self.workers - len(self._all)):
+                self._idle.put(self._spawn())
+
+    async def start(self):
+        """预先启动所有子进程"""
+        await asyncio.to_thread(self._ensure_started)
+
+    def _replace(self, worker: _Worker):
+        """结束出问题的子进程并补充一个新的，其他子进程不受影响"""
+        worker.kill()
+        with self._lock:
+            if worker in self._all:
+                self._all.remove(worker)
+        self._idle.put(self._spawn())
+
+    @staticmethod
+    def _unwrap(result: Dict[str, Any], field: str) -> Any:
+        if not result["ok"]:
+            raise SandboxError(result["error"])
+        return result[field]
+
+    def _call_sync(self, *args) -> Dict[str, Any]:
+        self._ensure_started()
+        worker = self._idle.get()
+        try:
+            result = worker.call((self.cpu_seconds, self.timeout, *args), self.timeout + _KILL_GRACE)
+        except TimeoutError:
+            logger.warning("沙箱执行超时，替换该子进程")
+            self._replace(worker)
+            raise SandboxError(f"执行超时 ({self.timeout}s)")
+        except (EOFError, OSError):
+            logger.warning("沙箱子进程异常退出，替换该子进程")
+            self._replace(worker)
+            raise SandboxError("沙箱进程异常退出（可能超出资源限制）")
+        self._idle.put(worker)
+        return result
+
+    async def run_python(self, code: str) -> str:
+        """执行 Python 代码，返回标准输出"""
+        return self._unwrap(
+            await asyncio.to_thread(self._call_sync, code, settings.SANDBOX_MAX_OUTPUT_CHARS), "output"
+        )
+
+    def run_python_sync(self, code: str) -> str:
+        """同步执行 Python 代码（供工作线程中的同步框架调用）"""
+        return self._unwrap(self._call_sync(code, settings.SANDBOX_MAX_OUTPUT_CHARS), "output")
+
+    def shutdown(self):
+        """结束所有子进程"""
+        with self._lock:
+            workers, self._all = self._all, []
+        for worker in workers:
+            worker.kill()
+        self._idle = queue.Queue()
+
+# 全局沙箱进程池
+sandbox_pool = SandboxPool()
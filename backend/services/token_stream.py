@@ -0,0 +1,115 @@
+"""
+Token 流服务
+将 LLM 输出的 token 合并为大小有限的帧，按顺序推送到执行面板的 WebSocket 通道，
+并记录每个 Agent 节点的首 token 时间
+"""
+
+import asyncio
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Dict, List, Optional
+import logging
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+class TokenStream:
+    """单次工作流执行的 token 流
+
+    push 可在任意线程调用；token 先按节点缓冲，缓冲超过帧大小或达到刷新间隔时
+    合并成帧，由单个发送任务按顺序发出。
+    """
+
+    def __init__(self, send: Optional[Callable[[Dict], Awaitable]] = None,
+                 max_frame_chars: int = None, flush_interval: float = None):
+        self.send = send
+        self.max_frame_chars = max_frame_chars or settings.STREAM_FRAME_MAX_CHARS
+        self.flush_interval = flush_interval or settings.STREAM_FLUSH_INTERVAL
+        self.loop = asyncio.get_running_loop()
+        self.ttft: Dict[str, float] = {}  # 节点 ID -> 首 token 时间（秒）
+        self.frames_sent = 0
+
+        self._pending: Dict[str, List[str]] = {}
+        self._pending_chars = 0
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._sender = self.loop.create_task(self._send_loop()) if send else None
+
+    def push(self, node_id: str, text: str):
+        """推送 token"""
+        if not self.send or not text:
+            return
+        if self._in_loop():
+            self._push(node_id, text)
+        else:
+            self.loop.call_soon_threadsafe(self._push, node_id, text)
+
+    def record_first_token(self, node_id: str, seconds: float):
+        """记录节点的首 token 时间，只保留第一次"""
+        if node_id in self.ttft:
+            return
+        self.ttft[node_id] = seconds
+        if self.send:
+            frame = {"type": "ttft", "node_id": node_id, "ttft_ms": round(seconds * 1000, 1)}
+            if self._in_loop():
+                self._enqueue(frame)
+            else:
+                self.loop.call_soon_threadsafe(self._enqueue, frame)
+
+    def _in_loop(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    def _push(self, node_id: str, text: str):
+        self._pending.setdefault(node_id, []).append(text)
+        self._pending_chars += len(text)
+
+        if self._pending_chars >= self.max_frame_chars:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = self.loop.call_later(self.flush_interval, self._flush)
+
+    def _flush(self):
+        """把缓冲的 token 合并成帧放入发送队列"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        pending, self._pending, self._pending_chars = self._pending, {}, 0
+        for node_id, parts in pending.items():
+            text = "".join(parts)
+            for start in range(0, len(text), self.max_frame_chars):
+                self._enqueue({
+                    "type": "token",
+                    "node_id": node_id,
+                    "text": text[start:start + self.max_frame_chars]
+                })
+
+    def _enqueue(self, frame: Dict):
+        self._queue.put_nowait(frame)
+
+    async def _send_loop(self):
+        while True:
+            frame = await self._queue.get()
+            if frame is None:
+                break
+            try:
+                await self.send(frame)
+                self.frames_sent += 1
+            except Exception as e:
+                logger.warning(f"推送 token 帧失败: {e}")
+
+    async def aclose(self):
+        """发送剩余的 token 并结束发送任务"""
+        if self._sender is None:
+            return
+        self._flush()
+        self._enqueue(None)
+        sender, self._sender = self._sender, None
+        await sender
+
+# 当前执行的 token 流，以及正在执行的 Agent 节点
+current_token_stream: ContextVar[Optional[TokenStream]] = ContextVar("current_token_stream", default=None)
+current_stream_node: ContextVar[Optional[str]] = ContextVar("current_stream_node", default=None)
@@ -0,0 +1,241 @@
+"""
+工具注册表
+从 Tool 表加载工具定义，按工具维护可复用的实例池，启动时预热，
+并统计每个工具的调用延迟、错误率和排队时间
+"""
+
+import asyncio
+import queue
+import time
+from threading import Lock
+from typing import Any, Callable, Dict, List, Optional
+import logging
+
+from langchain.tools.base import BaseTool
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+def _search_tool():
+    from langchain.tools import DuckDuckGoSearchRun
+    return DuckDuckGoSearchRun()
+
+def _calculator_tool():
+    from langchain.tools import Calculator
+    return Calculator()
+
+class SandboxedPythonTool(BaseTool):
+    """在沙箱进程池中执行 Python 代码的工具"""
+
+    name: str = "python"
+    description: str = "执行 Python 代码并返回 print 输出。每次调用使用独立的命名空间。"
+
+    def _run(self, code: str) -> str:
+        from services.sandbox_pool import sandbox_pool
+        return sandbox_pool.run_python_sync(code)
+
+    async def _arun(self, code: str) -> str:
+        from services.sandbox_pool import sandbox_pool
+        return await sandbox_pool.run_python(code)
+
+def _python_tool():
+    return SandboxedPythonTool()
+
+# 内置工具工厂，Tool 表中的定义通过 config.builtin 引用
+BUILTIN_TOOLS: Dict[str, Callable[[], BaseTool]] = {
+    "search": _search_tool,
+    "calculator": _calculator_tool,
+    "python": _python_tool,
+}
+
+class ToolPool:
+    """单个工具的实例池（线程安全，可在工作线程和事件循环中使用）"""
+
+    def __init__(self, name: str, factory: Callable[[], BaseTool], size: int):
+        if not isinstance(size, int) or isinstance(size, bool) or size < 1:
+            raise ValueError(f"工具 {name} 的 pool_size 必须是不小于 1 的整数: {size!r}")
+        self.name = name
+        self.factory = factory
+        self.size = size
+        self._idle: "queue.Queue[BaseTool]" = queue.Queue()
+        self._created = 0
+        self._lock = Lock()
+        # 工具实现自带的描述，LLM 据此选择工具
+        self.description: Optional[str] = None
+
+        # 指标
+        self.invocations = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.total_queue_time = 0.0
+
+    def warm_up(self, count: int = None):
+        """预先创建实例"""
+        count = min(count or self.size, self.size)
+        while self._created < count:
+            with self._lock:
+                if self._created >= count:
+                    break
+                self._created += 1
+            self._idle.put(self._create())
+
+    def _create(self) -> BaseTool:
+        instance = self.factory()
+        if self.description is None:
+            self.description = instance.description
+        return instance
+
+    def describe(self) -> str:
+        """工具实现的描述；尚未创建过实例时先创建一个（会阻塞，异步代码中在工作线程调用）"""
+        if self.description is None:
+            self.release(self.acquire())
+        return self.description
+
+    def acquire(self, timeout: float = None) -> BaseTool:
+        """取出一个实例，池未满时按需创建"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            create = self._created < self.size
+            if create:
+                self._created += 1
+        if create:
+            try:
+                return self._create()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        return self._idle.get(timeout=timeout or settings.TOOL_ACQUIRE_TIMEOUT)
+
+    def release(self, instance: BaseTool):
+        self._idle.put(instance)
+
+    def record(self, queue_time: float, latency: float, error: bool):
+        with self._lock:
+            self.invocations += 1
+            self.total_queue_time += queue_time
+            self.total_latency += latency
+            if error:
+                self.errors += 1
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "pool_size": self.size,
+            "created": self._created,
+            "idle": self._idle.qsize(),
+            "invocations": self.invocations,
+            "error_rate": self.errors / self.invocations if self.invocations else 0.0,
+            "avg_latency": self.total_latency / self.invocations if self.invocations else 0.0,
+            "avg_queue_time": self.total_queue_time / self.invocations if self.invocations else 0.0
+        }
+
+class PooledTool(BaseTool):
+    """借用池中实例执行的工具代理，可安全地分配给多个 Agent"""
+
+    pool: Any
+
+    def _run(self, *args, **kwargs) -> Any:
+        enqueued_at = time.perf_counter()
+        instance = self.pool.acquire()
+        started_at = time.perf_counter()
+        error = False
+        try:
+            return instance.run(*args, **kwargs)
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.pool.record(started_at - enqueued_at, time.perf_counter() - started_at, error)
+            self.pool.release(instance)
+
+    async def _arun(self, *args, **kwargs) -> Any:
+        enqueued_at = time.perf_counter()
+        instance = await asyncio.to_thread(self.pool.acquire)
+        started_at = time.perf_counter()
+        error = False
+        try:
+            return await instance.arun(*args, **kwargs)
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.pool.record(started_at - enqueued_at, time.perf_counter() - started_at, error)
+            self.pool.release(instance)
+
+class ToolRegistry:
+    """工具注册表类"""
+
+    def __init__(self):
+        self.pools: Dict[str, ToolPool] = {}
+        # 内置工具默认可用，Tool 表中的同名定义只能调整其池大小
+        for name, factory in BUILTIN_TOOLS.items():
+            self.pools[name] = ToolPool(name, factory, settings.TOOL_POOL_SIZE)
+
+    def register(self, tool) -> bool:
+        """注册 Tool 表中的工具定义
+
+        只为内置实现建立实例池；与内置工具同名但引用其他实现的定义被拒绝，
+        避免替换所有用户共用的内置工具。
+        """
+        config = tool.config or {}
+        builtin = config.get("builtin", tool.name)
+        factory = BUILTIN_TOOLS.get(builtin)
+        if factory is None:
+            logger.warning(f"工具 {tool.name} 没有可用的实现: {builtin}")
+            return False
+        if tool.name in BUILTIN_TOOLS and builtin != tool.name:
+            logger.warning(f"工具 {tool.name} 与内置工具同名，不能指向其他实现: {builtin}")
+            return False
+
+        try:
+            self.pools[tool.name] = ToolPool(tool.name, factory, config.get("pool_size", settings.TOOL_POOL_SIZE))
+        except ValueError as e:
+            logger.warning(str(e))
+            return False
+        return True
+
+    def load_definitions(self, db) -> int:
+        """从数据库加载所有启用的工具定义"""
+        from models import Tool
+
+        tools = db.query(Tool).filter(Tool.is_active == True).all()
+        return sum(1 for tool in tools if self.register(tool))
+
+    async def warm_up(self):
+        """预热所有工具池"""
+        for name, pool in self.pools.items():
+            try:
+                await asyncio.to_thread(pool.warm_up, settings.TOOL_POOL_WARM_SIZE)
+            except Exception as e:
+                logger.warning(f"预热工具 {name} 失败: {e}")
+
+    async def get(self, tool_name: str) -> Optional[BaseTool]:
+        """获取工具代理；尚未创建过实例时在工作线程中创建，不阻塞事件循环"""
+        pool = self.pools.get(tool_name)
+        if pool is None:
+            return None
+        try:
+            description = pool.description
+            if description is None:
+                description = await asyncio.to_thread(pool.describe)
+        except Exception as e:
+            logger.warning(f"创建工具 {tool_name} 失败: {e}")
+            description = None
+        return PooledTool(
+            name=tool_name,
+            description=description or f"{tool_name} tool",
+            pool=pool
+        )
+
+    def metrics(self) -> Dict[str, Dict]:
+        """各工具的调用指标"""
+        return {name: pool.metrics() for name, pool in self.pools.items()}
+
+# 全局工具注册表
+tool_registry = ToolRegistry()
@@ -0,0 +1,84 @@
+"""
+WebSocket 连接管理
+维护客户端连接，支持广播、按客户端 ID 定向推送，以及按频道向多个订阅者推送
+"""
+
+from typing import Dict, Set, Union
+import logging
+
+from fastapi import WebSocket
+
+logger = logging.getLogger(__name__)
+
+def execution_channel(canvas_id: str, workflow_id: str) -> str:
+    """执行面板的频道名：包含画布 ID，订阅时按画布所有权校验"""
+    return f"execution:{canvas_id}:{workflow_id}"
+
+class ConnectionManager:
+    """WebSocket 连接管理器"""
+
+    def __init__(self):
+        self.active_connections: Dict[str, WebSocket] = {}
+        # 频道 -> 订阅连接（如一次执行的日志和 token 流，可被多个页面同时订阅）
+        self.channels: Dict[str, Set[WebSocket]] = {}
+
+    async def connect(self, websocket: WebSocket, client_id: str):
+        """接受连接"""
+        await websocket.accept()
+        self.active_connections[client_id] = websocket
+
+    def disconnect(self, client_id: str):
+        """移除连接"""
+        self.active_connections.pop(client_id, None)
+
+    async def _send(self, websocket: WebSocket, message: Union[str, dict]):
+        if isinstance(message, str):
+            await websocket.send_text(message)
+        else:
+            await websocket.send_json(message)
+
+    async def send_to(self, client_id: str, message: Union[str, dict]) -> bool:
+        """向指定客户端推送消息，客户端不在线时返回 False"""
+        websocket = self.active_connections.get(client_id)
+        if websocket is None:
+            return False
+        try:
+            await self._send(websocket, message)
+            return True
+        except Exception as e:
+            logger.warning(f"推送消息到 {client_id} 失败: {e}")
+            self.disconnect(client_id)
+            return False
+
+    async def broadcast(self, message: Union[str, dict]):
+        """广播消息到所有客户端"""
+        for client_id in list(self.active_connections):
+            await self.send_to(client_id, message)
+
+    def subscribe(self, channel: str, websocket: WebSocket):
+        """订阅频道（连接需已由调用方完成认证并接受）"""
+        self.channels.setdefault(channel, set()).add(websocket)
+
+    def unsubscribe(self, channel: str, websocket: WebSocket):
+        """取消订阅，频道没有订阅者时移除"""
+        subscribers = self.channels.get(channel)
+        if subscribers is None:
+            return
+        subscribers.discard(websocket)
+        if not subscribers:
+            del self.channels[channel]
+
+    async def publish(self, channel: str, message: Union[str, dict]) -> int:
+        """向频道的所有订阅者推送消息，返回成功推送的连接数"""
+        delivered = 0
+        for websocket in list(self.channels.get(channel, ())):
+            try:
+                await self._send(websocket, message)
+                delivered += 1
+            except Exception as e:
+                logger.warning(f"推送消息到频道 {channel} 失败: {e}")
+                self.unsubscribe(channel, websocket)
+        return delivered
+
+# 全局连接管理器
+connection_manager = ConnectionManager()
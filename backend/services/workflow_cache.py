@@ -0,0 +1,62 @@
+"""
+编译后工作流缓存
+按 (画布 ID, 画布版本) 缓存编译好的 LangGraph 图和 CrewAI Agent 配置
+"""
+
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Optional, Tuple
+import logging
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+class CompiledWorkflowCache:
+    """编译后工作流缓存类（LRU 淘汰）"""
+
+    def __init__(self, max_size: int = None):
+        self.max_size = max_size or settings.WORKFLOW_CACHE_SIZE
+        self._entries: "OrderedDict[Tuple[str, int], Any]" = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, canvas_id: str, version: int) -> Optional[Any]:
+        """获取缓存的工作流产物"""
+        key = (canvas_id, version)
+        with self._lock:
+            artifact = self._entries.get(key)
+            if artifact is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return artifact
+
+    def put(self, canvas_id: str, version: int, artifact: Any):
+        """缓存工作流产物"""
+        key = (canvas_id, version)
+        with self._lock:
+            self._entries[key] = artifact
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, canvas_id: str):
+        """使画布的所有缓存版本失效"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == canvas_id]:
+                del self._entries[key]
+
+    def stats(self) -> dict:
+        """缓存统计"""
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+# 全局缓存实例
+workflow_cache = CompiledWorkflowCache()
@@ -4,24 +4,44 @@
 """
 
 import asyncio
+import hashlib
 import json
-from typing import Dict, List, Any
+from typing import AsyncIterator, Dict, List, Any, Optional, Tuple
 from datetime import datetime
 import logging
 
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import undefer
 from models import WorkflowRun, Canvas
 from .agent_service import AgentService
-from database import SessionLocal
+from .run_event_log import RunEventLog, count_events, iter_events, read_events
+from .node_cache import NodeResultCache
+from .checkpoint_service import RunCheckpoint, current_checkpoint, load_completed_outputs, nodes_to_rerun
+from .llm_cache import CacheUsage, current_cache_usage
+from .token_stream import TokenStream, current_token_stream
+from .memory_service import current_memory_session
+from .llm_scheduler import PRIORITIES, current_llm_priority
+from .websocket_manager import execution_channel
+from database import AsyncSessionLocal
+from config import settings
 
 logger = logging.getLogger(__name__)
 
 class WorkflowService:
     """工作流服务类"""
     
-    def __init__(self):
+    # 各类工作流中会单独执行并保存检查点的节点类型，未列出的工作流类型（simple）为全部节点
+    _CHECKPOINTED_NODE_TYPES = {
+        "crewai": {"task"},
+        "langgraph": {"agent", "tool", "condition"},
+    }
+    
+    def __init__(self, connection_manager=None):
         self.agent_service = AgentService()
+        self.connection_manager = connection_manager  # 用于向执行面板推送 token 和状态
         self.active_workflows = {}  # 活跃的工作流实例
+        self.node_cache = NodeResultCache()
     
     async def execute_workflow(self, workflow_data: Dict) -> Dict:
         """执行工作流"""
@@ -31,8 +51,7 @@ class WorkflowService:
         logger.info(f"开始执行工作流: {workflow_id}")
         
         # 创建工作流执行记录
-        db = SessionLocal()
-        try:
+        async with AsyncSessionLocal() as db:
             workflow_run = WorkflowRun(
                 project_id=workflow_data.get("project_id"),
                 canvas_id=canvas_id,
@@ -41,28 +60,118 @@ class WorkflowService:
                 started_at=datetime.now()
             )
             db.add(workflow_run)
-            db.commit()
-            db.refresh(workflow_run)
+            await db.commit()
+            await db.refresh(workflow_run)
+            
+            return await self._run_workflow(workflow_id, workflow_run, RunCheckpoint(workflow_run.id), db)
+    
+    async def resume_workflow(self, run_id: str) -> Dict:
+        """从检查点恢复工作流执行，只重新执行失败及其下游的节点"""
+        async with AsyncSessionLocal() as db:
+            workflow_run = await db.get(WorkflowRun, run_id)
+            if not workflow_run:
+                return {"error": "工作流记录不存在"}
+            
+            if workflow_run.status == "completed":
+                return {"error": "工作流已完成，无需恢复"}
             
+            if run_id in self.active_workflows:
+                return {"error": "工作流正在运行中"}
+            
+            canvas = await db.get(Canvas, workflow_run.canvas_id, options=[undefer(Canvas.canvas_data)])
+            if not canvas:
+                return {"error": "画布不存在"}
+            
+            completed = await load_completed_outputs(db, run_id)
+            rerun = nodes_to_rerun(
+                canvas.canvas_data, set(completed),
+                self._CHECKPOINTED_NODE_TYPES.get(self._determine_workflow_type(canvas.canvas_data))
+            )
+            reusable = {
+                node_id: output for node_id, output in completed.items()
+                if node_id not in rerun
+            }
+            
+            logger.info(f"恢复工作流执行: {run_id}, 复用 {len(reusable)} 个节点, 重新执行 {len(rerun)} 个节点")
+            
+            workflow_run.status = "running"
+            workflow_run.error_message = None
+            workflow_run.completed_at = None
+            await db.commit()
+            
+            workflow_id = (workflow_run.input_data or {}).get("workflow_id")
+            return await self._run_workflow(workflow_id, workflow_run, RunCheckpoint(run_id, reusable), db)
+    
+    @staticmethod
+    def _memory_session(workflow_run: WorkflowRun, session_id: Optional[str]) -> str:
+        """记忆会话 ID：客户端传入的会话 ID 加上项目前缀，不同项目（用户）之间不会共享记忆"""
+        session_id = str(session_id or workflow_run.canvas_id)
+        if len(session_id) > 63:
+            session_id = hashlib.sha256(session_id.encode("utf-8")).hexdigest()[:32]
+        return f"{workflow_run.project_id}:{session_id}"
+    
+    async def _run_workflow(self, workflow_id: str, workflow_run: WorkflowRun,
+                            checkpoint: RunCheckpoint, db: AsyncSession) -> Dict:
+        """执行工作流主体并更新执行记录"""
+        # 失败时会回滚会话，执行记录随之过期，之后用到的字段先取出
+        run_id, canvas_id = workflow_run.id, workflow_run.canvas_id
+        status = "failed"
+        event_log = RunEventLog(db, run_id)
+        self.active_workflows[run_id] = workflow_id
+        token = current_checkpoint.set(checkpoint)
+        cache_usage = CacheUsage(canvas_id)
+        cache_token = current_cache_usage.set(cache_usage)
+        token_stream = TokenStream(self._channel_sender(canvas_id, workflow_id))
+        stream_token = current_token_stream.set(token_stream)
+        # Agent 记忆按会话隔离，未指定会话时同一画布的多次执行共享记忆
+        input_data = workflow_run.input_data or {}
+        memory_token = current_memory_session.set(self._memory_session(workflow_run, input_data.get("session_id")))
+        # 交互式执行的 LLM 请求优先于批量执行
+        priority = input_data.get("priority", "interactive")
+        priority_token = current_llm_priority.set(priority if priority in PRIORITIES else "interactive")
+        try:
             # 解析画布数据
-            canvas = db.query(Canvas).filter(Canvas.id == canvas_id).first()
+            canvas = await db.get(Canvas, canvas_id, options=[undefer(Canvas.canvas_data)])
             if not canvas:
                 raise ValueError("画布不存在")
             
             canvas_data = canvas.canvas_data
+            # 结束读事务，执行期间不占用连接池中的连接
+            await db.commit()
             
             # 根据工作流类型执行
             workflow_type = self._determine_workflow_type(canvas_data)
             
+            await event_log.append("workflow_started", {
+                "workflow_type": workflow_type,
+                "canvas_version": canvas.version,
+                "node_count": len(canvas_data.get("nodes", [])),
+                "resumed_nodes": list(checkpoint.completed)
+            })
+            
+            cache_key = (canvas.id, canvas.version)
+            
             if workflow_type == "crewai":
-                result = await self._execute_crewai_workflow(canvas_data, workflow_run.id, db)
+                result = await self._execute_crewai_workflow(canvas_data, event_log, cache_key)
             elif workflow_type == "langgraph":
-                result = await self._execute_langgraph_workflow(canvas_data, workflow_run.id, db)
+                result = await self._execute_langgraph_workflow(canvas_data, event_log, cache_key)
             else:
-                result = await self._execute_simple_workflow(canvas_data, workflow_run.id, db)
+                result = await self._execute_simple_workflow(canvas_data, event_log)
+            
+            # 发送剩余 token，并记录每个 Agent 节点的首 token 时间
+            await token_stream.aclose()
+            for node_id, ttft in token_stream.ttft.items():
+                await event_log.append("node_metrics", {"ttft_ms": round(ttft * 1000, 1)}, node_id=node_id)
+            
+            await event_log.append("workflow_finished", {
+                "success": result["success"],
+                "llm_cache": cache_usage.to_dict()
+            })
+            await event_log.flush()
             
             # 更新执行记录
-            workflow_run.status = "completed" if result["success"] else "failed"
+            status = "completed" if result["success"] else "failed"
+            workflow_run.status = status
             workflow_run.output_data = result
             workflow_run.completed_at = datetime.now()
             workflow_run.execution_time = (
@@ -72,14 +181,14 @@ class WorkflowService:
             if not result["success"]:
                 workflow_run.error_message = result.get("error", "未知错误")
             
-            db.commit()
+            await db.commit()
             
-            logger.info(f"工作流执行完成: {workflow_id}, 状态: {workflow_run.status}")
+            logger.info(f"工作流执行完成: {workflow_id}, 状态: {status}")
             
             return {
                 "workflow_id": workflow_id,
-                "run_id": workflow_run.id,
-                "status": workflow_run.status,
+                "run_id": run_id,
+                "status": status,
                 "result": result,
                 "execution_time": workflow_run.execution_time
             }
@@ -87,21 +196,57 @@ class WorkflowService:
         except Exception as e:
             logger.error(f"工作流执行失败: {e}")
             
-            # 更新失败状态
-            if 'workflow_run' in locals():
-                workflow_run.status = "failed"
-                workflow_run.error_message = str(e)
-                workflow_run.completed_at = datetime.now()
-                db.commit()
+            # 先回滚失败时可能处于出错状态的事务，再写入失败事件和状态
+            status = "failed"
+            await db.rollback()
+            try:
+                await event_log.append("error", {"error": str(e)})
+                await event_log.flush()
+            except Exception as flush_error:
+                # 事件无法写入时仍要把执行标记为失败
+                logger.error(f"写入失败事件失败: {flush_error}")
+            workflow_run.status = "failed"
+            workflow_run.error_message = str(e)
+            workflow_run.completed_at = datetime.now()
+            await db.commit()
             
             return {
                 "workflow_id": workflow_id,
-                "status": "failed",
+                "run_id": run_id,
+                "status": status,
                 "error": str(e)
             }
         
         finally:
-            db.close()
+            await token_stream.aclose()
+            await self._notify(canvas_id, workflow_id, {
+                "type": "status_update",
+                "run_id": run_id,
+                "status": status
+            })
+            current_token_stream.reset(stream_token)
+            current_memory_session.reset(memory_token)
+            current_llm_priority.reset(priority_token)
+            current_checkpoint.reset(token)
+            current_cache_usage.reset(cache_token)
+            self.active_workflows.pop(run_id, None)
+    
+    def _channel_sender(self, canvas_id: str, workflow_id: str):
+        """返回向执行面板频道（所有订阅者）发送消息的函数"""
+        if self.connection_manager is None or not canvas_id or not workflow_id:
+            return None
+        channel = execution_channel(canvas_id, workflow_id)
+        
+        async def send(frame: Dict):
+            await self.connection_manager.publish(channel, frame)
+        
+        return send
+    
+    async def _notify(self, canvas_id: str, workflow_id: str, frame: Dict):
+        """向执行面板推送消息"""
+        send = self._channel_sender(canvas_id, workflow_id)
+        if send:
+            await send(frame)
     
     def _determine_workflow_type(self, canvas_data: Dict) -> str:
         """判断工作流类型"""
@@ -119,21 +264,25 @@ class WorkflowService:
         
         return "simple"
     
-    async def _execute_crewai_workflow(self, canvas_data: Dict, run_id: str, db: Session) -> Dict:
+    async def _execute_crewai_workflow(self, canvas_data: Dict, event_log: RunEventLog,
+                                       cache_key: Tuple[str, int] = None) -> Dict:
         """执行 CrewAI 工作流"""
         try:
             # 转换画布数据为 CrewAI 配置
             crew_config = self._convert_to_crewai_config(canvas_data)
             
-            # 使用 Agent 服务执行
-            result = await self.agent_service.execute_crew_workflow(crew_config)
+            # 使用 Agent 服务执行（无依赖的任务并发执行，按任务保存检查点）
+            result = await self.agent_service.execute_crew_workflow(crew_config, cache_key)
             
-            # 更新执行日志
-            self._update_execution_log(run_id, {
-                "type": "crewai",
-                "crew_config": crew_config,
-                "result": result
-            }, db)
+            # 按依赖顺序记录每个任务的执行事件（不再嵌入完整 crew_config）
+            for task_result in result.get("task_results", []):
+                await event_log.append("node_result", task_result, node_id=task_result["node_id"])
+            await event_log.append("crew_result", {
+                "agent_count": len(crew_config["agents"]),
+                "task_count": len(crew_config["tasks"]),
+                "success": result["success"],
+                "error": result.get("error")
+            })
             
             return result
             
@@ -141,18 +290,18 @@ class WorkflowService:
             logger.error(f"CrewAI 工作流执行失败: {e}")
             return {"success": False, "error": str(e)}
     
-    async def _execute_langgraph_workflow(self, canvas_data: Dict, run_id: str, db: Session) -> Dict:
+    async def _execute_langgraph_workflow(self, canvas_data: Dict, event_log: RunEventLog,
+                                          cache_key: Tuple[str, int] = None) -> Dict:
         """执行 LangGraph 工作流"""
         try:
             # 使用 Agent 服务执行
-            result = await self.agent_service.execute_langgraph_workflow(canvas_data)
+            result = await self.agent_service.execute_langgraph_workflow(canvas_data, cache_key)
             
-            # 更新执行日志
-            self._update_execution_log(run_id, {
-                "type": "langgraph",
-                "canvas_data": canvas_data,
-                "result": result
-            }, db)
+            # 记录每个节点的执行事件（不再嵌入完整 canvas_data）
+            for node_result in result.get("result") or []:
+                await event_log.append("node_result", node_result, node_id=node_result.get("node_id"))
+            if result.get("error"):
+                await event_log.append("error", {"error": result["error"]})
             
             return result
             
@@ -160,29 +309,54 @@ class WorkflowService:
             logger.error(f"LangGraph 工作流执行失败: {e}")
             return {"success": False, "error": str(e)}
     
-    async def _execute_simple_workflow(self, canvas_data: Dict, run_id: str, db: Session) -> Dict:
+    async def _execute_simple_workflow(self, canvas_data: Dict, event_log: RunEventLog) -> Dict:
         """执行简单工作流"""
         try:
             nodes = canvas_data.get("nodes", [])
             edges = canvas_data.get("edges", [])
             
+            # 记录每个节点的上游节点，用于计算缓存键
+            upstream = {}
+            for edge in edges:
+                upstream.setdefault(edge["target"], []).append(edge["source"])
+            
             # 按顺序执行节点
             execution_results = []
+            node_outputs = {}
+            
+            checkpoint = current_checkpoint.get()
             
             for node in nodes:
-                node_result = await self._execute_node(node)
-                execution_results.append({
+                if checkpoint and node["id"] in checkpoint.completed:
+                    # 复用检查点中的结果
+                    node_result, cache_hit = checkpoint.completed[node["id"]], False
+                    await event_log.append("node_resumed", {}, node_id=node["id"])
+                else:
+                    node_result, cache_hit = await self._execute_node_cached(
+                        node,
+                        [node_outputs.get(source_id) for source_id in upstream.get(node["id"], [])]
+                    )
+                    if checkpoint:
+                        if node_result.get("success", True) and "error" not in node_result:
+                            await checkpoint.save(node["id"], node_result)
+                        else:
+                            await checkpoint.save(node["id"], status="failed", error=node_result.get("error"))
+                node_outputs[node["id"]] = node_result
+                
+                if cache_hit:
+                    await event_log.append("node_cache_hit", {}, node_id=node["id"])
+                
+                entry = {
                     "node_id": node["id"],
                     "node_type": node.get("type"),
                     "result": node_result,
+                    "cached": cache_hit,
                     "timestamp": datetime.now().isoformat()
-                })
-            
-            # 更新执行日志
-            self._update_execution_log(run_id, {
-                "type": "simple",
-                "execution_results": execution_results
-            }, db)
+                }
+                execution_results.append(entry)
+                
+                # 记录执行事件
+                await event_log.append("node_result", entry, node_id=node["id"])
             
             return {
                 "success": True,
@@ -193,6 +367,34 @@ class WorkflowService:
             logger.error(f"简单工作流执行失败: {e}")
             return {"success": False, "error": str(e)}
     
+    async def _execute_node_cached(self, node: Dict, upstream_results: List[Any]) -> Tuple[Dict, bool]:
+        """执行节点，开启缓存的节点在输入未变化时直接复用上次结果"""
+        if not NodeResultCache.is_enabled(node):
+            return await self._execute_node(node), False
+        
+        key = NodeResultCache.make_key(node, upstream_results, self._node_version(node))
+        cached = await self.node_cache.get(key)
+        if cached is not None:
+            return cached, True
+        
+        node_result = await self._execute_node(node)
+        
+        # 只缓存成功的结果
+        if node_result.get("success", True) and "error" not in node_result:
+            await self.node_cache.set(key, node_result)
+        
+        return node_result, False
+    
+    def _node_version(self, node: Dict) -> str:
+        """获取节点所依赖的模型或工具版本"""
+        data = node.get("data", {})
+        if node.get("type") == "agent":
+            llm_config = data.get("config", {}).get("llm_config") or {}
+            return llm_config.get("model", settings.DEFAULT_LLM_MODEL)
+        if node.get("type") == "tool":
+            return f"{data.get('tool_name', '')}:{data.get('tool_version', '')}"
+        return ""
+    
     async def _execute_node(self, node: Dict) -> Dict:
         """执行单个节点"""
         node_type = node.get("type")
@@ -264,53 +466,58 @@ class WorkflowService:
         
         agents = []
         tasks = []
+        agent_indexes = {}  # Agent 节点 ID -> Agent 序号
         
         for node in nodes:
             if node.get("type") == "agent":
                 agent_data = node.get("data", {})
+                agent_indexes[node["id"]] = len(agents)
                 agents.append({
+                    "id": agent_data.get("agent_id", node["id"]),
                     "role": agent_data.get("role", "Assistant"),
                     "goal": agent_data.get("goal", ""),
                     "backstory": agent_data.get("backstory", ""),
-                    "tools": agent_data.get("tools", [])
+                    "tools": agent_data.get("tools", []),
+                    "llm_config": agent_data.get("llm_config", {}),
+                    "memory_config": agent_data.get("memory_config", {})
                 })
             elif node.get("type") == "task":
                 task_data = node.get("data", {})
                 tasks.append({
+                    "id": node["id"],
                     "description": task_data.get("description", ""),
-                    "agent_index": task_data.get("agent_index", 0)
+                    "agent_index": task_data.get("agent_index", 0),
+                    "depends_on": []
                 })
         
+        # 任务之间的边表示依赖；Agent 指向任务的边表示由该 Agent 执行
+        tasks_by_id = {task["id"]: task for task in tasks}
+        for edge in edges:
+            task = tasks_by_id.get(edge["target"])
+            if not task:
+                continue
+            if edge["source"] in tasks_by_id:
+                task["depends_on"].append(edge["source"])
+            elif edge["source"] in agent_indexes:
+                task["agent_index"] = agent_indexes[edge["source"]]
+        
         return {
             "agents": agents,
             "tasks": tasks
         }
     
-    def _update_execution_log(self, run_id: str, log_data: Dict, db: Session):
-        """更新执行日志"""
-        try:
-            workflow_run = db.query(WorkflowRun).filter(WorkflowRun.id == run_id).first()
-            if workflow_run:
-                if workflow_run.execution_log:
-                    execution_log = workflow_run.execution_log
-                else:
-                    execution_log = []
-                
-                execution_log.append(log_data)
-                workflow_run.execution_log = execution_log
-                db.commit()
-                
-        except Exception as e:
-            logger.error(f"更新执行日志失败: {e}")
-    
-    async def get_workflow_status(self, run_id: str) -> Dict:
-        """获取工作流执行状态"""
-        db = SessionLocal()
-        try:
-            workflow_run = db.query(WorkflowRun).filter(WorkflowRun.id == run_id).first()
+    async def get_workflow_status(self, run_id: str, after: int = None, limit: int = None) -> Dict:
+        """获取工作流执行状态
+        
+        默认返回最新的一页执行事件；传入 after 游标可继续向后读取。
+        """
+        async with AsyncSessionLocal() as db:
+            workflow_run = await db.get(WorkflowRun, run_id)
             if not workflow_run:
                 return {"error": "工作流记录不存在"}
             
+            events = await read_events(db, run_id, after=after, limit=limit)
+            
             return {
                 "run_id": workflow_run.id,
                 "status": workflow_run.status,
@@ -318,17 +525,56 @@ class WorkflowService:
                 "completed_at": workflow_run.completed_at,
                 "execution_time": workflow_run.execution_time,
                 "error_message": workflow_run.error_message,
-                "execution_log": workflow_run.execution_log or []
+                "execution_log": events["events"],
+                "next_cursor": events["next_cursor"],
+                "prev_cursor": events["prev_cursor"],
+                "has_more": events["has_more"]
             }
-            
-        finally:
-            db.close()
+    
+    async def get_workflow_status_version(self, run_id: str) -> Optional[Tuple]:
+        """返回决定状态响应内容的版本信息（状态、完成时间、事件条数等），不读取事件内容；记录不存在时返回 None"""
+        async with AsyncSessionLocal() as db:
+            workflow_run = await db.get(WorkflowRun, run_id)
+            if not workflow_run:
+                return None
+            event_count, last_event_id = await count_events(db, run_id)
+            return (
+                workflow_run.id, workflow_run.status, workflow_run.completed_at,
+                workflow_run.error_message, event_count, last_event_id
+            )
+    
+    async def stream_workflow_status(
+        self, run_id: str, after: int = None
+    ) -> Optional[Tuple[Dict, AsyncIterator[Dict]]]:
+        """流式获取工作流状态
+        
+        返回 (状态字段, after 之后全部执行事件的异步迭代器)；事件在迭代时用独立的会话逐批读取。
+        """
+        async with AsyncSessionLocal() as db:
+            workflow_run = await db.get(WorkflowRun, run_id)
+            if not workflow_run:
+                return None
+            status = {
+                "run_id": workflow_run.id,
+                "status": workflow_run.status,
+                "started_at": workflow_run.started_at,
+                "completed_at": workflow_run.completed_at,
+                "execution_time": workflow_run.execution_time,
+                "error_message": workflow_run.error_message,
+                "has_more": False
+            }
+        
+        async def events():
+            async with AsyncSessionLocal() as db:
+                async for event in iter_events(db, run_id, after=after):
+                    yield event
+        
+        return status, events()
     
     async def cancel_workflow(self, run_id: str) -> Dict:
         """取消工作流执行"""
-        db = SessionLocal()
-        try:
-            workflow_run = db.query(WorkflowRun).filter(WorkflowRun.id == run_id).first()
+        async with AsyncSessionLocal() as db:
+            workflow_run = await db.get(WorkflowRun, run_id)
             if not workflow_run:
                 return {"error": "工作流记录不存在"}
             
@@ -337,7 +583,7 @@ class WorkflowService:
             
             workflow_run.status = "cancelled"
             workflow_run.completed_at = datetime.now()
-            db.commit()
+            await db.commit()
             
             # 如果工作流正在运行，尝试停止
             if run_id in self.active_workflows:
@@ -345,6 +591,3 @@ class WorkflowService:
                 del self.active_workflows[run_id]
             
             return {"message": "工作流已取消"}
-            
-        finally:
-            db.close()
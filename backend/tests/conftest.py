@@ -0,0 +1,12 @@
+"""
+测试公共配置：使用临时 SQLite 数据库，并把 backend 目录加入导入路径
+"""
+
+import os
+import sys
+import tempfile
+
+_db_dir = tempfile.mkdtemp(prefix="agent-platform-test-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_db_dir, 'test.db')}")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,82 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from api.auth import create_access_token, get_current_user, set_user_status
+from database import AsyncSessionLocal, async_engine
+from models import Base, User
+from services.auth_cache import MemoryPrincipalBackend, PrincipalCache, UserPrincipal, principal_cache
+
+def token_for(user_id, username=None):
+    return create_access_token({"sub": username or user_id, "uid": user_id}, timedelta(minutes=5))
+
+async def create_users(*users):
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSessionLocal() as db:
+        for user_id, is_superuser in users:
+            db.add(User(id=user_id, username=user_id, email=f"{user_id}@example.com",
+                        hashed_password="x", is_superuser=is_superuser))
+        await db.commit()
+
+def test_deactivated_user_is_rejected_before_cache_ttl_expires():
+    async def run():
+        try:
+            await create_users(("auth-alice", False), ("auth-admin", True))
+            token = token_for("auth-alice")
+            async with AsyncSessionLocal() as db:
+                await get_current_user(token, db)
+                hits = principal_cache.hits
+                assert (await get_current_user(token, db)).id == "auth-alice"
+                assert principal_cache.hits == hits + 1
+
+                admin = await get_current_user(token_for("auth-admin"), db)
+                await set_user_status("auth-alice", {"is_active": False}, admin, db)
+
+                with pytest.raises(HTTPException) as rejected:
+                    await get_current_user(token, db)
+                return rejected.value
+        finally:
+            await async_engine.dispose()
+
+    rejected = asyncio.run(run())
+    assert rejected.status_code == 401
+    assert rejected.detail == "用户账户已被禁用"
+
+def test_token_never_resolves_from_another_users_cache_entry():
+    async def run():
+        cache = PrincipalCache(MemoryPrincipalBackend(), ttl=60)
+        alice_token, bob_token = token_for("alice"), token_for("bob")
+        await cache.set(alice_token, UserPrincipal("alice", "alice"))
+
+        assert (await cache.get("alice", alice_token)).id == "alice"
+        assert await cache.get("bob", alice_token) is None
+        assert await cache.get("alice", bob_token) is None
+
+        await cache.set(bob_token, UserPrincipal("bob", "bob"))
+        await cache.invalidate("alice")
+        return await cache.get("alice", alice_token), await cache.get("bob", bob_token)
+
+    alice, bob = asyncio.run(run())
+    assert alice is None
+    assert bob.id == "bob"
+
+def test_token_with_mismatched_uid_is_rejected_and_not_cached():
+    async def run():
+        try:
+            await create_users(("auth-carol", False), ("auth-dave", False))
+            async with AsyncSessionLocal() as db:
+                # 已缓存 carol 的身份
+                await get_current_user(token_for("auth-carol"), db)
+                forged = token_for("auth-carol", username="auth-dave")
+                with pytest.raises(HTTPException) as rejected:
+                    await get_current_user(forged, db)
+                return rejected.value, await principal_cache.get("auth-carol", forged)
+        finally:
+            await async_engine.dispose()
+
+    rejected, cached = asyncio.run(run())
+    assert rejected.status_code == 401
+    assert cached is None
@@ -0,0 +1,171 @@
+import asyncio
+import json
+
+from sqlalchemy import update
+
+from config import settings
+from database import AsyncSessionLocal, async_engine
+from models import Base, Canvas, Project, User
+from services import canvas_collab
+from services.canvas_collab import CanvasRoom, Participant
+
+class FakeUser:
+    def __init__(self, id):
+        self.id = id
+        self.username = id
+
+class FakeSocket:
+    def __init__(self, blocked: bool = False):
+        self.sent = []
+        self.closed_with = None
+        self.unblock = asyncio.Event()
+        if not blocked:
+            self.unblock.set()
+
+    async def send_text(self, text):
+        await self.unblock.wait()
+        self.sent.append(json.loads(text))
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+def add_node(node_id):
+    return {"op": "add_node", "node": {"id": node_id}}
+
+def node_ids(document):
+    return [node["id"] for node in document["nodes"]]
+
+async def create_canvas(canvas_id):
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSessionLocal() as db:
+        db.add_all([
+            User(id=f"{canvas_id}-user", username=canvas_id, email=f"{canvas_id}@example.com", hashed_password="x"),
+            Project(id=f"{canvas_id}-project", name="p", owner_id=f"{canvas_id}-user"),
+            Canvas(id=canvas_id, project_id=f"{canvas_id}-project", name="c",
+                   canvas_data={"nodes": [], "edges": []}, version=1),
+        ])
+        await db.commit()
+    return CanvasRoom(canvas_id, 1, {"nodes": [], "edges": []})
+
+async def stored(canvas_id):
+    async with AsyncSessionLocal() as db:
+        canvas = await db.get(Canvas, canvas_id)
+        await db.refresh(canvas, ["canvas_data"])
+        return canvas.version, canvas.canvas_data
+
+def join(room, socket):
+    participant = Participant(socket, FakeUser("user"), "#000")
+    room.participants[participant.client_id] = participant
+    return participant
+
+def test_ops_arriving_during_flush_are_saved_in_next_version(monkeypatch):
+    monkeypatch.setattr(settings, "COLLAB_FLUSH_INTERVAL", 0.01)
+    original = canvas_collab.write_canvas_data
+    batches = []
+
+    async def run():
+        started, release = asyncio.Event(), asyncio.Event()
+
+        async def slow_write(db, *args, patch=None, **kwargs):
+            batches.append(patch)
+            if len(batches) == 1:
+                started.set()
+                await release.wait()
+            return await original(db, *args, patch=patch, **kwargs)
+
+        monkeypatch.setattr(canvas_collab, "write_canvas_data", slow_write)
+        try:
+            room = await create_canvas("canvas-collab-flush")
+            socket = FakeSocket()
+            participant = join(room, socket)
+
+            room.apply(participant, {"type": "op", "client_seq": 1, "patch": [add_node("a")]})
+            await started.wait()
+            # 第一次写入尚未完成时到达的操作
+            room.apply(participant, {"type": "op", "client_seq": 2, "patch": [add_node("b")]})
+            release.set()
+
+            for _ in range(200):
+                if room.version == 3 and not room.pending:
+                    break
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(0)
+            version, data = await stored(room.canvas_id)
+            participant.close()
+            return version, data, socket.sent
+        finally:
+            await async_engine.dispose()
+
+    version, data, sent = asyncio.run(run())
+
+    assert batches == [[add_node("a")], [add_node("b")]]
+    assert version == 3
+    assert node_ids(data) == ["a", "b"]
+    assert [(m["type"], m.get("seq"), m.get("version")) for m in sent] == [
+        ("op", 1, None), ("op", 2, None), ("saved", 2, 2), ("saved", 2, 3),
+    ]
+
+def test_flush_rebases_pending_ops_after_version_conflict(monkeypatch):
+    monkeypatch.setattr(settings, "COLLAB_FLUSH_INTERVAL", 60)
+
+    async def run():
+        try:
+            room = await create_canvas("canvas-collab-rebase")
+            socket = FakeSocket()
+            participant = join(room, socket)
+            # 画布在房间外被保存（REST 接口），房间仍基于版本 1
+            async with AsyncSessionLocal() as db:
+                await db.execute(update(Canvas).where(Canvas.id == room.canvas_id).values(
+                    version=2, canvas_data={"nodes": [{"id": "external"}], "edges": []}
+                ))
+                await db.commit()
+
+            room.apply(participant, {"type": "op", "client_seq": 1, "patch": [add_node("local")]})
+            await room.flush()
+            room._flush_task.cancel()
+            await asyncio.sleep(0)
+            version, data = await stored(room.canvas_id)
+            participant.close()
+            return room, version, data, socket.sent
+        finally:
+            await async_engine.dispose()
+
+    room, version, data, sent = asyncio.run(run())
+
+    assert version == room.version == 3
+    assert node_ids(data) == node_ids(room.document) == ["external", "local"]
+    assert room.pending == []
+    snapshot = next(message for message in sent if message["type"] == "snapshot")
+    assert snapshot["version"] == 2
+    assert node_ids(snapshot["canvas_data"]) == ["external", "local"]
+    assert sent[-1] == {"type": "saved", "version": 3, "seq": room.seq}
+
+def test_slow_participant_is_dropped_without_blocking_others(monkeypatch):
+    monkeypatch.setattr(settings, "COLLAB_SEND_QUEUE_SIZE", 2)
+
+    async def run():
+        room = CanvasRoom("canvas-collab-slow", 1, None)
+        slow_socket, fast_socket = FakeSocket(blocked=True), FakeSocket()
+        slow, fast = join(room, slow_socket), join(room, fast_socket)
+        await asyncio.sleep(0)
+
+        for index in range(5):
+            room.broadcast({"type": "cursor", "x": index}, droppable=True)
+            await asyncio.sleep(0)
+        dropped_cursors_only = not slow.closed
+
+        for seq in range(1, 5):
+            room.broadcast({"type": "op", "seq": seq})
+            await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        fast.close()
+        return dropped_cursors_only, slow, slow_socket, fast_socket
+
+    dropped_cursors_only, slow, slow_socket, fast_socket = asyncio.run(run())
+
+    assert dropped_cursors_only
+    assert slow.closed
+    assert slow_socket.closed_with == 1013
+    assert [message["seq"] for message in fast_socket.sent if message["type"] == "op"] == [1, 2, 3, 4]
+    assert len([message for message in fast_socket.sent if message["type"] == "cursor"]) == 5
@@ -0,0 +1,72 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select, update
+
+from api.canvas import _load_version_data
+from config import settings
+from database import AsyncSessionLocal, async_engine
+from models import Base, Canvas, CanvasVersion, Project, User
+from services.canvas_history import (
+    VersionCompactedError, compact_history, list_versions, load_version, record_version
+)
+
+VERSIONS = settings.CANVAS_SNAPSHOT_INTERVAL + 5
+
+def document(version):
+    return {"nodes": [{"id": f"n{i}", "data": {"label": f"node {i}"}} for i in range(20)], "version": version}
+
+async def seed(db, canvas_id):
+    """保存 VERSIONS 个版本，全部早于保留期：版本 1 和 1 + 间隔为快照，其余为增量"""
+    db.add_all([
+        User(id=f"{canvas_id}-user", username=canvas_id, email=f"{canvas_id}@example.com", hashed_password="x"),
+        Project(id=f"{canvas_id}-project", name="p", owner_id=f"{canvas_id}-user"),
+        Canvas(id=canvas_id, project_id=f"{canvas_id}-project", name="c",
+               canvas_data=document(VERSIONS), version=VERSIONS),
+    ])
+    for version in range(1, VERSIONS + 1):
+        await record_version(db, canvas_id, version, document(version),
+                             previous=document(version - 1) if version > 1 else None)
+        await db.flush()
+    expired = datetime.now(timezone.utc) - timedelta(days=settings.CANVAS_HISTORY_RETENTION_DAYS + 1)
+    await db.execute(update(CanvasVersion).where(CanvasVersion.canvas_id == canvas_id).values(created_at=expired))
+    await db.commit()
+    return await db.get(Canvas, canvas_id)
+
+def test_compaction_keeps_snapshots_and_reports_compacted_versions():
+    async def run():
+        async with async_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        try:
+            async with AsyncSessionLocal() as db:
+                canvas = await seed(db, "canvas-compaction")
+                kinds = dict((await db.execute(
+                    select(CanvasVersion.version, CanvasVersion.kind).where(CanvasVersion.canvas_id == canvas.id)
+                )).all())
+                latest_snapshot = max(version for version, kind in kinds.items() if kind == "snapshot")
+                assert latest_snapshot > 1
+
+                deleted = await compact_history(db)
+                assert deleted == latest_snapshot - 2
+
+                listed = [row["version"] for row in (await list_versions(db, canvas.id, limit=100))["versions"]]
+                assert listed == list(range(VERSIONS, latest_snapshot - 1, -1)) + [1]
+
+                # 保留的快照及其之后的版本仍可完整重建
+                assert await load_version(db, canvas.id, 1) == document(1)
+                assert await load_version(db, canvas.id, VERSIONS - 1) == document(VERSIONS - 1)
+
+                with pytest.raises(VersionCompactedError):
+                    await load_version(db, canvas.id, 2)
+                with pytest.raises(HTTPException) as gone:
+                    await _load_version_data(db, canvas, latest_snapshot - 1)
+                assert gone.value.status_code == 410
+                with pytest.raises(HTTPException) as missing:
+                    await _load_version_data(db, canvas, VERSIONS + 1)
+                assert missing.value.status_code == 404
+        finally:
+            await async_engine.dispose()
+
+    asyncio.run(run())
@@ -0,0 +1,32 @@
+import pytest
+
+from services.canvas_patch import PatchError, apply_patch
+
+DOCUMENT = {
+    "nodes": [{"id": "a", "label": "A"}, {"id": "b"}],
+    "edges": [{"id": "e1", "source": "a", "target": "b"}, "legacy-edge"],
+}
+
+@pytest.mark.parametrize("operation", [
+    {"op": "update_node", "id": "a", "set": ["label"]},
+    {"op": "update_node", "id": "a", "unset": "label"},
+    {"op": "update_node", "id": "a", "unset": [1]},
+    {"op": "update_node", "id": "a", "unset": ["id"]},
+])
+def test_invalid_update_raises_patch_error(operation):
+    with pytest.raises(PatchError):
+        apply_patch(DOCUMENT, [operation])
+
+def test_entity_op_on_non_list_field_raises_patch_error():
+    with pytest.raises(PatchError):
+        apply_patch({"nodes": {}}, [{"op": "add_node", "node": {"id": "a"}}])
+
+def test_remove_node_keeps_non_object_edges():
+    result = apply_patch(DOCUMENT, [{"op": "remove_node", "id": "a"}])
+    assert result == {"nodes": [{"id": "b"}], "edges": ["legacy-edge"]}
+    assert len(DOCUMENT["edges"]) == 2
+
+def test_update_sets_and_unsets_fields():
+    result = apply_patch(DOCUMENT, [{"op": "update_node", "id": "a", "set": {"x": 1}, "unset": ["label"]}])
+    assert result["nodes"][0] == {"id": "a", "x": 1}
+    assert DOCUMENT["nodes"][0] == {"id": "a", "label": "A"}
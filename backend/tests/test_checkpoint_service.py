@@ -0,0 +1,29 @@
+from services.checkpoint_service import nodes_to_rerun
+
+CREW_CANVAS = {
+    "nodes": [
+        {"id": "a1", "type": "agent"},
+        {"id": "a2", "type": "agent"},
+        {"id": "t1", "type": "task"},
+        {"id": "t2", "type": "task"},
+        {"id": "t3", "type": "task"},
+    ],
+    "edges": [
+        {"source": "a1", "target": "t1"},
+        {"source": "a2", "target": "t2"},
+        {"source": "a2", "target": "t3"},
+        {"source": "t1", "target": "t3"},
+    ],
+}
+
+def test_agent_nodes_without_checkpoints_do_not_force_rerun():
+    rerun = nodes_to_rerun(CREW_CANVAS, {"t1", "t2"}, {"task"})
+    assert rerun == {"t3"}
+
+def test_failed_task_reruns_downstream():
+    rerun = nodes_to_rerun(CREW_CANVAS, {"t2"}, {"task"})
+    assert rerun == {"t1", "t3"}
+
+def test_all_node_types_checkpointed_by_default():
+    rerun = nodes_to_rerun(CREW_CANVAS, {"t1", "t2"})
+    assert rerun == {"a1", "a2", "t1", "t2", "t3"}
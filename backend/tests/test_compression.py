@@ -0,0 +1,50 @@
+import asyncio
+
+import httpx
+from fastapi import FastAPI, Header, Response
+
+from api.compression import CompressionMiddleware
+
+ETAG = '"v1"'
+BODY = "x" * 4096
+
+def _app() -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=1024)
+
+    @app.get("/doc")
+    async def doc(if_none_match: str = Header(None)):
+        if if_none_match == ETAG:
+            return Response(status_code=304, headers={"ETag": ETAG})
+        return Response(BODY, media_type="text/plain", headers={"ETag": ETAG})
+
+    return app
+
+def _get(headers):
+    async def run():
+        transport = httpx.ASGITransport(app=_app())
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/doc", headers=headers)
+    return asyncio.run(run())
+
+def test_compressed_etag_carries_encoding_suffix():
+    response = _get({"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == '"v1-gzip"'
+    assert response.text == BODY
+
+def test_matching_suffix_returns_304_with_vary():
+    response = _get({"Accept-Encoding": "gzip", "If-None-Match": '"v1-gzip"'})
+    assert response.status_code == 304
+    assert response.headers["etag"] == '"v1-gzip"'
+    assert "Accept-Encoding" in response.headers["vary"]
+
+def test_other_encoding_suffix_does_not_match():
+    response = _get({"Accept-Encoding": "br", "If-None-Match": '"v1-gzip"'})
+    assert response.status_code == 200
+    assert response.headers["etag"] == '"v1-br"'
+
+def test_suffixed_tag_does_not_match_uncompressed_response():
+    response = _get({"Accept-Encoding": "identity", "If-None-Match": '"v1-gzip"'})
+    assert response.status_code == 200
+    assert response.headers["etag"] == ETAG
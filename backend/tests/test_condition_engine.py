@@ -0,0 +1,39 @@
+"""
+条件表达式引擎测试
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from services.condition_engine import ConditionSyntaxError, compile_condition
+
+def _state(**data):
+    return SimpleNamespace(data=data, results=[], error=None, current_step=0)
+
+def test_paths_and_comparisons():
+    state = _state(score=0.9, label="ok", items=[1, 2, 3])
+    assert compile_condition("state.data.score >= 0.8 and data.label != 'spam'")(state)
+    assert compile_condition("len(data.items) == 3 && exists(data.label)")(state)
+    assert not compile_condition("data.missing > 1")(state)
+
+def test_unary_minus():
+    assert compile_condition("-1 < 0")(_state())
+    assert compile_condition("data.delta > -0.5")(_state(delta=0.1))
+    assert compile_condition("-data.delta == -2")(_state(delta=2))
+    assert compile_condition("-1 < 0").constant
+
+@pytest.mark.parametrize("source", [
+    "state.__class__ != null",
+    "state.__class__.__init__.__globals__ != null",
+    "data._private == 1",
+])
+def test_underscore_fields_rejected(source):
+    with pytest.raises(ConditionSyntaxError):
+        compile_condition(source)
+
+def test_attribute_access_limited_to_state_fields():
+    state = _state(text="abc")
+    assert compile_condition("data.text.upper == null")(state)
+    assert compile_condition("state.error == null")(state)
+    assert compile_condition("exists(state.data)")(state)
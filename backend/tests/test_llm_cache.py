@@ -0,0 +1,29 @@
+import numpy as np
+
+from config import settings
+from services.llm_cache import CacheUsage, LLMResponseCache, SemanticIndex, current_cache_usage
+
+def _unit(seed: int) -> np.ndarray:
+    vector = np.random.default_rng(seed).random(8)
+    return vector / np.linalg.norm(vector)
+
+def test_semantic_index_keeps_latest_entries():
+    index = SemanticIndex(threshold=0.999, max_entries=40)
+    for i in range(100):
+        index.add("scope", _unit(i), f"k{i}")
+
+    assert index.lookup("scope", _unit(0)) is None
+    assert index.lookup("scope", _unit(60)) == "k60"
+    assert index.lookup("scope", _unit(99)) == "k99"
+    assert index.lookup("other", _unit(99)) is None
+
+def test_workflow_usage_is_bounded(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_CACHE_MAX_WORKFLOW_STATS", 3)
+    cache = LLMResponseCache(backend=object(), semantic=False)
+    for workflow_id in "abcde":
+        token = current_cache_usage.set(CacheUsage(workflow_id))
+        cache._record("hits")
+        current_cache_usage.reset(token)
+
+    assert list(cache.workflow_usage) == ["c", "d", "e"]
+    assert cache.total.hits == 5
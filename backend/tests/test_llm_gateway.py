@@ -0,0 +1,146 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from config import settings
+from services.llm_gateway import LLMBackendError, LLMGateway
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_MAX_RETRIES", 2)
+    monkeypatch.setattr(settings, "LLM_RETRY_BACKOFF", 0.01)
+    monkeypatch.setattr(settings, "LLM_COALESCE_IDENTICAL", False)
+
+def _run(gateway: LLMGateway, coro):
+    async def run():
+        try:
+            return await coro
+        finally:
+            await gateway.aclose()
+    return asyncio.run(run())
+
+def _ollama(handler) -> LLMGateway:
+    return LLMGateway(transports={"ollama": httpx.MockTransport(handler)})
+
+def test_retries_unavailable_backend_then_succeeds():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) < 3:
+            return httpx.Response(503, headers={"Retry-After": "0"})
+        return httpx.Response(200, json={"response": "ok", "prompt_eval_count": 3, "eval_count": 1})
+
+    gateway = _ollama(handler)
+    result = _run(gateway, gateway.complete("hi", backend="ollama"))
+
+    assert result["text"] == "ok"
+    assert len(calls) == 3
+    assert gateway.backends["ollama"].retries == 2
+    assert gateway.backends["ollama"].in_flight == 0
+
+def test_gives_up_after_max_retries():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        raise httpx.ConnectError("connection refused", request=request)
+
+    gateway = _ollama(handler)
+    with pytest.raises(LLMBackendError):
+        _run(gateway, gateway.complete("hi", backend="ollama"))
+    assert len(calls) == 3
+
+def test_client_errors_are_not_retried():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(400, json={"error": "bad request"})
+
+    gateway = _ollama(handler)
+    with pytest.raises(LLMBackendError):
+        _run(gateway, gateway.complete("hi", backend="ollama"))
+    assert len(calls) == 1
+
+def test_read_timeout_is_reported_and_not_retried():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        raise httpx.ReadTimeout("timed out", request=request)
+
+    gateway = _ollama(handler)
+    with pytest.raises(LLMBackendError, match="超时"):
+        _run(gateway, gateway.complete("hi", backend="ollama", timeout=0.1))
+    metrics = gateway.backends["ollama"].metrics()
+    assert len(calls) == 1
+    assert metrics["timeouts"] == 1
+    assert metrics["in_flight"] == 0
+
+def _collect(gateway: LLMGateway, **kwargs):
+    async def collect():
+        return [chunk async for chunk in gateway.stream("hi", **kwargs)]
+    return _run(gateway, collect())
+
+def test_openai_stream_yields_chunks_and_usage():
+    def handler(request):
+        assert json.loads(request.content)["stream"] is True
+        lines = [
+            'data: {"choices": [{"delta": {"content": "Hel"}}]}',
+            'data: {"choices": [{"delta": {"content": "lo"}}]}',
+            "data: [DONE]",
+        ]
+        return httpx.Response(200, content="\n\n".join(lines).encode())
+
+    gateway = LLMGateway(transports={"openai": httpx.MockTransport(handler)})
+    chunks = _collect(gateway, backend="openai")
+
+    assert [chunk["text"] for chunk in chunks if "text" in chunk] == ["Hel", "lo"]
+    assert chunks[-1] == {"done": True, "prompt_tokens": 0, "completion_tokens": 2}
+
+def test_ollama_stream_retries_before_first_line():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            return httpx.Response(502)
+        lines = [
+            json.dumps({"response": "a"}),
+            json.dumps({"response": "b", "done": True, "prompt_eval_count": 2, "eval_count": 2}),
+        ]
+        return httpx.Response(200, content="\n".join(lines).encode())
+
+    gateway = _ollama(handler)
+    chunks = _collect(gateway, backend="ollama")
+
+    assert [chunk.get("text") for chunk in chunks] == ["a", "b", None]
+    assert chunks[-1]["completion_tokens"] == 2
+    assert len(calls) == 2
+
+def test_stream_failure_after_output_is_not_retried():
+    calls = []
+
+    class BrokenStream(httpx.AsyncByteStream):
+        async def __aiter__(self):
+            yield b'{"response": "partial"}\n'
+            raise httpx.ReadError("connection reset")
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(200, stream=BrokenStream())
+
+    gateway = _ollama(handler)
+    received = []
+
+    async def consume():
+        async for chunk in gateway.stream("hi", backend="ollama"):
+            received.append(chunk)
+
+    with pytest.raises(LLMBackendError):
+        _run(gateway, consume())
+    assert received == [{"text": "partial"}]
+    assert len(calls) == 1
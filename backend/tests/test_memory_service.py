@@ -0,0 +1,95 @@
+"""
+Agent 记忆服务测试
+"""
+
+import asyncio
+
+import pytest
+
+from database import engine
+from models import Base
+from services.memory_service import AgentMemoryService
+
+MEMORY_CONFIG = {"enabled": True, "strategy": "window", "window_turns": 2, "recall_k": 3}
+
+class FakeCollection:
+    """按 ChromaDB 的 where 语义（等值条件和 $and）过滤的内存集合"""
+
+    def __init__(self):
+        self.items = []
+
+    def add(self, ids, documents, embeddings, metadatas):
+        self.items.extend(zip(documents, metadatas))
+
+    @staticmethod
+    def _match(metadata, where):
+        if "$and" in where:
+            return all(FakeCollection._match(metadata, clause) for clause in where["$and"])
+        return all(metadata.get(key) == value for key, value in where.items())
+
+    def query(self, query_embeddings, n_results, where, include):
+        matched = [(document, metadata) for document, metadata in self.items if self._match(metadata, where)]
+        matched = matched[:n_results]
+        return {
+            "documents": [[document for document, _ in matched]],
+            "metadatas": [[metadata for _, metadata in matched]],
+        }
+
+class FakeKnowledge:
+    def __init__(self):
+        self.collection = FakeCollection()
+        self.chroma_client = self
+
+    def get_or_create_collection(self, name):
+        return self.collection
+
+    async def embed(self, texts):
+        return [[float(len(text))] for text in texts]
+
+@pytest.fixture
+def memory():
+    Base.metadata.create_all(engine)
+    service = AgentMemoryService()
+    service._knowledge = FakeKnowledge()
+    yield service
+    Base.metadata.drop_all(engine)
+
+async def _converse(memory, session_id, rounds):
+    for question, answer in rounds:
+        await memory.remember("agent_1", session_id, question, answer, MEMORY_CONFIG)
+
+def test_recall_finds_older_turns_of_same_session(memory):
+    async def run():
+        await _converse(memory, "project-a:s1", [
+            ("项目代号是什么", "项目代号是 aurora"),
+            ("第二个问题", "第二个回答"),
+            ("第三个问题", "第三个回答"),
+        ])
+        return await memory.build_context("agent_1", "project-a:s1", "项目代号", MEMORY_CONFIG)
+
+    context = asyncio.run(run())
+    assert "相关历史" in context
+    assert "aurora" in context
+
+def test_sessions_do_not_recall_each_others_turns(memory):
+    async def run():
+        # 两个会话使用相同的 agent_id（复制的画布会重复使用节点 ID）
+        await _converse(memory, "project-a:s1", [
+            ("项目代号是什么", "项目代号是 aurora"),
+            ("第二个问题", "第二个回答"),
+        ])
+        await _converse(memory, "project-b:s1", [
+            ("你好", "你好，有什么可以帮你"),
+            ("今天天气", "晴"),
+            ("明天天气", "多云"),
+        ])
+        return (
+            await memory.build_context("agent_1", "project-b:s1", "项目代号", MEMORY_CONFIG),
+            await memory.build_context("agent_1", "project-a:s1", "天气", MEMORY_CONFIG),
+        )
+
+    context_b, context_a = asyncio.run(run())
+    assert "aurora" not in context_b
+    assert "项目代号" not in context_b
+    assert "天气" not in context_a
+    assert "多云" not in context_a
@@ -0,0 +1,40 @@
+import os
+import subprocess
+import sys
+
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from sqlalchemy import create_engine
+
+from models import Base
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def alembic(url, *args):
+    env = dict(os.environ, DATABASE_URL=url, PYTHONPATH=BACKEND_DIR)
+    subprocess.run(
+        [sys.executable, "-m", "alembic", *args],
+        cwd=BACKEND_DIR, env=env, check=True, capture_output=True, timeout=60,
+    )
+
+def schema_diff(url):
+    engine = create_engine(url)
+    try:
+        with engine.connect() as conn:
+            return compare_metadata(MigrationContext.configure(conn), Base.metadata)
+    finally:
+        engine.dispose()
+
+def test_upgrade_head_creates_model_schema(tmp_path):
+    url = f"sqlite:///{tmp_path / 'migrated.db'}"
+    alembic(url, "upgrade", "head")
+    assert schema_diff(url) == []
+
+def test_upgrade_skips_tables_created_by_create_all(tmp_path):
+    url = f"sqlite:///{tmp_path / 'create_all.db'}"
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    engine.dispose()
+
+    alembic(url, "upgrade", "head")
+    assert schema_diff(url) == []
@@ -0,0 +1,30 @@
+import asyncio
+import os
+
+from services.node_cache import NodeResultCache
+
+def test_round_trip(tmp_path):
+    cache = NodeResultCache(cache_dir=str(tmp_path), max_bytes=1024 * 1024)
+
+    async def run():
+        await cache.set("k1", {"result": "ok"})
+        return await cache.get("k1"), await cache.get("missing")
+
+    assert asyncio.run(run()) == ({"result": "ok"}, None)
+
+def test_directory_scanned_only_when_estimate_exceeds_limit(tmp_path, monkeypatch):
+    cache = NodeResultCache(cache_dir=str(tmp_path), max_bytes=1000)
+    scans = []
+    evict = cache._evict
+    monkeypatch.setattr(cache, "_evict", lambda: scans.append(1) or evict())
+
+    async def run():
+        for i in range(30):
+            await cache.set(f"k{i}", {"value": "x" * 80})
+
+    asyncio.run(run())
+
+    total = sum(os.path.getsize(tmp_path / name) for name in os.listdir(tmp_path))
+    assert total <= 1000
+    # 首次写入扫描一次建立估算，之后只在估算超过上限时扫描
+    assert 1 < len(scans) < 30
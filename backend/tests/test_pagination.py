@@ -0,0 +1,127 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from api.canvas import get_project_canvases
+from api.projects import get_projects
+from database import AsyncSessionLocal, async_engine
+from models import AgentConfig, Base, Canvas, Project, User
+from services.auth_cache import UserPrincipal
+
+def run_with_db(test):
+    async def run():
+        async with async_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        try:
+            async with AsyncSessionLocal() as db:
+                return await test(db)
+        finally:
+            await async_engine.dispose()
+
+    return asyncio.run(run())
+
+async def create_owner(db, user_id, projects=0):
+    db.add(User(id=user_id, username=user_id, email=f"{user_id}@example.com", hashed_password="x"))
+    db.add_all(Project(id=f"{user_id}-p{index}", name=f"p{index}", owner_id=user_id) for index in range(projects))
+    await db.commit()
+    return UserPrincipal(user_id, user_id)
+
+async def collect_pages(list_page, limit):
+    """按 X-Next-Cursor 翻页，返回每页的 ID"""
+    pages, after = [], None
+    while True:
+        response = await list_page(after=after, limit=limit, if_none_match=None)
+        pages.append([item["id"] for item in json.loads(response.body)])
+        after = response.headers.get("X-Next-Cursor")
+        if after is None:
+            return pages
+
+def test_project_pages_cover_every_project_once():
+    async def test(db):
+        owner = await create_owner(db, "page-owner", projects=5)
+        return await collect_pages(
+            lambda **kwargs: get_projects(current_user=owner, db=db, **kwargs), limit=2
+        )
+
+    pages = run_with_db(test)
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert sorted(sum(pages, [])) == [f"page-owner-p{index}" for index in range(5)]
+
+def test_unknown_or_foreign_cursor_is_rejected():
+    async def test(db):
+        owner = await create_owner(db, "cursor-owner", projects=2)
+        await create_owner(db, "cursor-other", projects=1)
+        db.add_all([
+            Canvas(id="cursor-own-canvas", project_id="cursor-owner-p0", name="c"),
+            Canvas(id="cursor-sibling-canvas", project_id="cursor-owner-p1", name="c"),
+        ])
+        await db.commit()
+
+        errors = []
+        for after in ("missing", "cursor-other-p0"):
+            with pytest.raises(HTTPException) as rejected:
+                await get_projects(after=after, limit=None, if_none_match=None, current_user=owner, db=db)
+            errors.append(rejected.value.status_code)
+        # 同一用户另一个项目中的画布也不能作为游标
+        with pytest.raises(HTTPException) as rejected:
+            await get_project_canvases(
+                "cursor-owner-p0", after="cursor-sibling-canvas", limit=None, if_none_match=None,
+                current_user=owner, db=db
+            )
+        errors.append(rejected.value.status_code)
+        valid = await get_project_canvases(
+            "cursor-owner-p0", after="cursor-own-canvas", limit=None, if_none_match=None,
+            current_user=owner, db=db
+        )
+        return errors, json.loads(valid.body)
+
+    errors, valid_page = run_with_db(test)
+    assert errors == [400, 400, 400]
+    assert valid_page == []
+
+def test_project_list_returns_304_until_it_changes():
+    async def test(db):
+        owner = await create_owner(db, "etag-owner", projects=2)
+        first = await get_projects(after=None, limit=None, if_none_match=None, current_user=owner, db=db)
+        etag = first.headers["ETag"]
+        cached = await get_projects(after=None, limit=None, if_none_match=f"W/{etag}", current_user=owner, db=db)
+
+        db.add(Project(id="etag-owner-new", name="new", owner_id=owner.id))
+        await db.commit()
+        changed = await get_projects(after=None, limit=None, if_none_match=etag, current_user=owner, db=db)
+        return first, cached, changed
+
+    first, cached, changed = run_with_db(test)
+    assert first.status_code == 200
+    assert cached.status_code == 304
+    assert cached.body == b""
+    assert cached.headers["ETag"] == first.headers["ETag"]
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != first.headers["ETag"]
+    assert len(json.loads(changed.body)) == 3
+
+def test_agent_config_pages_and_etag():
+    agents = pytest.importorskip("api.agents")
+
+    async def test(db):
+        owner = await create_owner(db, "agent-owner")
+        db.add_all(AgentConfig(id=f"agent-{index}", name=f"a{index}", agent_type="crewai") for index in range(3))
+        await db.commit()
+
+        async def list_page(**kwargs):
+            return await agents.get_agent_configs(current_user=owner, db=db, **kwargs)
+
+        pages = await collect_pages(list_page, limit=2)
+        first = await list_page(after=None, limit=2, if_none_match=None)
+        cached = await list_page(after=None, limit=2, if_none_match=first.headers["ETag"])
+        with pytest.raises(HTTPException) as rejected:
+            await list_page(after="missing", limit=2, if_none_match=None)
+        return pages, cached.status_code, rejected.value.status_code
+
+    pages, cached_status, rejected_status = run_with_db(test)
+    assert sorted(sum(pages, [])) == ["agent-0", "agent-1", "agent-2"]
+    assert [len(page) for page in pages] == [2, 1]
+    assert cached_status == 304
+    assert rejected_status == 400
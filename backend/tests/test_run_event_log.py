@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+from sqlalchemy import select
+
+from database import AsyncSessionLocal, async_engine
+from models import Base, WorkflowRunEvent
+from services.run_event_log import RunEventLog
+
+class FailingSession:
+    """第一次写入失败、之后委托给真实会话"""
+
+    def __init__(self, db):
+        self.db = db
+        self.failures = 1
+        self.rollbacks = 0
+
+    async def execute(self, *args, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("database unavailable")
+        return await self.db.execute(*args, **kwargs)
+
+    async def commit(self):
+        await self.db.commit()
+
+    async def rollback(self):
+        self.rollbacks += 1
+        await self.db.rollback()
+
+def test_flush_failure_keeps_events_for_retry():
+    async def run():
+        async with async_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with AsyncSessionLocal() as db:
+            session = FailingSession(db)
+            event_log = RunEventLog(session, "run-flush-retry", batch_size=100)
+            await event_log.append("workflow_started")
+            await event_log.append("node_result", {"value": 1}, node_id="n1")
+
+            with pytest.raises(RuntimeError):
+                await event_log.flush()
+            assert session.rollbacks == 1
+
+            await event_log.append("workflow_finished")
+            await event_log.flush()
+            events = (await db.scalars(
+                select(WorkflowRunEvent.event_type)
+                .where(WorkflowRunEvent.run_id == "run-flush-retry")
+                .order_by(WorkflowRunEvent.id)
+            )).all()
+        await async_engine.dispose()
+        return events
+
+    assert asyncio.run(run()) == ["workflow_started", "node_result", "workflow_finished"]
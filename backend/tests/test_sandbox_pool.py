@@ -0,0 +1,81 @@
+import asyncio
+import multiprocessing
+import os
+import socket
+
+import pytest
+
+from config import settings
+from services import sandbox_pool as sandbox_module
+from services.sandbox_pool import SandboxError, SandboxPool
+
+ESCAPE = """
+import string
+f = string.Formatter().get_field('0.__class__.__base__.__subclasses__', [()], {})[0]
+print(f)
+"""
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = SandboxPool(workers=1, timeout=10)
+    yield pool
+    pool.shutdown()
+
+def _run(pool, code):
+    return asyncio.run(pool.run_python(code))
+
+def test_runs_allowed_code(pool):
+    code = "import math, random, decimal, json\nrandom.seed(1)\nprint(math.sqrt(16), decimal.Decimal('1.5'), json.dumps([1]))"
+    assert _run(pool, code) == "4.0 1.5 [1]\n"
+
+def test_string_formatter_escape_is_blocked(pool):
+    with pytest.raises(SandboxError, match="string"):
+        _run(pool, ESCAPE)
+
+@pytest.mark.parametrize("code", [
+    "print('{0.__class__.__base__.__subclasses__}'.format(()))",
+    "print('{x.__class__}'.format_map({'x': ()}))",
+    "f = ''.format\nprint(f)",
+])
+def test_str_format_attribute_lookup_is_blocked(pool, code):
+    with pytest.raises(SandboxError):
+        _run(pool, code)
+
+def test_proxy_hides_name_lookup_gadgets(monkeypatch):
+    monkeypatch.setattr(settings, "SANDBOX_ALLOWED_MODULES", ["string"])
+    proxy = sandbox_module._restricted_import("string")
+    assert not hasattr(proxy, "Formatter")
+    assert not hasattr(proxy, "Template")
+    assert proxy.ascii_letters
+
+def _probe_isolation(conn):
+    """在完成隔离的子进程中尝试访问文件、网络和环境变量"""
+    conn = sandbox_module._init_worker(conn, 0)
+    results = {"environ": dict(os.environ)}
+    for name, attempt in (
+        ("read", lambda: open("/etc/hostname").close()),
+        ("write", lambda: open("/tmp/sandbox-probe", "w").write("x")),
+        ("socket", lambda: socket.socket().close()),
+    ):
+        try:
+            attempt()
+            results[name] = "allowed"
+        except OSError as e:
+            results[name] = type(e).__name__
+    conn.send(results)
+
+def test_worker_is_isolated_by_os_limits(monkeypatch):
+    monkeypatch.setenv("SANDBOX_PROBE_SECRET", "secret")
+    context = multiprocessing.get_context("forkserver")
+    parent, child = context.Pipe()
+    process = context.Process(target=_probe_isolation, args=(child,))
+    process.start()
+    child.close()
+    assert parent.poll(30)
+    results = parent.recv()
+    process.join(5)
+
+    assert results["environ"] == {}
+    assert results["read"] != "allowed"
+    assert results["write"] != "allowed"
+    assert results["socket"] != "allowed"
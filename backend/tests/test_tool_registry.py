@@ -0,0 +1,44 @@
+import asyncio
+import threading
+
+import pytest
+
+tool_registry = pytest.importorskip("services.tool_registry")
+
+class FakeTool:
+    description = "fake tool"
+
+class ToolDefinition:
+    def __init__(self, name, config):
+        self.name = name
+        self.config = config
+
+@pytest.mark.parametrize("size", [0, -1, 1.5, True, "2"])
+def test_pool_size_must_be_positive_integer(size):
+    with pytest.raises(ValueError):
+        tool_registry.ToolPool("fake", FakeTool, size)
+
+def test_register_rejects_invalid_pool_size():
+    registry = tool_registry.ToolRegistry()
+    assert not registry.register(ToolDefinition("python-small", {"builtin": "python", "pool_size": 0}))
+    assert "python-small" not in registry.pools
+    assert registry.register(ToolDefinition("python-small", {"builtin": "python", "pool_size": 1}))
+
+def test_get_builds_first_instance_off_the_event_loop():
+    created_on = []
+
+    def factory():
+        created_on.append(threading.get_ident())
+        return FakeTool()
+
+    async def run():
+        registry = tool_registry.ToolRegistry()
+        registry.pools["fake"] = tool_registry.ToolPool("fake", factory, 1)
+        first = await registry.get("fake")
+        second = await registry.get("fake")
+        return threading.get_ident(), first, second
+
+    loop_thread, first, second = asyncio.run(run())
+    assert len(created_on) == 1
+    assert created_on[0] != loop_thread
+    assert first.description == second.description == "fake tool"
@@ -0,0 +1,36 @@
+import asyncio
+
+from services.websocket_manager import ConnectionManager, execution_channel
+
+class FakeSocket:
+    def __init__(self, broken: bool = False):
+        self.broken = broken
+        self.sent = []
+
+    async def send_json(self, message):
+        if self.broken:
+            raise RuntimeError("connection closed")
+        self.sent.append(message)
+
+def test_publish_reaches_every_subscriber_and_drops_broken_ones():
+    manager = ConnectionManager()
+    channel = execution_channel("canvas-1", "workflow-1")
+    first, second, broken = FakeSocket(), FakeSocket(), FakeSocket(broken=True)
+    for socket in (first, second, broken):
+        manager.subscribe(channel, socket)
+
+    delivered = asyncio.run(manager.publish(channel, {"type": "status_update"}))
+
+    assert delivered == 2
+    assert first.sent == second.sent == [{"type": "status_update"}]
+    assert broken not in manager.channels[channel]
+
+def test_unsubscribe_removes_empty_channel():
+    manager = ConnectionManager()
+    channel = execution_channel("canvas-1", "workflow-1")
+    socket = FakeSocket()
+    manager.subscribe(channel, socket)
+    manager.unsubscribe(channel, socket)
+
+    assert channel not in manager.channels
+    assert asyncio.run(manager.publish(channel, {"type": "token"})) == 0
@@ -0,0 +1,94 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError, PendingRollbackError
+
+from database import async_engine, get_async_db, pool_metrics
+from models import Base, Canvas, Project, User, WorkflowRun, WorkflowRunEvent
+
+async def create_run(db, run_id):
+    db.add_all([
+        User(id=f"{run_id}-user", username=run_id, email=f"{run_id}@example.com", hashed_password="x"),
+        Project(id=f"{run_id}-project", name="p", owner_id=f"{run_id}-user"),
+        Canvas(id=f"{run_id}-canvas", project_id=f"{run_id}-project", name="c",
+               canvas_data={"nodes": [{"id": "n1", "type": "input"}], "edges": []}),
+        WorkflowRun(id=run_id, project_id=f"{run_id}-project", canvas_id=f"{run_id}-canvas",
+                    input_data={"workflow_id": "wf"}, status="running", started_at=datetime.now()),
+    ])
+    await db.commit()
+    return await db.get(WorkflowRun, run_id)
+
+async def stored_run(run_id):
+    async for db in get_async_db():
+        run = await db.get(WorkflowRun, run_id)
+        events = (await db.scalars(
+            select(WorkflowRunEvent.event_type).where(WorkflowRunEvent.run_id == run_id).order_by(WorkflowRunEvent.id)
+        )).all()
+        return run.status, run.error_message, events
+
+def fail_flush(db):
+    """写入违反 NOT NULL 约束的行，使会话事务进入必须回滚的状态"""
+    db.add(WorkflowRunEvent(run_id=None, event_type="broken"))
+    return db.flush()
+
+def test_async_session_records_failure_only_after_rollback():
+    async def run():
+        async with async_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        try:
+            checkouts = pool_metrics()["checkouts"]
+            async for db in get_async_db():
+                workflow_run = await create_run(db, "run-session-rollback")
+                # 回滚会使执行记录过期，之后用到的字段先取出
+                run_id = workflow_run.id
+                with pytest.raises(IntegrityError):
+                    await fail_flush(db)
+                with pytest.raises(PendingRollbackError):
+                    await db.commit()
+
+                await db.rollback()
+                workflow_run.status = "failed"
+                workflow_run.error_message = "database unavailable"
+                db.add(WorkflowRunEvent(run_id=run_id, event_type="error"))
+                await db.commit()
+            metrics = pool_metrics()
+            return metrics["checkouts"] > checkouts, metrics["checked_out"], await stored_run("run-session-rollback")
+        finally:
+            await async_engine.dispose()
+
+    checked_out_from_pool, still_checked_out, stored = asyncio.run(run())
+    assert checked_out_from_pool
+    assert still_checked_out == 0
+    assert stored == ("failed", "database unavailable", ["error"])
+
+def test_failed_run_is_rolled_back_and_recorded_as_failed():
+    workflow_service = pytest.importorskip("services.workflow_service")
+
+    async def run():
+        async with async_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        try:
+            service = workflow_service.WorkflowService()
+
+            async def broken_workflow(canvas_data, event_log):
+                await fail_flush(event_log.db)
+
+            service._execute_simple_workflow = broken_workflow
+            async for db in get_async_db():
+                workflow_run = await create_run(db, "run-service-rollback")
+                result = await service._run_workflow(
+                    "wf", workflow_run, workflow_service.RunCheckpoint(workflow_run.id), db
+                )
+            return result, service.active_workflows, await stored_run("run-service-rollback")
+        finally:
+            await async_engine.dispose()
+
+    result, active, (status, error_message, events) = asyncio.run(run())
+    assert result["status"] == "failed"
+    assert result["run_id"] == "run-service-rollback"
+    assert active == {}
+    assert status == "failed"
+    assert "NOT NULL" in error_message
+    assert events[-1] == "error"
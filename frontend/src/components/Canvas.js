@@ -7,6 +7,7 @@ import ReactFlow, {
   useEdgesState,
   addEdge,
   useReactFlow,
+  useStore,
 } from 'reactflow';
 import 'reactflow/dist/style.css';
 
@@ -21,8 +22,37 @@ const nodeTypes = {
   tool: ToolNode,
 };
 
+// 光标位置最多每 50ms 发送一次
+const CURSOR_INTERVAL = 50;
+
+// 其他协作者的光标，位置为画布坐标，按当前视口换算到屏幕
+const RemoteCursors = ({ participants }) => {
+  const [x, y, zoom] = useStore((state) => state.transform);
+  return Object.values(participants)
+    .filter((participant) => participant.cursor?.x != null)
+    .map((participant) => (
+      <div
+        key={participant.client_id}
+        className="absolute pointer-events-none z-10 flex items-center gap-1"
+        style={{
+          left: participant.cursor.x * zoom + x,
+          top: participant.cursor.y * zoom + y,
+        }}
+      >
+        <div className="w-2 h-2 rounded-full" style={{ backgroundColor: participant.color }} />
+        <span
+          className="text-xs text-white px-1 rounded"
+          style={{ backgroundColor: participant.color }}
+        >
+          {participant.username}
+        </span>
+      </div>
+    ));
+};
+
 const Canvas = ({ canvasId, readonly = false }) => {
   const reactFlowWrapper = useRef(null);
+  const lastCursorAt = useRef(0);
   const { project } = useReactFlow();
   
   const {
@@ -35,6 +65,10 @@ const Canvas = ({ canvasId, readonly = false }) => {
     addNode,
     deleteNode,
     updateNodeData,
+    joinCollab,
+    leaveCollab,
+    sendCursor,
+    participants,
   } = useCanvasStore();
   
   const [localNodes, setLocalNodes, onNodesChange] = useNodesState(nodes);
@@ -70,6 +104,27 @@ const Canvas = ({ canvasId, readonly = false }) => {
     }
   }, [canvasId, loadCanvas]);
   
+  // 加入画布的协同编辑
+  useEffect(() => {
+    if (canvasId && !readonly) {
+      joinCollab(canvasId);
+      return () => leaveCollab();
+    }
+  }, [canvasId, readonly, joinCollab, leaveCollab]);
+  
+  const onMouseMove = useCallback(
+    (event) => {
+      const now = Date.now();
+      if (now - lastCursorAt.current < CURSOR_INTERVAL) {
+        return;
+      }
+      lastCursorAt.current = now;
+      const bounds = reactFlowWrapper.current.getBoundingClientRect();
+      sendCursor(project({ x: event.clientX - bounds.left, y: event.clientY - bounds.top }));
+    },
+    [project, sendCursor]
+  );
+  
   // 连接处理
   const onConnect = useCallback(
     (params) => {
@@ -172,7 +227,7 @@ const Canvas = ({ canvasId, readonly = false }) => {
   }, [onKeyDown]);
   
   return (
-    <div className="w-full h-full bg-gray-50" ref={reactFlowWrapper}>
+    <div className="relative w-full h-full bg-gray-50" ref={reactFlowWrapper} onMouseMove={onMouseMove}>
       <ReactFlow
         nodes={localNodes}
         edges={localEdges}
@@ -205,6 +260,7 @@ const Canvas = ({ canvasId, readonly = false }) => {
           }}
           className="bg-white border border-gray-200 rounded-lg"
         />
+        <RemoteCursors participants={participants} />
       </ReactFlow>
     </div>
   );
@@ -8,6 +8,8 @@ const ExecutionPanel = ({ canvasId, canvasData }) => {
   const [executionHistory, setExecutionHistory] = useState([]);
   const [currentExecution, setCurrentExecution] = useState(null);
   const [executionLogs, setExecutionLogs] = useState([]);
+  const [streamOutputs, setStreamOutputs] = useState({});
+  const [nodeTtft, setNodeTtft] = useState({});
   
   // 加载执行历史
   useEffect(() => {
@@ -16,16 +18,28 @@ const ExecutionPanel = ({ canvasId, canvasData }) => {
     }
   }, [canvasId]);
   
-  // WebSocket 连接用于实时日志
+  // WebSocket 连接用于实时日志和 token 流（按 workflow_id 订阅，执行开始前即可连接）
+  const workflowId = currentExecution?.workflow_id;
   useEffect(() => {
-    if (currentExecution) {
-      const ws = new WebSocket(`ws://localhost:8000/ws/execution_${currentExecution.run_id}`);
+    if (workflowId) {
+      // 令牌不放在 URL 中，连接后通过第一条消息认证（只有画布所有者可以订阅）
+      const ws = new WebSocket(`${api.defaults.baseURL.replace(/^http/, 'ws')}/canvas/${canvasId}/execution/${workflowId}`);
+      ws.onopen = () => {
+        ws.send(JSON.stringify({ type: 'auth', token: localStorage.getItem('token') || '' }));
+      };
       
       ws.onmessage = (event) => {
         const data = JSON.parse(event.data);
         
         if (data.type === 'log') {
           setExecutionLogs(logs => [...logs, data]);
+        } else if (data.type === 'token') {
+          setStreamOutputs(outputs => ({
+            ...outputs,
+            [data.node_id]: (outputs[data.node_id] || '') + data.text
+          }));
+        } else if (data.type === 'ttft') {
+          setNodeTtft(ttft => ({ ...ttft, [data.node_id]: data.ttft_ms }));
         } else if (data.type === 'status_update') {
           setCurrentExecution(exec => ({
             ...exec,
@@ -41,7 +55,7 @@ const ExecutionPanel = ({ canvasId, canvasData }) => {
       
       return () => ws.close();
     }
-  }, [currentExecution]);
+  }, [canvasId, workflowId]);
   
   const loadExecutionHistory = async () => {
     try {
@@ -60,21 +74,29 @@ const ExecutionPanel = ({ canvasId, canvasData }) => {
     
     setIsExecuting(true);
     setExecutionLogs([]);
+    setStreamOutputs({});
+    setNodeTtft({});
+    
+    // 先订阅执行通道，再发起执行，以便接收执行过程中的 token 流
+    const newWorkflowId = `workflow_${Date.now()}`;
+    setCurrentExecution({
+      workflow_id: newWorkflowId,
+      status: 'running',
+      started_at: new Date().toISOString()
+    });
+    toast.success('工作流开始执行');
     
     try {
       const response = await api.post('/workflow/execute', {
         canvas_id: canvasId,
         canvas_data: canvasData,
-        workflow_id: `workflow_${Date.now()}`
+        workflow_id: newWorkflowId
       });
       
-      setCurrentExecution({
-        run_id: response.data.run_id,
-        status: 'running',
-        started_at: new Date().toISOString()
-      });
-      
-      toast.success('工作流开始执行');
+      setCurrentExecution(exec => ({
+        ...exec,
+        run_id: response.data.result?.run_id
+      }));
     } catch (error) {
       setIsExecuting(false);
       toast.error('执行失败: ' + (error.response?.data?.error || error.message));
@@ -196,7 +218,16 @@ const ExecutionPanel = ({ canvasId, canvasData }) => {
                   <span className="text-gray-500">[{formatTime(log.timestamp)}]</span> {log.message}
                 </div>
               ))}
-              {executionLogs.length === 0 && (
+              {Object.entries(streamOutputs).map(([nodeId, text]) => (
+                <div key={nodeId} className="mb-1 whitespace-pre-wrap">
+                  <span className="text-blue-400">[{nodeId}]</span>
+                  {nodeTtft[nodeId] !== undefined && (
+                    <span className="text-gray-500"> (首 token {nodeTtft[nodeId]}ms)</span>
+                  )}{' '}
+                  {text}
+                </div>
+              ))}
+              {executionLogs.length === 0 && Object.keys(streamOutputs).length === 0 && (
                 <div className="text-gray-500">等待日志输出...</div>
               )}
             </div>
@@ -72,6 +72,13 @@ const apiMethods = {
     create: (data) => api.post('/canvas', data),
     update: (id, data) => api.put(`/canvas/${id}`, data),
     save: (id, data) => api.post(`/canvas/${id}/save`, data),
+    patch: (id, baseVersion, patch) => api.patch(`/canvas/${id}`, { base_version: baseVersion, patch }),
+    listVersions: (id, params) => api.get(`/canvas/${id}/versions`, { params }),
+    getVersion: (id, version) => api.get(`/canvas/${id}/versions/${version}`),
+    diff: (id, fromVersion, toVersion) => api.get(`/canvas/${id}/diff`, {
+      params: { from_version: fromVersion, to_version: toVersion },
+    }),
+    restoreVersion: (id, version) => api.post(`/canvas/${id}/versions/${version}/restore`),
     delete: (id) => api.delete(`/canvas/${id}`),
   },
   
@@ -107,8 +114,9 @@ const apiMethods = {
   // 工作流执行
   workflow: {
     execute: (data) => api.post('/workflow/execute', data),
-    getStatus: (runId) => api.get(`/workflow/status/${runId}`),
+    getStatus: (runId, params) => api.get(`/workflow/status/${runId}`, { params }),
     cancel: (runId) => api.post(`/workflow/cancel/${runId}`),
+    resume: (runId) => api.post(`/workflow/resume/${runId}`),
     listRuns: (params) => api.get('/workflow/runs', { params }),
   },
   
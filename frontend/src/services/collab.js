@@ -0,0 +1,101 @@
+// 画布协同编辑连接（后端 /canvas/{id}/collab）
+const API_URL = process.env.REACT_APP_API_URL || 'http://localhost:8000/api/v1';
+
+// 令牌不放在 URL 中（会写入服务端访问日志），连接后通过第一条消息发送
+const collabUrl = (canvasId) => `${API_URL.replace(/^http/, 'ws')}/canvas/${canvasId}/collab`;
+
+// 按 ID 应用节点和边操作（与后端 services/canvas_patch.py 一致），无法应用的操作直接跳过
+export const applyEntityOps = (doc, ops) => {
+  let nodes = doc.nodes || [];
+  let edges = doc.edges || [];
+  ops.forEach((operation) => {
+    const isNode = operation.op.endsWith('_node');
+    let items = isNode ? nodes : edges;
+    if (operation.op.startsWith('add_')) {
+      const item = isNode ? operation.node : operation.edge;
+      if (!items.some((existing) => existing.id === item.id)) {
+        items = [...items, item];
+      }
+    } else if (operation.op.startsWith('update_')) {
+      items = items.map((item) => {
+        if (item.id !== operation.id) {
+          return item;
+        }
+        const updated = { ...item, ...(operation.set || {}) };
+        (operation.unset || []).forEach((key) => delete updated[key]);
+        return updated;
+      });
+    } else if (operation.op.startsWith('remove_')) {
+      items = items.filter((item) => item.id !== operation.id);
+      if (isNode) {
+        edges = edges.filter((edge) => typeof edge !== 'object' || edge === null
+          || (edge.source !== operation.id && edge.target !== operation.id));
+      }
+    }
+    if (isNode) {
+      nodes = items;
+    } else {
+      edges = items;
+    }
+  });
+  return { ...doc, nodes, edges };
+};
+
+// 建立协同连接，断线后按指数退避重连；handlers.onMessage 接收服务端消息
+export const connectCollab = (canvasId, handlers = {}) => {
+  let socket = null;
+  let closed = false;
+  let retry = 0;
+  let clientSeq = 0;
+  // 认证通过（收到第一份快照）之后才能发送操作
+  let ready = false;
+
+  const open = () => {
+    ready = false;
+    socket = new WebSocket(collabUrl(canvasId));
+    socket.onopen = () => {
+      socket.send(JSON.stringify({ type: 'auth', token: localStorage.getItem('token') || '' }));
+    };
+    socket.onmessage = (event) => {
+      const message = JSON.parse(event.data);
+      if (!ready && message.type === 'snapshot') {
+        ready = true;
+        retry = 0;
+        handlers.onOpen?.();
+      }
+      handlers.onMessage?.(message);
+    };
+    socket.onclose = (event) => {
+      ready = false;
+      handlers.onClose?.(event);
+      // 4401 / 4404：未登录或无权限，不再重连
+      if (closed || event.code === 4401 || event.code === 4404) {
+        return;
+      }
+      const delay = Math.min(1000 * 2 ** retry, 30000);
+      retry += 1;
+      setTimeout(() => !closed && open(), delay);
+    };
+  };
+
+  const send = (message) => {
+    if (ready && socket?.readyState === WebSocket.OPEN) {
+      socket.send(JSON.stringify(message));
+      return true;
+    }
+    return false;
+  };
+
+  open();
+
+  return {
+    isOpen: () => ready && socket?.readyState === WebSocket.OPEN,
+    sendOps: (patch) => send({ type: 'op', client_seq: ++clientSeq, patch }),
+    sendCursor: (cursor) => send({ type: 'cursor', ...cursor }),
+    sync: () => send({ type: 'sync' }),
+    close: () => {
+      closed = true;
+      socket?.close();
+    },
+  };
+};
@@ -1,8 +1,71 @@
 import { create } from 'zustand';
 import { devtools } from 'zustand/middleware';
 import api from '../services/api';
+import { applyEntityOps, connectCollab } from '../services/collab';
 import toast from 'react-hot-toast';
 
+// 计算单个节点或边的字段变更，返回 null 表示无变化
+const diffItem = (before, after) => {
+  const set = {};
+  const unset = [];
+  Object.keys(after).forEach((key) => {
+    if (key !== 'id' && JSON.stringify(before[key]) !== JSON.stringify(after[key])) {
+      set[key] = after[key];
+    }
+  });
+  Object.keys(before).forEach((key) => {
+    if (!(key in after)) {
+      unset.push(key);
+    }
+  });
+  if (Object.keys(set).length === 0 && unset.length === 0) {
+    return null;
+  }
+  return unset.length ? { set, unset } : { set };
+};
+
+const diffCollection = (before, after, kind) => {
+  const ops = { removed: [], added: [], updated: [] };
+  const beforeById = new Map(before.map((item) => [item.id, item]));
+  const afterIds = new Set(after.map((item) => item.id));
+
+  before.forEach((item) => {
+    if (!afterIds.has(item.id)) {
+      ops.removed.push({ op: `remove_${kind}`, id: item.id });
+    }
+  });
+  after.forEach((item) => {
+    const previous = beforeById.get(item.id);
+    if (!previous) {
+      ops.added.push({ op: `add_${kind}`, [kind]: item });
+      return;
+    }
+    const changes = diffItem(previous, item);
+    if (changes) {
+      ops.updated.push({ op: `update_${kind}`, id: item.id, ...changes });
+    }
+  });
+  return ops;
+};
+
+// 计算从上次保存到当前画布的按 ID 增量操作（格式见后端 services/canvas_patch.py）
+export const diffCanvas = (saved, current) => {
+  const nodes = diffCollection(saved.nodes || [], current.nodes || [], 'node');
+  const edges = diffCollection(saved.edges || [], current.edges || [], 'edge');
+  // 先处理边的删除和修改，再删节点（删节点会连带删除仍指向它的边），最后新增
+  return [
+    ...edges.removed,
+    ...edges.updated,
+    ...nodes.removed,
+    ...nodes.added,
+    ...nodes.updated,
+    ...edges.added,
+  ];
+};
+
+// 串行化保存请求，避免两次自动保存基于同一版本而互相冲突
+let saveQueue = Promise.resolve();
+
 const useCanvasStore = create(
   devtools(
     (set, get) => ({
@@ -14,6 +77,11 @@ const useCanvasStore = create(
       canvasData: null,
       isLoading: false,
       isSaving: false,
+      version: null,  // 服务端画布版本，增量保存的基准
+      savedSnapshot: null,  // 上次成功保存的节点和边
+      collab: null,  // 协同编辑连接，连接时编辑通过它发送而不是 REST 保存
+      clientId: null,
+      participants: {},  // 其他协同参与者，按 client_id 索引，含光标位置
       
       // 画布操作
       setNodes: (nodes) => set({ nodes }),
@@ -66,10 +134,14 @@ const useCanvasStore = create(
           const response = await api.canvas.get(canvasId);
           const canvasData = response.data;
           
+          const nodes = canvasData.canvas_data?.nodes || [];
+          const edges = canvasData.canvas_data?.edges || [];
           set({
-            nodes: canvasData.canvas_data?.nodes || [],
-            edges: canvasData.canvas_data?.edges || [],
+            nodes,
+            edges,
             canvasData,
+            version: canvasData.version,
+            savedSnapshot: { nodes, edges },
             isLoading: false
           });
           
@@ -81,22 +153,159 @@ const useCanvasStore = create(
         }
       },
       
-      saveCanvas: async (canvasId, data = null) => {
-        const { nodes, edges } = get();
-        const canvasData = data || { nodes, edges };
+      saveCanvas: (canvasId, data = null) => {
+        const run = async () => {
+          const { nodes, edges, version, savedSnapshot, collab } = get();
+          const canvasData = data || { nodes, edges };
+          
+          if (collab?.isOpen() && savedSnapshot) {
+            // 协同模式：操作由服务端排序广播并批量持久化
+            const patch = diffCanvas(savedSnapshot, canvasData);
+            if (patch.length > 0 && collab.sendOps(patch)) {
+              set({ savedSnapshot: canvasData });
+            }
+            return true;
+          }
+          
+          set({ isSaving: true });
+          try {
+            let response;
+            if (version !== null && savedSnapshot) {
+              // 只发送自上次保存以来的变更
+              const patch = diffCanvas(savedSnapshot, canvasData);
+              if (patch.length === 0) {
+                set({ isSaving: false });
+                return true;
+              }
+              response = await api.canvas.patch(canvasId, version, patch);
+            } else {
+              response = await api.canvas.save(canvasId, canvasData);
+            }
+            set({
+              isSaving: false,
+              version: response.data.version,
+              savedSnapshot: canvasData
+            });
+            return true;
+          } catch (error) {
+            set({ isSaving: false });
+            if (error.response?.status === 409) {
+              toast.error('画布已在其他页面被修改，请重新加载');
+            } else {
+              toast.error('保存画布失败');
+            }
+            throw error;
+          }
+        };
         
-        set({ isSaving: true });
+        const result = saveQueue.then(run, run);
+        saveQueue = result.catch(() => {});
+        return result;
+      },
+      
+      restoreVersion: async (canvasId, version) => {
         try {
-          await api.canvas.save(canvasId, canvasData);
-          set({ isSaving: false });
+          await saveQueue;
+          await api.canvas.restoreVersion(canvasId, version);
+          await get().loadCanvas(canvasId);
+          toast.success(`已恢复到版本 ${version}`);
           return true;
         } catch (error) {
-          set({ isSaving: false });
-          toast.error('保存画布失败');
+          toast.error('恢复版本失败');
           throw error;
         }
       },
       
+      // 协同编辑
+      joinCollab: (canvasId) => {
+        get().leaveCollab();
+        const collab = connectCollab(canvasId, {
+          onMessage: (message) => get().handleCollabMessage(message),
+          onClose: () => set({ participants: {} }),
+        });
+        set({ collab });
+      },
+      
+      leaveCollab: () => {
+        const { collab } = get();
+        if (collab) {
+          collab.close();
+          set({ collab: null, clientId: null, participants: {} });
+        }
+      },
+      
+      sendCursor: (cursor) => {
+        get().collab?.sendCursor(cursor);
+      },
+      
+      handleCollabMessage: (message) => {
+        const { clientId, collab } = get();
+        switch (message.type) {
+          case 'snapshot': {
+            // 加入、重新同步或画布在房间外被修改时，以服务端文档为准
+            const ownId = message.client_id || clientId;
+            const nodes = message.canvas_data?.nodes || [];
+            const edges = message.canvas_data?.edges || [];
+            const participants = {};
+            (message.participants || []).forEach((participant) => {
+              if (participant.client_id !== ownId) {
+                participants[participant.client_id] = participant;
+              }
+            });
+            set({
+              nodes,
+              edges,
+              version: message.version,
+              savedSnapshot: { nodes, edges },
+              clientId: ownId,
+              participants
+            });
+            break;
+          }
+          case 'op':
+            // 自己的操作在发送时已计入 savedSnapshot
+            if (message.client_id !== clientId) {
+              set((state) => ({
+                ...applyEntityOps({ nodes: state.nodes, edges: state.edges }, message.patch),
+                savedSnapshot: applyEntityOps(state.savedSnapshot || { nodes: [], edges: [] }, message.patch)
+              }));
+            }
+            break;
+          case 'op_rejected':
+            toast.error('编辑与其他协作者冲突，已重新同步');
+            collab?.sync();
+            break;
+          case 'saved':
+            set({ version: message.version });
+            break;
+          case 'join':
+            set((state) => ({
+              participants: { ...state.participants, [message.client_id]: message }
+            }));
+            break;
+          case 'leave':
+            set((state) => {
+              const { [message.client_id]: _, ...participants } = state.participants;
+              return { participants };
+            });
+            break;
+          case 'cursor':
+            set((state) => {
+              const participant = state.participants[message.client_id];
+              if (!participant) {
+                return {};
+              }
+              const cursor = { x: message.x, y: message.y, selection: message.selection };
+              return {
+                participants: { ...state.participants, [message.client_id]: { ...participant, cursor } }
+              };
+            });
+            break;
+          default:
+            break;
+        }
+      },
+      
       createCanvas: async (projectId, name, description = '') => {
         set({ isLoading: true });
         try {
@@ -111,7 +320,9 @@ const useCanvasStore = create(
             isLoading: false,
             nodes: [],
             edges: [],
-            canvasData: response.data
+            canvasData: response.data,
+            version: 1,
+            savedSnapshot: { nodes: [], edges: [] }
           });
           
           toast.success('画布创建成功');
@@ -136,7 +347,9 @@ const useCanvasStore = create(
         edges: [],
         selectedNodes: [],
         selectedEdges: [],
-        canvasData: null
+        canvasData: null,
+        version: null,
+        savedSnapshot: null
       }),
       
       // 导入导出